@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+"""
+Generator of synthetic GAMESS EDS logs for benchmarks
+
+The logs follow the layout read by geds.py: the preamble with the
+'THERE ARE n SUBSYSTEMS IN A k-BODY COMPLEX' table, interaction energy
+terms of all subsystems, many-body terms, total energies, optionally the
+FFEDS field grid and the electric properties. The output of each
+subsystem calculation (SCF iterations, orbitals) is imitated with filler
+lines so that the size of the logs is close to the real ones. The values
+are random but reproducible for a given seed.
+
+Usage: genlog.py [options] output file(s)
+
+Options:
+  -h, --help            show this help
+
+  -m, --monomers=       number of monomers, all their subsets are computed (2)
+
+  -n, --nbody=          largest subsets computed, as NBODY of EDS; the many-
+                        body terms go up to this order (all monomers)
+
+  -l, --level=          hf, mp2 or cc (mp2)
+
+  -f, --fields=         order of the FFEDS field grid: fields of k*step
+                        for k=1..order along +-x, +-y and +-z; 0 switches
+                        FFEDS off (0)
+
+  -s, --step=           field strength step in au (0.001)
+
+  -b, --basis=          number of basis functions setting the size of the
+                        filler output of each subsystem (100)
+
+  --seed=               random seed of the first log, the following logs
+                        use the next ones (1)
+"""
+
+import sys, getopt, random, itertools
+
+HfTerms = [('DE(HL)',       0), ('E(EL,10)',  2), ('E(EL,M,1)', 4), ('E(C-C,R1)', 6),
+           ('E(EL,P,1)',    4), ('E(EX,HL)',  2), ('DE(DEL,HF)', 0), ('', 0), ('DE(HF)', 0)]
+Mp2Terms = [('E(MP,2)',     0), ('E(EL,R,12)', 2), ('E(DS,20)', 2), ('DE(EX-DEL,2)', 2),
+            ('', 0), ('DE(MP2)', 0)]
+CcTerms  = [('E(CC)',       0), ('E(EL,R,12)', 2), ('E(DS,CC)', 2), ('DE(EX-DEL,CC)', 2),
+            ('', 0), ('DE(CC)', 0)]
+
+#----------------------------------------------------------------------------
+# Usage
+#----------------------------------------------------------------------------
+def Usage():
+    """Print usage information and exit."""
+    print(__doc__)
+    sys.exit()
+
+#----------------------------------------------------------------------------
+# Main
+#----------------------------------------------------------------------------
+def Main(argv):
+    """Write synthetic logs."""
+
+    Monomers = 2
+    NBody    = 0
+    Level    = 'mp2'
+    Order    = 0
+    Step     = 0.001
+    Basis    = 100
+    Seed     = 1
+
+    try:
+        opts, args = getopt.getopt(argv, "hm:n:l:f:s:b:",
+                                        ["help", "monomers=", "nbody=", "level=", "fields=",
+                                         "step=", "basis=", "seed="])
+    except getopt.GetoptError:
+        Usage()
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            Usage()
+        elif opt in ("-m", "--monomers"):
+            Monomers = int(arg)
+        elif opt in ("-n", "--nbody"):
+            NBody = int(arg)
+        elif opt in ("-l", "--level"):
+            Level = arg.lower()
+        elif opt in ("-f", "--fields"):
+            Order = int(arg)
+        elif opt in ("-s", "--step"):
+            Step = float(arg)
+        elif opt in ("-b", "--basis"):
+            Basis = int(arg)
+        elif opt == "--seed":
+            Seed = int(arg)
+
+    if not args or Level not in ('hf', 'mp2', 'cc'):
+        Usage()
+
+    for i, LogFile in enumerate(args):
+        Out = open(LogFile,'w')
+        Out.write(GenerateLog(Monomers,NBody or Monomers,Level,FieldGrid(Order,Step),Basis,Seed+i))
+        Out.close()
+
+def FieldGrid(Order,Step):
+    """Fields of the FFEDS grid along the axes."""
+
+    Fields = []
+    for Axis in range(3):
+        for k in range(1,Order+1):
+            for Sign in (1,-1):
+                Field = [0.0, 0.0, 0.0]
+                Field[Axis] = Sign*k*Step
+                Fields.append(tuple(Field))
+
+    return Fields
+
+#----------------------------------------------------------------------------
+# Log sections
+#----------------------------------------------------------------------------
+def FortranE(Value):
+    """Value in the 0.123E-01 form used by GAMESS."""
+
+    if Value == 0.0:
+        return ' 0.000000000000000000E+00'
+    Mantissa, Exponent = ('%.17E' % Value).split('E')
+    Digits = Mantissa.replace('-','').replace('.','')
+    return '%s0.%sE%+03d' % ('-' if Value < 0 else ' ', Digits, int(Exponent)+1)
+
+def Filler(Out,Rand,Mer,Basis):
+    """Output of a subsystem calculation not read by geds.py."""
+
+    Out.append('\n          ----------------------\n')
+    Out.append('          CALCULATIONS OF %2d-MER\n' % Mer)
+    Out.append('          ----------------------\n\n')
+    Out.append(' NUMBER OF CARTESIAN GAUSSIAN BASIS FUNCTIONS = %4d\n\n' % (Basis*Mer))
+    Out.append('          --------------------------\n')
+    Out.append('                 RHF SCF CALCULATION\n')
+    Out.append('          --------------------------\n\n')
+    Out.append('     NUCLEAR ENERGY = %20.10f\n\n' % (9.19*Mer*Mer))
+    Out.append(' ITER EX DEM     TOTAL ENERGY        E CHANGE  DENSITY CHANGE     ORB. GRAD\n')
+
+    Energy = -76.0*Mer
+    for Iter in range(1,13):
+        Change = Rand.uniform(-1,0)*10.0**(-Iter)
+        Energy += Change
+        Out.append('  %2d %2d  0  %16.10f %16.10f %15.9f %13.9f\n' % (Iter, Iter-1, Energy, Change,
+                                                                      abs(Change), abs(Change)/2))
+
+    Out.append('\n          -----------------\n')
+    Out.append('          DENSITY CONVERGED\n')
+    Out.append('          -----------------\n\n')
+    Out.append(' FINAL RHF ENERGY IS %26.16f AFTER  12 ITERATIONS\n\n' % Energy)
+
+    # occupied and a few virtual orbitals, five per block
+    Out.append('          ------------\n')
+    Out.append('          EIGENVECTORS\n')
+    Out.append('          ------------\n\n')
+    for Block in range(3):
+        Out.append('                ' + ''.join(['%11d' % (5*Block+i+1) for i in range(5)]) + '\n')
+        for Row in range(Basis*Mer):
+            Out.append('  %3d  O  1  S  ' % (Row+1) + ''.join(['%11.6f' % Rand.uniform(-1,1) for i in range(5)]) + '\n')
+        Out.append('\n')
+
+def EnergyBlock(Out,Rand,Mer,ConfNo,Terms):
+    """Interaction energy terms of a subsystem."""
+
+    Out.append('          ' + 62*'-' + '\n')
+    Out.append('          INTERACTION ENERGY TERMS OF %2d-MER          C(%4d)\n' % (Mer, ConfNo))
+    Out.append('          ' + 62*'-' + '\n\n')
+    Out.append('          COMPONENT                           [A.U.]          [KCAL/MOL]\n\n')
+    for Term, Indent in Terms:
+        if not Term:
+            Out.append('\n')
+            continue
+        Value = Rand.uniform(-1e-2,1e-2)
+        Out.append('          %-22s %s %13.3f\n' % (Indent*' '+Term, FortranE(Value), Value*627.5095))
+    Out.append('\n          ' + 62*'-' + '\n \n')
+
+def MnbBlock(Out,Rand,Monomers,NBody,Terms):
+    """Many-body interaction energy terms of the complex."""
+
+    Out.append('          ' + 62*'-' + '\n')
+    Out.append('          MANY BODY INTERACTION ENERGY TERMS OF %2d-MER\n' % Monomers)
+    Out.append('          ' + 62*'-' + '\n\n')
+    Out.append('          COMPONENT                           [A.U.]          [KCAL/MOL]\n\n')
+    for Term in Terms:
+        for Body in range(2,NBody+1):
+            Value = Rand.uniform(-1e-2,1e-2)
+            Out.append('          %-10s %d-BODY %s %13.3f\n' % (Term, Body, FortranE(Value), Value*627.5095))
+    Out.append('          ' + 62*'-' + '\n')
+
+def TotalBlock(Out,Rand,Mers,Level,Field):
+    """Total energies of subsystems."""
+
+    Out.append('          ------------------\n')
+    Out.append('          TOTAL SCF ENERGIES\n')
+    Out.append('          ------------------\n')
+    if Field:
+        Out.append('\n          FIELD FREE ENERGIES\n')
+        Out.append('          -------------------\n')
+    else:
+        Out.append('\n')
+    for ConfNo, Mer in enumerate(Mers):
+        Out.append('           %d-MER C(%4d)      %24.18f\n' % (Mer, ConfNo+1, -76.0*Mer+Rand.uniform(-1e-2,1e-2)))
+    Out.append('\n')
+
+    # correlated runs start with MP2
+    if Level != 'hf':
+        Out.append('          --------------------\n')
+        Out.append('          MP2 E(2) CORRECTIONS\n')
+        Out.append('          --------------------\n\n')
+        for ConfNo, Mer in enumerate(Mers):
+            Out.append('           %d-MER C(%4d)      %24.18f\n' % (Mer, ConfNo+1, -0.2*Mer+Rand.uniform(-1e-2,1e-2)))
+        Out.append('\n')
+
+def PropertyBlock(Out,Rand,Label):
+    """Dipole moment and (hyper)polarizabilities of one result."""
+
+    Out.append(' %s\n' % Label)
+    Out.append(' ' + 20*'-' + '\n\n')
+    Out.append('            X            Y            Z\n')
+    Mu = [Rand.uniform(-1,1) for i in range(3)]
+    Out.append('   %12.6f %12.6f %12.6f\n\n' % tuple(Mu))
+    Out.append(' |D| %12.6f\n\n' % sum([x*x for x in Mu])**0.5)
+
+    Alpha = Tensor(Out,Rand,['X', 'Y', 'Z'],5.0)
+    Out.append(' <A> %12.6f\n' % ((Alpha[0][0]+Alpha[1][1]+Alpha[2][2])/3.0))
+    Out.append(' DELTA ALPHA (Z) %12.6f\n\n' % (Alpha[2][2]-Alpha[0][0]))
+
+    Beta = Tensor(Out,Rand,['XX', 'YY', 'ZZ'],50.0)
+    Out.append(' BETA VEC (Z) %12.6f\n\n' % (0.6*(Beta[0][2]+Beta[1][2]+Beta[2][2])))
+
+    Gamma = Tensor(Out,Rand,['XX', 'YY', 'ZZ'],500.0)
+    Out.append(' <G> %12.6f\n\n' % ((Gamma[0][0]+Gamma[1][1]+Gamma[2][2]+
+                                      2.0*(Gamma[0][1]+Gamma[1][2]+Gamma[0][2]))/5.0))
+
+def Tensor(Out,Rand,Rows,Scale):
+    """Rows of a 3x3 tensor, returned as printed."""
+
+    Out.append('                 X            Y            Z\n')
+    Tensor = []
+    for Row in Rows:
+        Values = [round(Rand.uniform(-Scale,Scale),6) for i in range(3)]
+        Out.append('  %-4s %12.6f %12.6f %12.6f\n' % tuple([Row]+Values))
+        Tensor.append(Values)
+    Out.append('\n')
+
+    return Tensor
+
+#----------------------------------------------------------------------------
+# Whole log
+#----------------------------------------------------------------------------
+def GenerateLog(Monomers,NBody,Level,Fields,Basis,Seed):
+    """Text of a synthetic log."""
+
+    Rand = random.Random(Seed)
+    Out  = []
+
+    Subsystems = []
+    NBody = min(NBody,Monomers)
+    for Mer in range(1,NBody+1):
+        Subsystems.extend(itertools.combinations(range(Monomers),Mer))
+    Systems = len(Subsystems)
+    Mers    = [len(Subsystem) for Subsystem in Subsystems]
+
+    if Level == 'hf':
+        MpLevel, CcType, Corr = 0, 'NONE', []
+    elif Level == 'mp2':
+        MpLevel, CcType, Corr = 2, 'NONE', Mp2Terms
+    else:
+        MpLevel, CcType, Corr = 0, 'CCSD(T)', CcTerms
+
+    Out.append('     RUN TITLE\n     ---------\n EDS synthetic %d-body %s seed %d\n\n' % (Monomers, Level, Seed))
+    Out.append('     $CONTRL OPTIONS\n     ---------------\n')
+    Out.append(' SCFTYP=RHF          RUNTYP=EDS          EXETYP=RUN     \n')
+    Out.append(' MPLEVL=       %d     CITYP =NONE         CCTYP =%-8s     VBTYP =NONE    \n' % (MpLevel, CcType))
+    Out.append('\n THERE ARE %4d SUBSYSTEMS IN A %2d-BODY COMPLEX\n\n' % (Systems, Monomers))
+    Out.append(' MONOMER:' + ''.join(['%3d' % (i+1) for i in range(Monomers)]) + '\n \n')
+    for ConfNo, Subsystem in enumerate(Subsystems):
+        Out.append(' C(%4d)' % (ConfNo+1) + ''.join(['%3d' % (i in Subsystem) for i in range(Monomers)]) + '\n')
+    Out.append('\n BSCOR =        F   DDEC  =        F   E2DEC =        T   FFEDS =        %s\n'
+               % ('T' if Fields else 'F'))
+
+    MnbTerms = ['DE(HF)', 'E(EL,10)']
+    if Corr:
+        MnbTerms.append(Corr[-1][0])
+
+    def Calculation(Field):
+        for ConfNo, Subsystem in enumerate(Subsystems):
+            Filler(Out,Rand,len(Subsystem),Basis)
+            if len(Subsystem) < 2: continue
+            EnergyBlock(Out,Rand,len(Subsystem),ConfNo+1,HfTerms)
+            if Corr:
+                EnergyBlock(Out,Rand,len(Subsystem),ConfNo+1,Corr)
+        if Systems > 3:
+            for Block in range(3 if Corr else 2):
+                MnbBlock(Out,Rand,Monomers,NBody,MnbTerms)
+        TotalBlock(Out,Rand,Mers,Level,Field)
+
+    Calculation(None)
+    for Field in Fields:
+        Out.append(' APPLIED FIELD %10.6f %10.6f %10.6f\n' % Field)
+        Calculation(Field)
+
+    if Fields:
+        Results = ['HF']
+        if Corr:
+            Results.append('MP2' if Level == 'mp2' else 'CCSD(T)')
+
+        Head = 'ELECTRIC PROPERTIES OF SUBSYSTEMS'
+        Out.append('          %s\n          %s\n          %s\n' % (len(Head)*'=', Head, len(Head)*'='))
+        for ConfNo in range(Systems):
+            for Result in Results:
+                PropertyBlock(Out,Rand,'%s BASED RESULTS FOR C(%4d)' % (Result, ConfNo+1))
+        Out.append('          ' + 40*'=' + '\n')
+
+        for Head in ['INTERACTION INDUCED PROPERTIES', 'SUM OF INTERACTION INDUCED PROPERTIES']:
+            Out.append('          %s\n          %s\n          %s\n' % (len(Head)*'=', Head, len(Head)*'='))
+            for Body in range(2,NBody+1):
+                PropertyBlock(Out,Rand,'HF BASED RESULTS FOR %d-BODY TERM' % Body)
+            PropertyBlock(Out,Rand,'DE(HF) BASED RESULTS')
+            Out.append('          ' + 40*'=' + '\n')
+
+        Head = 'EXCESS PROPERTIES'
+        Out.append('          %s\n          %s\n          %s\n' % (len(Head)*'=', Head, len(Head)*'='))
+        PropertyBlock(Out,Rand,'HF BASED RESULTS FOR C(%4d)' % Systems)
+        Out.append('          ' + 40*'=' + '\n')
+
+    Out.append(' EXECUTION OF GAMESS TERMINATED NORMALLY\n')
+
+    return ''.join(Out)
+
+#----------------------------------------------------------------------------
+# Main routine
+#----------------------------------------------------------------------------
+if __name__ == "__main__": Main(sys.argv[1:])
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+"""
+Scaling benchmark of geds.py
+
+Synthetic logs are generated with genlog.py for every combination of the
+number of monomers, the correlation level, the order of the FFEDS field
+grid and the number of files. Each set is parsed and its tables written
+with geds.py, and the time spent in ReadPreamble, in each reader and in
+each Format* and Write* function is reported next to the throughput in
+MB/s and logs/s. Times are inclusive, so a reader calling another one
+counts the time of both. The results can be saved and compared with those
+of another commit.
+
+Usage: scaling.py [options]
+
+Options:
+  -h, --help            show this help
+
+  -m, --monomers=       comma separated numbers of monomers (2,3,4)
+
+  -l, --levels=         comma separated correlation levels (hf,mp2,cc)
+
+  -f, --fields=         comma separated orders of the field grid (0,1)
+
+  -n, --files=          comma separated numbers of files (1,20)
+
+  -r, --repeat=         runs of each set, the fastest one is reported (3)
+
+  -d, --details         print the time of each function for every set
+
+  -j, --json=           save the results to a JSON file
+
+  -c, --compare=        compare with results saved earlier and exit with
+                        status 1 if a set got slower or failed
+
+  -t, --tolerance=      slowdown allowed by --compare in percent (20)
+"""
+
+import os, sys, getopt, json, tempfile, shutil, time, itertools
+
+Here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,os.path.dirname(Here))
+sys.path.insert(0,Here)
+
+import geds
+import genlog
+
+#----------------------------------------------------------------------------
+# Usage
+#----------------------------------------------------------------------------
+def Usage():
+    """Print usage information and exit."""
+    print(__doc__)
+    sys.exit()
+
+#----------------------------------------------------------------------------
+# Main
+#----------------------------------------------------------------------------
+def Main(argv):
+    """Run the benchmark sets."""
+
+    Monomers  = [2, 3, 4]
+    Levels    = ['hf', 'mp2', 'cc']
+    Fields    = [0, 1]
+    Files     = [1, 20]
+    Repeat    = 3
+    Details   = False
+    JsonFile  = ''
+    Compare   = ''
+    Tolerance = 20.0
+
+    try:
+        opts, args = getopt.getopt(argv, "hm:l:f:n:r:dj:c:t:",
+                                        ["help", "monomers=", "levels=", "fields=", "files=",
+                                         "repeat=", "details", "json=", "compare=", "tolerance="])
+    except getopt.GetoptError:
+        Usage()
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            Usage()
+        elif opt in ("-m", "--monomers"):
+            Monomers = [int(x) for x in arg.split(',')]
+        elif opt in ("-l", "--levels"):
+            Levels = arg.lower().split(',')
+        elif opt in ("-f", "--fields"):
+            Fields = [int(x) for x in arg.split(',')]
+        elif opt in ("-n", "--files"):
+            Files = [int(x) for x in arg.split(',')]
+        elif opt in ("-r", "--repeat"):
+            Repeat = int(arg)
+        elif opt in ("-d", "--details"):
+            Details = True
+        elif opt in ("-j", "--json"):
+            JsonFile = arg
+        elif opt in ("-c", "--compare"):
+            Compare = arg
+        elif opt in ("-t", "--tolerance"):
+            Tolerance = float(arg)
+
+    Timers  = InstallTimers()
+    WorkDir = tempfile.mkdtemp(prefix='geds-scaling-')
+    Cwd     = os.getcwd()
+
+    Results = {}
+    try:
+        for Set in itertools.product(Monomers,Levels,Fields,Files):
+            Name = '%d-body %s f%d n%d' % Set
+            Dir  = os.path.join(WorkDir,Name.replace(' ','_'))
+            os.makedirs(Dir)
+            os.chdir(Dir)
+            Logs = GenerateSet(*Set)
+            Results[Name] = RunSet(Logs,Repeat,Timers)
+            os.chdir(Cwd)
+            shutil.rmtree(Dir)
+    finally:
+        os.chdir(Cwd)
+        shutil.rmtree(WorkDir)
+
+    WriteResults(Results,Details)
+
+    if JsonFile:
+        Out = open(JsonFile,'w')
+        json.dump(Results,Out,indent=1,sort_keys=True)
+        Out.close()
+
+    if Compare:
+        Old = json.load(open(Compare))
+        if not CompareResults(Old,Results,Tolerance):
+            sys.exit(1)
+
+#----------------------------------------------------------------------------
+# Timers
+#----------------------------------------------------------------------------
+def InstallTimers():
+    """Wrap the readers, Format* and Write* functions of geds.py."""
+
+    Timers = {}
+
+    for Name in sorted(dir(geds)):
+        Function = getattr(geds,Name)
+        if not callable(Function) or isinstance(Function,type): continue
+        if not (Name.startswith('Read') or Name.startswith('Format') or Name.startswith('Write')): continue
+        Timers[Name] = [0, 0.0]
+        setattr(geds,Name,Timed(Function,Timers[Name]))
+
+    return Timers
+
+def Timed(Function,Timer):
+    """Function adding its calls and run time to the timer."""
+
+    def Run(*Args):
+        Start = time.perf_counter()
+        try:
+            return Function(*Args)
+        finally:
+            Timer[0] += 1
+            Timer[1] += time.perf_counter()-Start
+
+    return Run
+
+def ResetTimers(Timers):
+    for Timer in Timers.values():
+        Timer[0] = 0
+        Timer[1] = 0.0
+
+#----------------------------------------------------------------------------
+# Benchmark sets
+#----------------------------------------------------------------------------
+def GenerateSet(Monomers,Level,Order,Files):
+    """Write the logs of a set to the current directory."""
+
+    Fields = genlog.FieldGrid(Order,0.001)
+    Logs   = []
+
+    for i in range(Files):
+        LogFile = 'log%04d.log' % i
+        Out = open(LogFile,'w')
+        Out.write(genlog.GenerateLog(Monomers,Monomers,Level,Fields,100,i+1))
+        Out.close()
+        Logs.append(LogFile)
+
+    return Logs
+
+def RunSet(Logs,Repeat,Timers):
+    """Parse and write a set of logs, keeping the fastest run."""
+
+    Bytes = sum([os.path.getsize(LogFile) for LogFile in Logs])
+    Best  = None
+
+    for i in range(Repeat):
+        ResetTimers(Timers)
+        Session = geds.GEDS_SESSION(TotEn=True)
+        Result  = {'MB': Bytes/1e6, 'Logs': len(Logs), 'Error': ''}
+
+        Start = time.perf_counter()
+        Results = Session.Parse(Logs)
+        Result['Parse'] = time.perf_counter()-Start
+
+        Start = time.perf_counter()
+        try:
+            Out = open('toten.txt','w')
+            for Title in Results['TotEnergies']:
+                geds.WriteTotEnergies(Out,Results['TotEnergies'][Title])
+            Out.close()
+            Session.Write(Results)
+        except Exception as Error:
+            Result['Error'] = '%s: %s' % (Error.__class__.__name__, Error)
+        Result['Write'] = time.perf_counter()-Start
+
+        Result['MB/s']      = Result['MB']/Result['Parse']
+        Result['logs/s']    = Result['Logs']/Result['Parse']
+        Result['Functions'] = dict([(Name, list(Timer)) for Name, Timer in Timers.items() if Timer[0]])
+
+        if Best is None or Result['Parse']+Result['Write'] < Best['Parse']+Best['Write']:
+            Best = Result
+
+    return Best
+
+#----------------------------------------------------------------------------
+# Report
+#----------------------------------------------------------------------------
+def WriteResults(Results,Details):
+    """Print the throughput of each set and the time of each function."""
+
+    print('%-20s %8s %6s %9s %9s %9s %9s' % ('# Set', 'MB', 'Logs', 'Parse[s]', 'MB/s', 'logs/s', 'Write[s]'))
+    for Name in sorted(Results):
+        Result = Results[Name]
+        print('%-20s %8.2f %6d %9.4f %9.2f %9.1f %9.4f %s' % (Name, Result['MB'], Result['Logs'],
+              Result['Parse'], Result['MB/s'], Result['logs/s'], Result['Write'],
+              'Warning! '+Result['Error'] if Result['Error'] else ''))
+
+    # time of each function summed over the sets, or for each set
+    if Details:
+        Sets = sorted(Results)
+    else:
+        Sets = ['all sets']
+
+    for Set in Sets:
+        Functions = {}
+        for Name in sorted(Results):
+            if Set != Name and Set != 'all sets': continue
+            for Function, Timer in Results[Name]['Functions'].items():
+                Functions.setdefault(Function,[0, 0.0])
+                Functions[Function][0] += Timer[0]
+                Functions[Function][1] += Timer[1]
+
+        print('\n# %s\n%-22s %9s %10s %12s' % (Set, '# Function', 'Calls', 'Time[s]', 'Per call[us]'))
+        for Function in sorted(Functions, key=lambda x: -Functions[x][1]):
+            Calls, Seconds = Functions[Function]
+            print('%-22s %9d %10.4f %12.2f' % (Function, Calls, Seconds, 1e6*Seconds/Calls))
+
+def CompareResults(Old,New,Tolerance):
+    """Report sets which failed or whose parse or write time grew above tolerance."""
+
+    Passed = True
+
+    print('\n%-20s %10s %10s %8s %10s %10s %8s' % ('# Set', 'Parse old', 'new', 'Change',
+                                                   'Write old', 'new', 'Change'))
+    for Name in sorted(New):
+        # a set which fails leaves some functions untimed
+        if New[Name]['Error']:
+            print('%-20s Warning! Failed: %s' % (Name, New[Name]['Error']))
+            Passed = False
+            continue
+        if Name not in Old: continue
+        Line = '%-20s' % Name
+        for Stage in ('Parse', 'Write'):
+            Change = 100.0*(New[Name][Stage]/Old[Name][Stage]-1.0)
+            Line  += ' %10.4f %10.4f %+7.1f%%' % (Old[Name][Stage], New[Name][Stage], Change)
+            if Change > Tolerance:
+                Line  += ' Warning! Slower'
+                Passed = False
+        print(Line)
+
+    return Passed
+
+#----------------------------------------------------------------------------
+# Main routine
+#----------------------------------------------------------------------------
+if __name__ == "__main__": Main(sys.argv[1:])
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+Startup time benchmark of geds.py and xyz2eds.py
+
+Each command is started a number of times in a fresh interpreter and the
+wall time is reported together with the import time measured with
+'python -X importtime'. The results can be saved and compared with those
+of another commit to track the startup cost as a regression metric.
+
+Usage: startup.py [options]
+
+Options:
+  -h, --help            show this help
+
+  -n, --repeat=         number of cold starts of each command (20)
+
+  -j, --json=           save the results to a JSON file
+
+  -c, --compare=        compare with results saved earlier and exit with
+                        status 1 if a command got slower
+
+  -t, --tolerance=      slowdown allowed by --compare in percent (20)
+"""
+
+import os, sys, getopt, json, subprocess, tempfile, shutil, time
+
+Here     = os.path.dirname(os.path.abspath(__file__))
+Root     = os.path.dirname(Here)
+Examples = os.path.join(Root,'examples')
+
+#----------------------------------------------------------------------------
+# Usage
+#----------------------------------------------------------------------------
+def Usage():
+    """Print usage information and exit."""
+    print(__doc__)
+    sys.exit()
+
+#----------------------------------------------------------------------------
+# Main
+#----------------------------------------------------------------------------
+def Main(argv):
+    """Time the startup of the scripts."""
+
+    Repeat    = 20
+    JsonFile  = ''
+    Compare   = ''
+    Tolerance = 20.0
+
+    try:
+        opts, args = getopt.getopt(argv, "hn:j:c:t:",
+                                        ["help", "repeat=", "json=", "compare=", "tolerance="])
+    except getopt.GetoptError:
+        Usage()
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            Usage()
+        elif opt in ("-n", "--repeat"):
+            Repeat = int(arg)
+        elif opt in ("-j", "--json"):
+            JsonFile = arg
+        elif opt in ("-c", "--compare"):
+            Compare = arg
+        elif opt in ("-t", "--tolerance"):
+            Tolerance = float(arg)
+
+    Geds   = os.path.join(Root,'geds.py')
+    Xyz2   = os.path.join(Root,'xyz2eds.py')
+    Logs   = [os.path.join(Examples,'h2o-hoh.log'), os.path.join(Examples,'h4o2.log')]
+
+    Commands = [
+        ('python',         ['-c', 'pass']),
+        ('geds --help',    [Geds, '--help']),
+        ('geds examples',  [Geds, '-e', 'kj'] + Logs),
+        ('xyz2eds --help', [Xyz2, '--help']) ]
+
+    # the tables are written to a scratch directory
+    WorkDir = tempfile.mkdtemp(prefix='geds-startup-')
+
+    Results = {}
+    try:
+        for Name, Command in Commands:
+            Results[Name] = TimeCommand(Command,Repeat,WorkDir)
+    finally:
+        shutil.rmtree(WorkDir)
+
+    WriteResults(Results)
+
+    if JsonFile:
+        Out = open(JsonFile,'w')
+        json.dump(Results,Out,indent=1,sort_keys=True)
+        Out.close()
+
+    if Compare:
+        Old = json.load(open(Compare))
+        if not CompareResults(Old,Results,Tolerance):
+            sys.exit(1)
+
+#----------------------------------------------------------------------------
+# Timing
+#----------------------------------------------------------------------------
+def TimeCommand(Command,Repeat,WorkDir):
+    """Wall and import times of a command started in a fresh interpreter."""
+
+    Null  = open(os.devnull,'w')
+    Times = []
+
+    for i in range(Repeat):
+        Start = time.perf_counter()
+        subprocess.call([sys.executable]+Command,stdout=Null,stderr=Null,cwd=WorkDir)
+        Times.append(time.perf_counter()-Start)
+
+    # -X importtime writes one line per module to stderr:
+    # import time: self [us] | cumulative | imported package
+    Run = subprocess.run([sys.executable,'-X','importtime']+Command,stdout=Null,
+                         stderr=subprocess.PIPE,cwd=WorkDir,universal_newlines=True)
+    Null.close()
+
+    Imports = []
+    for line in Run.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line: continue
+        line = line[len('import time:'):].split('|')
+        Imports.append((int(line[0]), int(line[1]), line[2].rstrip()))
+
+    Times.sort()
+    Top = sorted([Import for Import in Imports if not Import[2].startswith('  ')],
+                 key=lambda x: -x[1])[:5]
+
+    return { 'Median' : Times[len(Times)//2],
+             'Min'    : Times[0],
+             'Imports': sum([Import[0] for Import in Imports])*1e-6,
+             'Modules': len(Imports),
+             'Top'    : [(Import[2].strip(), Import[1]*1e-6) for Import in Top] }
+
+#----------------------------------------------------------------------------
+# Report
+#----------------------------------------------------------------------------
+def WriteResults(Results):
+    """Print the timings."""
+
+    print('%-16s %10s %10s %10s %8s' % ('# Command', 'Median[s]', 'Min[s]', 'Import[s]', 'Modules'))
+    for Name in sorted(Results):
+        Result = Results[Name]
+        print('%-16s %10.4f %10.4f %10.4f %8d' % (Name, Result['Median'], Result['Min'],
+                                                  Result['Imports'], Result['Modules']))
+
+    print('\n# Slowest top level imports')
+    for Name in sorted(Results):
+        print('%-16s %s' % (Name, ', '.join(['%s %.4f' % Import for Import in Results[Name]['Top']])))
+
+def CompareResults(Old,New,Tolerance):
+    """Report commands whose median startup time grew above tolerance."""
+
+    Passed = True
+
+    print('\n%-16s %10s %10s %8s' % ('# Command', 'Old[s]', 'New[s]', 'Change'))
+    for Name in sorted(New):
+        if Name not in Old: continue
+        Change = 100.0*(New[Name]['Median']/Old[Name]['Median']-1.0)
+        Flag   = ''
+        if Change > Tolerance:
+            Flag   = ' Warning! Slower startup'
+            Passed = False
+        print('%-16s %10.4f %10.4f %+7.1f%%%s' % (Name, Old[Name]['Median'], New[Name]['Median'], Change, Flag))
+
+    return Passed
+
+#----------------------------------------------------------------------------
+# Main routine
+#----------------------------------------------------------------------------
+if __name__ == "__main__": Main(sys.argv[1:])
@@ -5,6 +5,15 @@ Parser for EDS GAMESS module
 
 Usage: ggms.py [options] [output file(s)]
 
+Logs compressed with gzip, bzip2, xz or zstd (.gz, .bz2, .xz, .zst) are
+read directly; zstd needs the zstandard package.
+
+Logs can be read straight from tar archives (.tar, .tar.gz, .tgz, .tar.bz2,
+.tar.xz): 'campaign.tar.gz' reads all its *.log members in the order they
+are stored and 'campaign.tar.gz:run1/*.log' those matching the glob, whose
+* and ? do not match / (run1/sub/*.log is left out). The titles are the
+same as for the extracted logs.
+
 Options:
   -h, --help            show this help
 
@@ -12,6 +21,105 @@ Options:
 
   -t                    Grep total energies
 
+  -i, --index           jump straight to the sections of each log using
+                        a sidecar index of section offsets (log.idx), which
+                        is built on the first run and rebuilt if the log
+                        changes
+
+  -n, --nbody           write the energies of the subsystems of each n-body
+                        order to their own file, energies-2body.*,
+                        energies-3body.*, ..., a table for each log with a
+                        row for each tuple of monomers (1-2, 1-3, ...), and
+                        only those of the whole complex to energies.*; the
+                        subsystems are stored by their monomers, so large
+                        clusters take memory and time only for the
+                        subsystems computed
+
+  -j, --jobs=           parse logs in a pool of N processes
+
+  -c, --cache=          keep parse results of logs in a cache directory
+                        and parse only new or changed logs
+
+  --cache-size=         size limit of the cache in MB (512 by default),
+                        also of the results --serve keeps in memory;
+                        least recently used entries are evicted first
+
+  -w, --watch=          follow logs which are still being written, checking
+                        them every given number of seconds; the tables are
+                        updated as soon as new sections are complete and the
+                        watch ends when all logs are done (or on Ctrl-C)
+
+  -x, --export=         also save full precision results as .npy arrays in
+                        the given directory: energies in au, also of the
+                        subsystems of each n-body order with their monomers
+                        (nbody2_*.npy, ...), all components of the dipole
+                        moments and (hyper)polarizability tensors of each
+                        property type and their invariants in au, and their
+                        label axes; load them with numpy.load(...,
+                        mmap_mode='r') to read just a slice; tensors.csv
+                        holds the same tensors and invariants with a row
+                        for each file, property type and term
+
+  --serve=              run as a daemon answering requests on the given
+                        UNIX socket; parse results are kept in memory, up
+                        to --cache-size, and reused while the logs are
+                        unchanged
+
+  --connect=            send the logs and options to a daemon started with
+                        --serve, which writes the tables in the current
+                        directory
+
+  --stream              write the table of each log to energies.* as soon
+                        as the log is parsed and keep only a compact copy
+                        of its results in a temporary file for the tables
+                        comparing the logs, so that memory stays bounded
+                        for any number of logs; the tables of the logs
+                        are written in the order given (members of an
+                        archive in their stored order) and the table of a
+                        log has the labels and widths seen so far; not with
+                        -w, -x, -f, -m or --connect
+
+  -f, --derivatives     also differentiate the many-body energy terms of
+                        finite field runs with respect to the field and
+                        write the diagonal components of the dipole moment
+                        and (hyper)polarizabilities of each term to
+                        derivatives.*; central differences of each field
+                        strength are extrapolated to zero step (Richardson)
+
+  -m, --expansion       also rebuild the many-body expansion of each energy
+                        term from the interaction energies of the subsystems
+                        and write to expansion.* the n-body terms of each
+                        order (the 2-body sums, the non-additive 3-body
+                        terms, ...), their sum and the cooperativity of each
+                        order above two, its ratio to the 2-body terms
+
+  --sections=           parse only the given sections, a comma separated
+                        list of: sub (interaction energies of the
+                        subsystems), mnb (many-body terms), fields (field
+                        energies), properties, totals (total energies,
+                        with -t); other sections are not parsed and a log
+                        is read only up to the last of them; the lines
+                        before it are still checked for section markers,
+                        unless -i jumps straight to the sections kept
+
+  --terms=              keep only the given energy terms, as printed in
+                        the log; * and ? match any characters, e.g.
+                        --terms='DE(HF)' --terms='DE(MP2)'; may be repeated
+
+  --systems=            keep only the energies of the given subsystems, a
+                        comma separated list of their numbers, 'complex'
+                        being the whole complex; the other blocks are
+                        skipped unread
+
+  --fields=             keep only the fields along the given axes (x, y,
+                        z) and of the given strengths in au, a comma
+                        separated list, e.g. --fields=z,0.001; the zero
+                        field is always kept
+
+  --labels=             keep only the given property labels, as in the
+                        property tables (HF,2, DE(HF), ...); * and ? match
+                        any characters; may be repeated
+
   -e, --energy-units=   set energy units; chose from: kcal, kJ, meV,
                         mH (mili Hartree) or au which is the default
 
@@ -28,21 +136,64 @@ Options:
                         if relative=first the first value is used as a reference
                         if relative=last its the opposite
 
+  --profile=           save the wall time, bytes read and peak memory of
+                        each stage (preamble, sub-energies, many-body, field
+                        energies, properties, total energies, formatting,
+                        writing) for each log to a JSON file
+
+  --cprofile=           save a cProfile dump of the run to a file, to be
+                        read with pstats (worker processes of -j are not
+                        included)
+
   -d                    show debugging information while parsing
 """
 
 __author__  = "Robert Gora (robert.gora@pwr.wroc.pl)"
 __version__ = "$Revision: 0.2 $"
 
-from numpy import *
-
 import sys
 import getopt
 import re
+import io
+import os
+import mmap
+import pickle
+import hashlib
+import time
+import threading
+import socket
+import socketserver
+import stat
+import json
+import contextlib
+import collections
+import itertools
+import tempfile
 
 # Regular expressions
 reflags = re.DOTALL
 
+# Stages are timed only with --profile
+Profile = None
+
+def ImportNumpy():
+    """Import the numpy names on first use.
+
+        Same as 'from numpy import *' but numpy is imported only when
+        logs are parsed or written, and its subpackages (testing, f2py,
+        ma, ...) which are not used here are skipped, which keeps the
+        startup of --help and --connect short. Likewise multiprocessing
+        is imported only for -j.
+    """
+
+    if 'ndarray' in globals(): return
+
+    import numpy
+
+    for Name in numpy.__all__:
+        if Name in numpy.__dict__:
+            globals()[Name] = numpy.__dict__[Name]
+
 #----------------------------------------------------------------------------
 # Usage
 #----------------------------------------------------------------------------
@@ -56,37 +207,51 @@ def Usage():
 def Main(argv):
     """Parse commandline and loop throught the logs"""
 
-    global Monomers, Systems, SortMode, Relative, OutFormat
-    global _TotEn_, TotOutFile
-
-
-    Energies      = {}
-    TotEnergies   = {}
-    Properties    = {}
-    EnergyTables  = {}
-    ClusterTables = {}
-    MbodyTables   = {}
-    FieldTables   = {}
-    PropTables    = {}
-    TitleLen      = [25]
+    OutFormat     = 'txt'
+    EnUnits       = 'au'
+    PrUnits       = 'au'
     SortMode      = False
     Relative      = ''
-    OutFormat     = SetOutFormat('txt')
-
-    # Dictionary of sorted labels
-    OrdLabel = SetLabels()
-    OldLabel = SetLabels()
-
-    # Set units
-    SetEnUnits('au')
-    SetPrUnits('au')
-
-    _TotEn_ = 0
+    TotEn         = False
+    Index         = False
+    NBody         = False
+    Jobs          = 1
+    CacheDir      = ''
+    CacheSize     = 512
+    Watch         = 0
+    ExportDir     = ''
+    Serve         = ''
+    Connect       = ''
+    ProfileFile   = ''
+    CProfileFile  = ''
+    Stream        = False
+    Derivatives   = False
+    Expansion     = False
+    Projection    = { 'sections': [], 'terms': [], 'systems': [], 'fields': [], 'labels': [] }
 
     # Parse commandline
     try:
-        opts, args = getopt.getopt(argv, "ho:e:p:s:r:dt", 
+        opts, args = getopt.getopt(argv, "ho:e:p:s:r:dtinj:c:w:x:fm", 
                                         ["help",
+                                         "nbody",
+                                         "serve=",
+                                         "connect=",
+                                         "profile=",
+                                         "cprofile=",
+                                         "stream",
+                                         "derivatives",
+                                         "expansion",
+                                         "sections=",
+                                         "terms=",
+                                         "systems=",
+                                         "fields=",
+                                         "labels=",
+                                         "export=",
+                                         "watch=",
+                                         "index",
+                                         "jobs=",
+                                         "cache=",
+                                         "cache-size=",
                                          "out=",
                                          "energy-units=",
                                          "property-units=",
@@ -104,219 +269,1904 @@ def Main(argv):
             global _debug
             _debug = 1
         elif opt == '-t':
-            _TotEn_ = 1
-            TotOutFile=open('toten.txt','w')
+            TotEn = True
+        elif opt in ("-i", "--index"):
+            Index = True
+        elif opt in ("-n", "--nbody"):
+            NBody = True
+        elif opt in ("-j", "--jobs"):
+            Jobs = int(arg)
+        elif opt in ("-c", "--cache"):
+            CacheDir = arg
+        elif opt == "--cache-size":
+            CacheSize = float(arg)
+        elif opt in ("-w", "--watch"):
+            Watch = float(arg)
+        elif opt in ("-x", "--export"):
+            ExportDir = arg
+        elif opt == "--serve":
+            Serve = arg
+        elif opt == "--connect":
+            Connect = arg
+        elif opt == "--profile":
+            ProfileFile = arg
+        elif opt == "--cprofile":
+            CProfileFile = arg
+        elif opt == "--stream":
+            Stream = True
+        elif opt in ("-f", "--derivatives"):
+            Derivatives = True
+        elif opt in ("-m", "--expansion"):
+            Expansion = True
+        elif opt in ("--sections", "--systems", "--fields"):
+            Projection[opt[2:]].extend([Item.strip() for Item in arg.split(',') if Item.strip()])
+        elif opt in ("--terms", "--labels"):
+            Projection[opt[2:]].append(arg)
         elif opt in ("-o", "--out"):
-            OutFormat = SetOutFormat(arg)
+            OutFormat = arg
         elif opt in ("-e", "--energy-units"):
-            EnUnits = SetEnUnits(arg)
+            EnUnits = arg
         elif opt in ("-p", "--property-units"):
-            PrUnits = SetPrUnits(arg)
+            PrUnits = arg
         elif opt in ("-s", "--sort"):
             SortMode=arg
         elif opt in ("-r", "--relative"):
             Relative=arg
 
+    if Serve:
+        try:
+            ServeRequests(Serve,CacheSize)
+        except IOError as Error:
+            print('Error! %s' % Error)
+            sys.exit(1)
+        sys.exit()
+
     if not args:
         Usage()
         sys.exit()
 
-    # Parse each log file
-    for LogFile in args:
-        OrdLabel = SetLabels()
-        ParseFile(LogFile,OrdLabel,TitleLen,Energies,Properties,TotEnergies)
-        Labels = SaveLabels(OrdLabel,OldLabel)
+    # the tables of the logs written as they come cannot be updated
+    for Option, Value in (('-w/--watch', Watch), ('-x/--export', ExportDir), ('-f/--derivatives', Derivatives),
+                          ('-m/--expansion', Expansion), ('--connect', Connect)):
+        if Stream and Value:
+            print('Error! --stream cannot be used with '+Option)
+            sys.exit(2)
+
+    if Connect:
+        Reply = SendRequest(Connect,{ 'action'        : 'write',
+                                      'logs'          : args,
+                                      'dir'           : os.getcwd(),
+                                      'out'           : OutFormat,
+                                      'energy_units'  : EnUnits,
+                                      'property_units': PrUnits,
+                                      'totals'        : TotEn,
+                                      'index'         : Index,
+                                      'nbody'         : NBody,
+                                      'sort'          : SortMode,
+                                      'relative'      : Relative,
+                                      'export'        : ExportDir,
+                                      'derivatives'   : Derivatives,
+                                      'expansion'     : Expansion,
+                                      'projection'    : Projection })
+        if 'error' in Reply:
+            print('Error! '+Reply['error'])
+            sys.exit(1)
+        sys.exit()
+
+    try:
+        Session = GEDS_SESSION(OutFormat,EnUnits,PrUnits,TotEn,Index,SortMode,Relative,NBody,Projection)
+    except ValueError as Error:
+        print('Error! %s' % Error)
+        Usage()
+        sys.exit(2)
+
+    if ProfileFile:
+        global Profile
+        Profile = PROFILER()
+
+    if CProfileFile:
+        import cProfile
+        CProfile = cProfile.Profile()
+        CProfile.enable()
+
+    # the profiles are saved also when the run fails
+    try:
+        with Session:
+            if CacheDir:
+                Cache = PARSE_CACHE(CacheDir,CacheSize)
+            else:
+                Cache = None
+            if Stream:
+                StreamSession(args,Jobs,Cache)
+            else:
+                RunSession(args,Jobs,Cache,Watch,ExportDir,Derivatives,Expansion)
+    except IOError as Error:
+        print('Error! %s' % Error)
+        sys.exit(1)
+    finally:
+        if CProfileFile:
+            CProfile.disable()
+            CProfile.dump_stats(CProfileFile)
+
+        if ProfileFile:
+            Profile.Save(ProfileFile)
+
+def RunSession(LogFiles,Jobs,Cache,Watch,ExportDir,Derivatives=False,Expansion=False):
+    """Parse the logs and write the tables for the current session."""
+
+    Energies      = ENERGY_STORE(bool(ExportDir) or Expansion)
+    TotEnergies   = {}
+    Properties    = PROPERTY_STORE()
+    TitleLen      = [25]
+
+    # Dictionary of sorted labels
+    OldLabel = SetLabels()
+
+    if State._TotEn_:
+        TotOutFile=open('toten.txt','w')
+
+    if Watch:
+        Logs = WatchLogs(LogFiles,Watch)
+        if not Logs:
+            print('Warning! No energy terms found in the watched logs')
+            sys.exit(1)
+    else:
+        Logs = ParseLogs(LogFiles,Jobs,Cache)
+
+    # Parse each log file and merge the results in the order of the
+    # command line
+    Labels = None
+    for Log in Logs:
+        Labels = MergeLog(Log,OldLabel,TitleLen,Energies,Properties,TotEnergies)
+        if State._TotEn_:
+            with ProfileStage('writing'):
+                for Title in Log['TotEnergies']:
+                    WriteTotEnergies(TotOutFile,Log['TotEnergies'][Title])
+
+    if State._TotEn_:
+        TotOutFile.close()
+
+    if Labels is None:
+        raise IOError('No logs found in '+' '.join(LogFiles))
+
+    if ExportDir:
+        ExportArrays(ExportDir,Energies,Properties)
+
+    WriteTables(Labels,TitleLen,Energies,Properties)
+
+    if Derivatives:
+        if State.FiniteField:
+            with ProfileStage('writing'):
+                WriteDerivatives(max(TitleLen),Energies,Labels)
+        else:
+            print('Warning! No finite field energies to differentiate')
+
+    if Expansion:
+        if Energies.Orders.Orders():
+            with ProfileStage('writing'):
+                WriteExpansion(max(TitleLen),Energies,Labels)
+        else:
+            print('Warning! No subsystem energies to expand')
+
+def WriteTables(Labels,TitleLen,Energies,Properties):
+    """Format and write all tables."""
+
+    EnergyTables  = {}
+    ClusterTables = {}
+    MbodyTables   = {}
+    FieldTables   = {}
+    PropTables    = {}
+    OrderTables   = {}
 
     # Format results
-    FormatSubEnergies(EnergyTables,ClusterTables,Energies,Labels)
-    
-    if ManyBody:
-        FormatMnbEnergies(MbodyTables,Energies,Labels)
+    with ProfileStage('formatting'):
+        if 'sub' in State.Projection['Sections']:
+            FormatSubEnergies(EnergyTables,ClusterTables,Energies,Labels)
 
-    if FiniteField:
-        FormatFieldEnergies(FieldTables,Energies,Labels)
-        FormatProperties(PropTables,Properties,Labels)
+            if State._NBody_:
+                FormatOrders(OrderTables,Energies,Labels)
+
+        if State.ManyBody:
+            FormatMnbEnergies(MbodyTables,Energies,Labels)
+
+        if State.FiniteField:
+            FormatFieldEnergies(FieldTables,Energies,Labels)
+
+        if State.FieldProperties:
+            FormatProperties(PropTables,Properties,Labels)
 
     # Write results
-    WriteEnergies(max(TitleLen),EnergyTables,ClusterTables,MbodyTables,FieldTables)
-    if FiniteField:
-        WriteProperties(max(TitleLen),PropTables,Properties)
+    with ProfileStage('writing'):
+        WriteEnergies(max(TitleLen),EnergyTables,ClusterTables,MbodyTables,FieldTables,Labels)
+        if State._NBody_:
+            OrderFiles = {}
+            WriteOrders(OrderFiles,TABLE_FORMAT(max(TitleLen),LabelWidths(Labels)[0]),OrderTables)
+            for OrderFile in OrderFiles.values():
+                OrderFile.close()
+        if State.FieldProperties:
+            WriteProperties(max(TitleLen),PropTables,Labels)
+            WritePropertyCheck(Properties.Validate())
 
 #----------------------------------------------------------------------------
-# Parse
+# Parser session
 #----------------------------------------------------------------------------
-def ParseFile(LogFile,OrdLabel,TitleLen,Energies,Properties,TotEnergies):
-    """Parse current log file"""
 
-    # open the current log file ...
-    File=open(LogFile,'r')
+# State set by the options, the units and the preamble of a log
+SessionState = ['OutFormat', 'SortMode', 'Relative', '_TotEn_', '_Index_', '_NBody_',
+                'EnUnits', 'PrUnits', 'PropertyLabels', 'PropertyConFac',
+                'PropertyFormats', 'PropertyIndex', 'PropertyDescription',
+                'Projection', 'MpLevel', 'CcLevel', 'Monomers', 'Systems', 'Composition',
+                'ManyBody', 'FiniteField', 'FieldProperties']
 
-    # ... parse ...
-    Title = ReadPreamble(File,LogFile)
-    TitleLen.append(len(Title.split()[1].replace('.log',''))+1)
+class PARSE_STATE(threading.local):
+    """Parse state read by the readers, formatters and writers
 
-    # ... read field free energies of subsystems ...
-    Energies[Title] = {}
-    Field=(0,0,0)
-    Energies[Title][Field]={}
-
-    for i in range(Systems-Monomers): 
-        ReadSubEnergies(File,'',OrdLabel['SubLabel'],Energies[Title][Field])
-        if MpLevel == 2 or (CcLevel and CcLevel.upper() != 'NONE'):
-            ReadSubEnergies(File,'(CORR)',OrdLabel['SubLabel'],Energies[Title][Field])
-
-    # ... read many-body partitioning ...
-    if ManyBody:
-        File.seek(0)
-        if MpLevel == 2 or (CcLevel and CcLevel.upper() != 'NONE'):
-            SeekIter=3
+    Each thread has its own, starting from the defaults of the command
+    line; a GEDS_SESSION installs its state while it runs.
+    """
+
+    def __init__(self):
+        self.OutFormat   = 'txt'
+        self.SortMode    = False
+        self.Relative    = ''
+        self._TotEn_     = 0
+        self._Index_     = 0
+        self._NBody_     = 0
+        self.Projection  = SetProjection()
+        self.MpLevel     = 0
+        self.CcLevel     = ''
+        self.Monomers    = 0
+        self.Systems     = 0
+        self.Composition = {}
+        self.ManyBody    = False
+        self.FiniteField = False
+        self.FieldProperties = False
+        self.EnUnits     = EnergyUnits('au')
+        self.Update(PropertyUnits('au'))
+
+    def Update(self,Values):
+        """Set the options or the run type given by the preamble of a log."""
+        self.__dict__.update(Values)
+
+    def Save(self):
+        """Copy of the state."""
+        return dict([(Name, getattr(self,Name)) for Name in SessionState])
+
+class GEDS_SESSION:
+    """Settings and parse state kept apart from other sessions
+
+    A session can be used many times in one process. Sessions run in
+    parallel in separate threads, each thread having its own parse state
+    which a session replaces by its own while it runs, but a session is
+    used by one thread at a time:
+
+        Session = GEDS_SESSION(EnUnits='kcal')
+        Log     = Session.ParseLog('h2o-hoh.log')
+        Results = Session.Parse(['h2o-hoh.log', 'h4o2.log'])
+        Session.Write(Results)
+    """
+
+    EnUnitsList = ['kcal', 'kj', 'au', 'mh', 'mev']
+    PrUnitsList = ['au', 'mau', 'si', 'asi', 'esu']
+
+    def __init__(self,OutFormat='txt',EnUnits='au',PrUnits='au',TotEn=False,Index=False,
+                 SortMode=False,Relative='',NBody=False,Projection=None):
+        ImportNumpy()
+
+        if EnUnits.lower() not in self.EnUnitsList:
+            raise ValueError('Unknown energy units: '+EnUnits)
+        if PrUnits.lower() not in self.PrUnitsList:
+            raise ValueError('Unknown property units: '+PrUnits)
+
+        Projection = SetProjection(Projection)
+
+        # states replaced by this session while it runs
+        self.Outer = []
+
+        Outer = State.Save()
+        SetEnUnits(EnUnits)
+        SetPrUnits(PrUnits)
+        State.Update({'OutFormat': SetOutFormat(OutFormat),
+                      'SortMode' : SortMode,
+                      'Relative' : Relative,
+                      '_TotEn_'  : int(TotEn),
+                      '_Index_'  : int(Index),
+                      '_NBody_'  : int(NBody),
+                      'Projection': Projection})
+        self.State = State.Save()
+        State.Update(Outer)
+
+    def __enter__(self):
+        self.Outer.append(State.Save())
+        State.Update(self.State)
+        return self
+
+    def __exit__(self,*Exception):
+        self.State = State.Save()
+        State.Update(self.Outer.pop())
+
+    def ParseLog(self,LogFile):
+        """Parse a log into a self-contained result."""
+        with self:
+            return ParseLog(LogFile)
+
+    def Parse(self,LogFiles,Jobs=1,Cache=None):
+        """Parse and merge logs in order."""
+        with self:
+            return self.Merge(list(ParseLogs(LogFiles,Jobs,Cache)))
+
+    def Merge(self,Logs):
+        """Merge parse results of single logs."""
+        with self:
+            Results = { 'Energies'   : ENERGY_STORE(),
+                        'Properties' : PROPERTY_STORE(),
+                        'TotEnergies': {},
+                        'TitleLen'   : [25],
+                        'Labels'     : SetLabels() }
+
+            OldLabel = SetLabels()
+            for Log in Logs:
+                Results['Labels'] = MergeLog(Log,OldLabel,Results['TitleLen'],Results['Energies'],
+                                             Results['Properties'],Results['TotEnergies'])
+
+            Results['Preamble'] = SavePreamble()
+            return Results
+
+    def Write(self,Results):
+        """Write the tables of merged results to the current directory."""
+        with self:
+            State.Update(Results['Preamble'])
+            WriteTables(Results['Labels'],Results['TitleLen'],Results['Energies'],Results['Properties'])
+
+#----------------------------------------------------------------------------
+# Daemon
+#----------------------------------------------------------------------------
+def ServeRequests(SocketName,CacheSize=512):
+    """Answer requests on a UNIX socket until asked to shut down."""
+
+    RemoveStaleSocket(SocketName)
+
+    Server = GEDS_SERVER(SocketName,GEDS_REQUEST,CacheSize)
+    try:
+        Server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    Server.server_close()
+    os.remove(SocketName)
+
+def RemoveStaleSocket(SocketName):
+    """
+    Remove the socket of a daemon which is gone.
+
+        Anything else found at the path, a file or the socket of a daemon
+        still answering, is left alone and an IOError is raised.
+    """
+
+    if not os.path.lexists(SocketName): return
+
+    if not stat.S_ISSOCK(os.lstat(SocketName).st_mode):
+        raise IOError(SocketName+' exists and is not a socket')
+
+    Client = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+    try:
+        Client.connect(SocketName)
+    except ConnectionRefusedError:
+        os.remove(SocketName)
+        return
+    finally:
+        Client.close()
+
+    raise IOError('A daemon is already answering on '+SocketName)
+
+def SendRequest(SocketName,Request):
+    """Send a request to the daemon and return its reply."""
+
+    Client = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+    Client.connect(SocketName)
+    Client.sendall((json.dumps(Request)+'\n').encode())
+    Reply = Client.makefile('rb').readline()
+    Client.close()
+
+    return json.loads(Reply.decode())
+
+class GEDS_SERVER(socketserver.UnixStreamServer):
+    """Daemon keeping sessions and parse results warm between requests
+
+    Each request is a single line of JSON and gets a single line of JSON
+    in reply. Actions:
+
+        ping      check that the daemon is up
+        parse     return the parse results of the logs
+        write     parse the logs and write the tables (and toten.txt,
+                  .npy arrays if asked) in the directory of the request
+        shutdown  stop the daemon
+
+    Logs are given relative to the 'dir' of the request and the options
+    are 'out', 'energy_units', 'property_units', 'totals', 'index',
+    'nbody', 'sort', 'relative', 'export', 'derivatives' and 'expansion'
+    as on the command line, and 'projection', a dict of the lists given
+    to --sections, --terms, --systems, --fields and --labels. Sessions
+    of the last SessionLimit option sets are kept, the least recently
+    used being dropped first.
+    """
+
+    SessionLimit = 16
+
+    def __init__(self,SocketName,Handler,CacheSize=512):
+        socketserver.UnixStreamServer.__init__(self,SocketName,Handler)
+        self.Sessions = collections.OrderedDict()
+        self.Cache    = MEMORY_CACHE(CacheSize)
+
+    def Session(self,Request):
+        """Session for the options of a request."""
+        Options = (Request.get('out','txt'), Request.get('energy_units','au'),
+                   Request.get('property_units','au'), bool(Request.get('totals',False)),
+                   bool(Request.get('index',False)), Request.get('sort',False),
+                   Request.get('relative',''), bool(Request.get('nbody',False)))
+        Projection = Request.get('projection') or {}
+        Key = Options + (json.dumps(Projection,sort_keys=True),)
+        if Key in self.Sessions:
+            # mark as recently used
+            self.Sessions.move_to_end(Key)
         else:
-            SeekIter=2
-        ReadMnbEnergies(File,OrdLabel['MnbLabel'],Energies[Title][Field],SeekIter)
+            self.Sessions[Key] = GEDS_SESSION(*Options,Projection=Projection)
+            while len(self.Sessions) > self.SessionLimit:
+                self.Sessions.popitem(last=False)
+        return self.Sessions[Key]
+
+    def Answer(self,Request):
+        Action = Request.get('action')
+
+        if Action == 'ping':
+            return {'ok': True}
+
+        if Action == 'shutdown':
+            # serve_forever waits for this request to finish
+            threading.Thread(target=self.shutdown).start()
+            return {'ok': True}
+
+        if Action not in ('parse', 'write'):
+            return {'error': 'Unknown action: '+str(Action)}
+
+        Session = self.Session(Request)
+        Cache   = self.Cache
+        Cwd     = os.getcwd()
+
+        with Session:
+            try:
+                os.chdir(Request.get('dir',Cwd))
+                if Action == 'parse':
+                    return {'ok': True, 'logs': JsonResult(list(ParseLogs(Request['logs'],1,Cache)))}
+                RunSession(Request['logs'],1,Cache,0,Request.get('export',''),
+                           bool(Request.get('derivatives',False)),bool(Request.get('expansion',False)))
+                return {'ok': True}
+            finally:
+                os.chdir(Cwd)
+
+class GEDS_REQUEST(socketserver.StreamRequestHandler):
+    """Handler of a single request"""
+
+    def handle(self):
+        try:
+            Reply = self.server.Answer(json.loads(self.rfile.readline().decode()))
+        except Exception as Error:
+            Reply = {'error': '%s: %s' % (Error.__class__.__name__, Error)}
+        self.wfile.write((json.dumps(Reply)+'\n').encode())
+
+class MEMORY_CACHE:
+    """Parse results of unchanged logs kept in memory
+
+    The results are kept pickled as merging modifies the labels of a log.
+    Like the cache on disk they are keyed by the settings of the session
+    too, the least recently used being evicted above the size limit and
+    those of logs which are gone being dropped.
+    """
+
+    def __init__(self,Size=512):
+        self.Size  = Size * 1024**2
+        self.Total = 0
+        self.Logs  = collections.OrderedDict()
+
+    def Stamp(self,LogFile):
+        Stat = os.stat(LogFile)
+        return (os.path.abspath(LogFile), LogFile, repr(ResultTag())), (Stat.st_size, Stat.st_mtime_ns)
+
+    def Load(self,LogFile):
+        Key, Stamp = self.Stamp(LogFile)
+        if Key in self.Logs and self.Logs[Key][0] == Stamp:
+            # mark as recently used
+            self.Logs.move_to_end(Key)
+            return pickle.loads(self.Logs[Key][1])
+        return None
+
+    def Save(self,LogFile,Log):
+        Key, Stamp = self.Stamp(LogFile)
+        self.Drop(Key)
+        self.Logs[Key] = (Stamp, pickle.dumps(Log,pickle.HIGHEST_PROTOCOL))
+        self.Total += len(self.Logs[Key][1])
+
+    def Drop(self,Key):
+        if Key in self.Logs:
+            self.Total -= len(self.Logs.pop(Key)[1])
+
+    def Evict(self):
+        """Drop results of removed logs and the least recently used ones above the size limit."""
+        for Key in list(self.Logs):
+            if not os.path.exists(Key[0]):
+                self.Drop(Key)
+
+        while self.Logs and self.Total > self.Size:
+            self.Drop(next(iter(self.Logs)))
+
+def JsonResult(Result):
+    """Parse results with keys and arrays JSON can hold."""
+
+    if isinstance(Result,dict):
+        return dict([(Key if isinstance(Key,str) else str(Key), JsonResult(Value))
+                     for Key, Value in Result.items()])
+    if isinstance(Result,(list,tuple)):
+        return [JsonResult(Value) for Value in Result]
+    if isinstance(Result,ndarray):
+        return Result.tolist()
+    if isinstance(Result,generic):
+        return Result.item()
+    return Result
+
+#----------------------------------------------------------------------------
+# Parse logs in parallel
+#----------------------------------------------------------------------------
+def ParseLogs(LogFiles,Jobs,Cache=None):
+    """Yield parse results of the logs in order.
+
+    Logs stored in tar archives are read from the archive as it is
+    streamed, in the main process and without the cache.
+    """
+
+    Archives = dict([(LogFile, ArchivePattern(LogFile)) for LogFile in LogFiles
+                      if ArchivePattern(LogFile)])
+
+    Cached = {}
+    if Cache:
+        for LogFile in LogFiles:
+            if LogFile in Archives: continue
+            Log = Cache.Load(LogFile)
+            if Log is not None:
+                Cached[LogFile] = Log
+
+    Missing = [LogFile for LogFile in LogFiles if LogFile not in Cached and LogFile not in Archives]
+
+    if Jobs > 1 and len(Missing) > 1:
+        import multiprocessing
+        Pool   = multiprocessing.Pool(Jobs,InitWorker,(WorkerOptions(),))
+        Parsed = Pool.imap(ParseLog,Missing,len(Missing)//(4*Jobs) or 1)
+    else:
+        Pool   = None
+        Parsed = map(ParseLog,Missing)
+
+    # the workers are stopped also when the logs are not all read, on an
+    # error or when the generator is dropped
+    try:
+        for LogFile in LogFiles:
+            if LogFile in Archives:
+                for Log in ArchiveLogs(*Archives[LogFile]):
+                    yield Log
+            elif LogFile in Cached:
+                yield Cached[LogFile]
+            else:
+                Log = next(Parsed)
+                if 'Profile' in Log:
+                    Profile.Files[LogFile] = Log.pop('Profile')
+                if Cache:
+                    Cache.Save(LogFile,Log)
+                yield Log
+
+        if Pool:
+            Pool.close()
+            Pool.join()
+    finally:
+        if Pool:
+            Pool.terminate()
+
+    if Cache:
+        Cache.Evict()
+
+# Archives holding logs
+ArchiveSuffixes = ['.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz']
+
+def ArchivePattern(LogFile):
+    """Split 'archive.tar:glob' into the archive and the glob of its logs.
+
+    Without a glob all members named *.log (compressed or not) are read,
+    and None is returned for logs which are not archives. The glob is
+    matched directory by directory, 'run1/*.log' leaving out the logs in
+    run1/sub.
+    """
+
+    Archive, Colon, Pattern = LogFile.partition(':')
+
+    for Suffix in ArchiveSuffixes:
+        if Archive.endswith(Suffix):
+            return Archive, Pattern
+    return None
+
+def ArchiveLogs(Archive,Pattern):
+    """Yield parse results of the logs in an archive in their stored order."""
+
+    import tarfile
+
+    # members are read in their stored order so the archive is read once
+    # from start to end; data of other members is skipped by seeking in
+    # uncompressed archives
+    Tar = tarfile.open(Archive,'r:*')
+
+    Found = False
+    for Member in Tar:
+        if not Member.isfile(): continue
+        if Pattern:
+            if not MatchMember(Member.name,Pattern): continue
+        elif not LogName(Member.name).endswith('.log'):
+            continue
+        Found = True
+
+        # titles are made from the member names as if they were extracted
+        File, _ = OpenMember(Tar,Member)
+        Log = ParseLog(Member.name,File)
+        if 'Profile' in Log:
+            Profile.Files[Archive+':'+Member.name] = Log.pop('Profile')
+        yield Log
+
+    Tar.close()
+
+    if not Found:
+        print('Warning! No logs found in '+Archive+(':'+Pattern if Pattern else ''))
+
+def MatchMember(Name,Pattern):
+    """Match a member name with a glob directory by directory, * and ? not matching /."""
+
+    import fnmatch
+
+    Names    = Name.split('/')
+    Patterns = Pattern.split('/')
+    if len(Names) != len(Patterns):
+        return False
+
+    for Name, Pattern in zip(Names,Patterns):
+        if not fnmatch.fnmatchcase(Name,Pattern):
+            return False
+
+    return True
 
-    # ... read properties ...
-    if FiniteField:
+def WorkerOptions():
+    """Collect the settings a worker process needs to parse logs."""
 
-        File.seek(0)
+    return { 'OutFormat'     : State.OutFormat,
+             'EnUnits'       : State.EnUnits,
+             'PrUnits'       : State.PrUnits,
+             'PropertyConFac': State.PropertyConFac,
+             '_TotEn_'       : State._TotEn_,
+             '_Index_'       : State._Index_,
+             'Projection'    : State.Projection,
+             'Profile'       : Profile is not None }
 
-        # ... energies in field ...
+def InitWorker(Options):
+    """Set up a worker process."""
+
+    ImportNumpy()
+    Options = dict(Options)
+    Profiling = Options.pop('Profile')
+    State.Update(Options)
+    if Profiling:
+        globals()['Profile'] = PROFILER()
+
+def ParseLog(LogFile,File=None):
+    """Parse a log into a self-contained result."""
+
+    Log = NewLog()
+
+    ParseFile(LogFile,Log['OrdLabel'],Log['TitleLen'],Log['Energies'],Log['Properties'],Log['TotEnergies'],File)
+
+    Log['Preamble'] = SavePreamble()
+
+    # stages of a log parsed in a worker go back with its results
+    if Profile:
+        Log['Profile'] = Profile.Files.pop(LogFile)
+
+    return Log
+
+def NewLog():
+    """Empty results of a single log."""
+
+    return { 'OrdLabel'   : SetLabels(),
+             'TitleLen'   : [],
+             'Energies'   : {},
+             'Properties' : {},
+             'TotEnergies': {} }
+
+def SavePreamble():
+    """
+    Run type set by the preamble of the current log.
+
+        The tables of the sections left out by --sections are not
+        written, so the run type is narrowed to those parsed; the field
+        energies and the properties of a finite field run are then told
+        apart by FiniteField and FieldProperties.
+    """
+
+    Sections = State.Projection['Sections']
+
+    return { 'MpLevel'        : State.MpLevel,
+             'CcLevel'        : State.CcLevel,
+             'Monomers'       : State.Monomers,
+             'Systems'        : State.Systems,
+             'Composition'    : State.Composition,
+             'ManyBody'       : State.ManyBody and 'mnb' in Sections,
+             'FiniteField'    : State.FiniteField and 'fields' in Sections,
+             'FieldProperties': State.FiniteField and 'properties' in Sections }
+
+def MergeLog(Log,OldLabel,TitleLen,Energies,Properties,TotEnergies):
+    """Merge results of a single log."""
+
+    # the preamble of the last log sets the run type
+    State.Update(Log['Preamble'])
+
+    TitleLen.extend(Log['TitleLen'])
+    for Title in Log['Energies']:
+        Energies.Add(Title,Log['Energies'][Title],State.Composition)
+    for Title in Log['Properties']:
+        Properties.Add(Title,Log['Properties'][Title])
+    TotEnergies.update(Log['TotEnergies'])
+
+    return SaveLabels(Log['OrdLabel'],OldLabel)
+
+#----------------------------------------------------------------------------
+# Follow logs being written
+#----------------------------------------------------------------------------
+def WatchLogs(LogFiles,Interval):
+    """Follow the logs until done, writing the tables on each update."""
+
+    Tails = [LOG_TAIL(LogFile) for LogFile in LogFiles]
+
+    try:
         while 1:
-            line = File.readline()
-            if line == '': break
-            if line.find('APPLIED FIELD') !=-1:
-                FirstLine = line
-                line = line.split()
+            Updated = False
+            for Tail in Tails:
+                if not Tail.Finished:
+                    Updated = Tail.Poll() or Updated
+
+            if Updated:
+                WriteSnapshot([Tail.Log for Tail in Tails if Tail.Ready()])
+
+            if all([Tail.Finished for Tail in Tails]): break
+            time.sleep(Interval)
+    except KeyboardInterrupt:
+        pass
+
+    for Tail in Tails:
+        Tail.Close()
+
+    return [Tail.Log for Tail in Tails if Tail.Ready()]
+
+def WriteSnapshot(Logs):
+    """Write the tables for the results read so far."""
+
+    if not Logs: return
+
+    Energies    = ENERGY_STORE()
+    Properties  = PROPERTY_STORE()
+    TotEnergies = {}
+    TitleLen    = [25]
+    OldLabel    = SetLabels()
+
+    for Log in Logs:
+        Labels = MergeLog(Log,OldLabel,TitleLen,Energies,Properties,TotEnergies)
+
+    WriteTables(Labels,TitleLen,Energies,Properties)
+
+class FOLLOWED_FILE:
+    """Text view of a growing file returning complete lines only"""
+
+    def __init__(self,Name):
+        self.File   = open(Name,'rb')
+        self.Offset = 0
+        self.Start  = 0
+
+    def readline(self):
+        line = self.File.readline()
+        if not line.endswith(b'\n'):
+            # the line is still being written
+            self.File.seek(self.Offset)
+            return ''
+        self.Start   = self.Offset
+        self.Offset += len(line)
+        return line.decode('ascii','replace')
+
+    def tell(self):
+        return self.Offset
+
+    def seek(self,Offset):
+        self.File.seek(Offset)
+        self.Offset = Offset
+
+    def close(self):
+        self.File.close()
+
+class LOG_TAIL:
+    """Log parsed section by section while it is being written"""
+
+    def __init__(self,LogFile):
+        self.LogFile  = LogFile
+        self.File     = None
+        self.Parser   = None
+        self.Finished = False
+        self.Log      = NewLog()
+
+    def Ready(self):
+        """Check if the field free energy terms are all read."""
+        return self.Parser is not None and self.Parser.SubBlocks <= 0
+
+    def Poll(self):
+        """Read the sections completed since the last poll."""
+
+        if self.File is None:
+            if not os.path.exists(self.LogFile): return False
+            self.File = FOLLOWED_FILE(self.LogFile)
+
+        Log = self.Log
+
+        if self.Parser is None:
+            try:
+                self.Parser = StartParser(self.File,self.LogFile,Log['OrdLabel'],Log['TitleLen'],
+                                          Log['Energies'],Log['Properties'],Log['TotEnergies'],True)
+            except (IndexError, ValueError):
+                # the preamble is not complete yet
+                self.File.seek(0)
+                return False
+            Log['Preamble'] = SavePreamble()
+            Offset = -1
+        else:
+            State.Update(Log['Preamble'])
+            Offset = self.File.tell()
 
-                # ... set field label ...
-                Field = (float(line[-3]), float(line[-2]), float(line[-1]))
-                if (Field not in Energies[Title]) and OrdLabel['FieldLabel'].count(Field) == 0 :
-                    OrdLabel['FieldLabel'].append(Field)
-                    Energies[Title][Field]={}
-
-                # ... read energies of subsystems ...
-                #for i in range(Systems-Monomers):
-                #    print Energies
-                #    ReadSubEnergies(File,'',OrdLabel['SubLabel'],Energies[Title][Field])
-                #    if MpLevel == 2 or (CcLevel and CcLevel.upper() != 'NONE'):
-                #        ReadSubEnergies(File,'(CORR)',OrdLabel['SubLabel'],Energies[Title][Field])
-               
-                # ... read many-body partitioning ...
-                File.seek(0)
-                FindLine(File, FirstLine)                    
-
-                if ManyBody:
-                    ReadMnbEnergies(File,OrdLabel['MnbLabel'],Energies[Title][Field],1)
-                else:
-                    ReadFldEnergies(File,OrdLabel['MnbLabel'],Energies[Title][Field],1)
+        for Key, line in ScanSections(self.File,self.Parser.Wanted()):
+            Start = self.File.Start
+            try:
+                self.Parser.Read(self.File,Key,line)
+            except EOFError:
+                # read the whole section again on the next poll
+                self.File.seek(Start)
+                break
+            if self.Parser.Done():
+                self.Finished = True
+                break
 
-        # ... FEDS properties ...
-        Properties[Title] = {}
-        ReadProperties(File,OrdLabel,Properties[Title])
+        self.Parser.Close()
 
-    # ... Total energies
-    if _TotEn_:
-        TotEnergies[Title] = {}
-        ReadTotEnergies(File,TotOutFile,TotEnergies[Title])
+        return self.File.tell() != Offset
 
-    # ... and close
-    File.close()
+    def Close(self):
+        if self.File is not None:
+            self.File.close()
 
 #----------------------------------------------------------------------------
-# Set Label
+# Cache of parse results
 #----------------------------------------------------------------------------
-def SetLabels():
-    """Reset labels"""
+class PARSE_CACHE:
+    """On-disk cache of parse results keyed by log fingerprints"""
+
+    # bytes of a log hashed at a time
+    Block = 1024**2
+
+    # layout of the cached results, bumped when they change
+    Version = 5
+
+    def __init__(self,Dir,Size):
+        self.Dir  = Dir
+        self.Size = Size * 1024**2
+        if not os.path.isdir(Dir):
+            os.makedirs(Dir)
+
+        # parse results depend also on these settings
+        self.Tag = repr((self.Version,) + ResultTag())
+
+    def Entry(self,LogFile):
+        """Name of the cache entry of a log."""
+        Key = repr((os.path.abspath(LogFile), LogFile, self.Tag))
+        return os.path.join(self.Dir, hashlib.sha1(Key.encode()).hexdigest() + '.pkl')
+
+    def Fingerprint(self,LogFile):
+        """Size, modification time and hash of the whole log."""
+        Stat = os.stat(LogFile)
+        Hash = hashlib.sha1()
+        with open(LogFile,'rb') as File:
+            Data = File.read(self.Block)
+            while Data:
+                Hash.update(Data)
+                Data = File.read(self.Block)
+        return (Stat.st_size, Stat.st_mtime_ns, Hash.hexdigest())
+
+    def Load(self,LogFile):
+        """Return cached results of a log or None if it has to be parsed."""
+        Entry = self.Entry(LogFile)
+        try:
+            CacheFile = open(Entry,'rb')
+            Stamp, Log = pickle.load(CacheFile)
+            CacheFile.close()
+        except Exception:
+            return None
+
+        if Stamp != self.Fingerprint(LogFile):
+            os.remove(Entry)
+            return None
+
+        # mark as recently used
+        os.utime(Entry)
+        return Log
+
+    def Save(self,LogFile,Log):
+        """Store results of a log."""
+        Entry = self.Entry(LogFile)
+        try:
+            CacheFile = open(Entry+'.tmp','wb')
+            pickle.dump((self.Fingerprint(LogFile), Log), CacheFile, pickle.HIGHEST_PROTOCOL)
+            CacheFile.close()
+            os.replace(Entry+'.tmp',Entry)
+        except IOError:
+            pass
+
+    def Evict(self):
+        """Remove least recently used entries above the size limit."""
+        Entries = []
+        for Name in os.listdir(self.Dir):
+            if Name.endswith('.pkl'):
+                Stat = os.stat(os.path.join(self.Dir,Name))
+                Entries.append((Stat.st_mtime, Stat.st_size, Name))
+
+        Entries.sort()
+        Total = sum([Entry[1] for Entry in Entries])
+
+        while Entries and Total > self.Size:
+            Time, Size, Name = Entries.pop(0)
+            os.remove(os.path.join(self.Dir,Name))
+            Total -= Size
+
+def ResultTag():
+    """Settings of the session parse results depend on."""
+    return (State.OutFormat, State._TotEn_,
+            [(Key, State.PrUnits[Key]) for Key in sorted(State.PrUnits)],
+            sorted(State.Projection.items()))
 
-    OrdLabel = { 'SubLabel': [],
-                 'MnbLabel': [],
-                 'FieldLabel': [],
-                 'TotPropLabel': [],
-                 'IntPropLabel': [],
-                 'SumPropLabel': [],
-                 'ExcPropLabel': [] }
+#----------------------------------------------------------------------------
+# Profiling
+#----------------------------------------------------------------------------
+def ProfileStage(Name,File=None):
+    """Context timing a stage with --profile and doing nothing otherwise."""
 
-    return OrdLabel
+    if Profile is None:
+        return contextlib.nullcontext()
+    return PROFILE_STAGE(Profile,Name,File)
 
-def SaveLabels(OrdLabel,OldLabel):
-    """Set labels"""
+class PROFILER:
+    """Wall time, bytes read and peak memory of the stages of each log
 
-    for LabelType in list(OrdLabel.keys()):
-        if len(OrdLabel[LabelType]) > len(OldLabel[LabelType]):
-            OldLabel[LabelType] = OrdLabel[LabelType]
+    Stages of a log are added to its entry in Files, the others (formatting
+    and writing) to Stages. The time between the sections read is kept as
+    the 'scan' stage of a log. Peak memory is the largest growth of the
+    memory allocated by python during a single run of a stage, traced with
+    tracemalloc, which also slows the run down.
+    """
+
+    def __init__(self):
+        import tracemalloc
+        self.Trace   = tracemalloc
+        self.Files   = {}
+        self.Stages  = {}
+        self.Current = None
+        self.Start   = time.perf_counter()
+        tracemalloc.start()
+
+    def Open(self,LogFile):
+        """Add the following stages to a log."""
+        self.Current = self.Files[LogFile] = {}
+        self.Opened  = time.perf_counter()
+
+    def Close(self,File,Indexed):
+        """Stop adding stages to the log, keeping the rest as the scan."""
+        Stages = self.Current
+        Scan   = self.Record(Stages,'scan')
+        Scan['time']  = time.perf_counter()-self.Opened
+        Scan['calls'] = 1
+        # an index jumps over the lines between the sections
+        if not Indexed:
+            Scan['bytes'] = FileOffset(File)
+        for Name in Stages:
+            if Name != 'scan':
+                Scan['time']  -= Stages[Name]['time']
+                Scan['bytes'] -= Stages[Name]['bytes'] if not Indexed else 0
+        self.Current = None
+
+    def Record(self,Stages,Name):
+        if Name not in Stages:
+            Stages[Name] = {'time': 0.0, 'calls': 0, 'bytes': 0, 'peak': 0}
+        return Stages[Name]
+
+    def Add(self,Name,Time,Bytes,Peak):
+        """Add a run of a stage."""
+        if self.Current is None:
+            Stage = self.Record(self.Stages,Name)
         else:
-            OrdLabel[LabelType] = OldLabel[LabelType]
+            Stage = self.Record(self.Current,Name)
+        Stage['time']  += Time
+        Stage['calls'] += 1
+        Stage['bytes'] += Bytes
+        if Peak > Stage['peak']:
+            Stage['peak'] = Peak
+
+    def Summary(self):
+        """Stages of each log and their totals."""
+        import resource
+
+        Totals = {}
+        for Stages in list(self.Files.values())+[self.Stages]:
+            for Name in Stages:
+                Total = self.Record(Totals,Name)
+                for Key in ('time', 'calls', 'bytes'):
+                    Total[Key] += Stages[Name][Key]
+                if Stages[Name]['peak'] > Total['peak']:
+                    Total['peak'] = Stages[Name]['peak']
+
+        Bytes = 0
+        for Name in Totals:
+            Bytes += Totals[Name]['bytes']
+
+        Self     = resource.getrusage(resource.RUSAGE_SELF)
+        Children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        return { 'files' : self.Files,
+                 'stages': Totals,
+                 'total' : { 'time'       : time.perf_counter()-self.Start,
+                             'bytes'      : Bytes,
+                             'peak'       : self.Trace.get_traced_memory()[1],
+                             'maxrss'     : Self.ru_maxrss*1024,
+                             'maxrss_jobs': Children.ru_maxrss*1024 } }
+
+    def Save(self,Name):
+        """Write the summary to a JSON file."""
+        Out = open(Name,'w')
+        json.dump(self.Summary(),Out,indent=1,sort_keys=True)
+        Out.close()
+
+class PROFILE_STAGE:
+    """Single run of a stage"""
+
+    def __init__(self,Profiler,Name,File):
+        self.Profiler = Profiler
+        self.Name     = Name
+        self.File     = File
+
+    def __enter__(self):
+        Trace = self.Profiler.Trace
+        Trace.reset_peak()
+        self.Memory = Trace.get_traced_memory()[0]
+        self.Offset = self.Tell()
+        self.Start  = time.perf_counter()
+
+    def __exit__(self,*Exception):
+        Time  = time.perf_counter()-self.Start
+        Bytes = self.Tell()-self.Offset
+        Peak  = self.Profiler.Trace.get_traced_memory()[1]-self.Memory
+        self.Profiler.Add(self.Name,Time,Bytes,Peak)
+
+    def Tell(self):
+        return FileOffset(self.File) if self.File else 0
+
+def FileOffset(File):
+    """Offset of a log, or 0 for streams of decompressors which cannot tell it."""
 
-    return OrdLabel
+    try:
+        return File.tell()
+    except (IOError, ValueError):
+        return 0
 
 #----------------------------------------------------------------------------
-# Read Properties
+# Parse
 #----------------------------------------------------------------------------
-def ReadProperties(File,OrdLabel,Properties):
-    """Read selected properties for this system."""
+def ParseFile(LogFile,OrdLabel,TitleLen,Energies,Properties,TotEnergies,File=None):
+    """Parse current log file, or a member of an archive opened as File"""
 
-    File.seek(0)
+    ImportNumpy()
 
-    # Read total properties
-    Properties['Total'] = {}
+    # open the current log file ...
+    if File is None:
+        File, Compressed = OpenLog(LogFile)
+        Indexed = State._Index_ and not Compressed
+    else:
+        Indexed = False
 
-    line = FindLine(File,'ELECTRIC PROPERTIES OF SUBSYSTEMS')
-    line = SkipLines(File,1)
+    # the log is closed also when it cannot be parsed
+    try:
+        if Profile:
+            Profile.Open(LogFile)
+
+        # ... parse ...
+        Parser = StartParser(File,LogName(LogFile),OrdLabel,TitleLen,Energies,Properties,TotEnergies)
+
+        # offsets of a compressed log can be reached only by decompressing
+        # all that precedes them, so it is always read in a single pass, as
+        # are members of archives
+        if Indexed:
+            Sections = IndexSections(File,IndexFile(LogFile),Parser.Wanted())
+        else:
+            Sections = ScanSections(File,Parser.Wanted())
+
+        for Key, line in Sections:
+            Parser.Read(File,Key,line)
+            if Parser.Done(): break
+
+        Parser.Close()
+
+        if Profile:
+            Profile.Close(File,Indexed)
+
+    # ... and close
+    finally:
+        File.close()
+
+# Compressed logs are recognized by their leading bytes
+Decompressors = [
+    (b'\x1f\x8b',         'gzip'),
+    (b'BZh',              'bz2'),
+    (b'\xfd7zXZ\x00',     'lzma'),
+    (b'\x28\xb5\x2f\xfd', 'zstd') ]
+
+CompressedSuffixes = ['.gz', '.bz2', '.xz', '.zst']
 
-    #for i in range(4*Monomers+5*(Systems-Monomers-1)):
-    #    line = FindLine(File,'BASED RESULTS')
-    #for i in range(5):
-    #    ReadTotalProperty(File,OrdLabel['TotPropLabel'],Properties['Total'])
+def OpenLog(LogFile):
+    """Open a log as text, decompressing it while it is read.
+
+    Returns the file and whether the log is compressed. Logs compressed
+    with gzip, bzip2 or xz are read with the standard library and those
+    compressed with zstd need the zstandard package (or python 3.14).
+    No temporary files are written.
+    """
+
+    Raw    = open(LogFile,'rb')
+    Module = Decompressor(Raw.read(6))
+    Raw.close()
+
+    if Module is None:
+        return open(LogFile,'r'), False
+    return Module.open(LogFile,'rt'), True
+
+def OpenMember(Archive,Member):
+    """Open a member of a tar archive, like OpenLog."""
+
+    Raw    = Archive.extractfile(Member)
+    Module = Decompressor(Raw.peek(6)[:6])
+
+    if Module is None:
+        return io.TextIOWrapper(Raw), False
+    return Module.open(Raw,'rt'), True
+
+def Decompressor(Magic):
+    """Module opening logs starting with the given bytes, None if not compressed."""
+
+    for Prefix, Module in Decompressors:
+        if Magic.startswith(Prefix): break
+    else:
+        return None
+
+    if Module != 'zstd':
+        return __import__(Module)
+
+    try:
+        from compression import zstd
+    except ImportError:
+        try:
+            import zstandard as zstd
+        except ImportError:
+            raise IOError('zstandard package is needed to read zstd compressed logs')
+    return zstd
+
+def LogName(LogFile):
+    """Name of a log without the suffix of its compression."""
+
+    for Suffix in CompressedSuffixes:
+        if LogFile.endswith(Suffix):
+            return LogFile[:-len(Suffix)]
+    return LogFile
+
+def StartParser(File,LogFile,OrdLabel,TitleLen,Energies,Properties,TotEnergies,Follow=False):
+    """Read the preamble and set up the parser of the sections."""
+
+    with ProfileStage('preamble',File):
+        Title = ReadPreamble(File,LogFile)
+    TitleLen.append(len(FileName(Title))+1)
+
+    Energies[Title] = {}
+    Energies[Title][(0,0,0)] = {}
+
+    Sections = State.Projection['Sections']
+
+    if State.FiniteField and 'properties' in Sections:
+        Properties[Title] = {}
+
+    if State._TotEn_ and 'totals' in Sections:
+        TotEnergies[Title] = {}
+
+    # ... send each section of the log to its reader in a single pass ...
+    return LOG_PARSER(OrdLabel,Energies[Title],Properties.get(Title),TotEnergies.get(Title),Follow)
+
+#----------------------------------------------------------------------------
+# Sections of the log
+#----------------------------------------------------------------------------
+
+# Section markers; a line is tested against all of them at once
+SectionMarkers = {
+    'MANY BODY INTERACTION ENERGY TERMS'   : 'Mnb',
+    '  INTERACTION ENERGY TERMS'           : 'Sub',
+    'APPLIED FIELD'                        : 'Field',
+    'ELECTRIC PROPERTIES OF SUBSYSTEMS'    : 'Total',
+    '  INTERACTION INDUCED PROPERTIES'     : 'Interaction',
+    'SUM OF INTERACTION INDUCED PROPERTIES': 'SumInteraction',
+    'EXCESS PROPERTIES'                    : 'Excess',
+    'TOTAL SCF ENERGIES'                   : 'SCF',
+    'MP2 E(2) CORRECTIONS'                 : 'MP2',
+    'CC CORRELATION ENERGY E(  CCSD(TQ))'  : 'CCSDTQ' }
+
+# Stages of --profile the sections belong to
+SectionStages = {
+    'Sub'           : 'sub-energies',
+    'Mnb'           : 'many-body',
+    'Field'         : 'field energies',
+    'Total'         : 'properties',
+    'Interaction'   : 'properties',
+    'SumInteraction': 'properties',
+    'Excess'        : 'properties',
+    'SCF'           : 'total energies',
+    'MP2'           : 'total energies',
+    'CCSDTQ'        : 'total energies' }
+
+SectionPattern = re.compile('|'.join([re.escape(Marker) for Marker in SectionMarkers]))
+
+def ScanSections(File,Keys=None):
+    """Yield the key and header line of every section marker, or of those of the given keys."""
+
+    Search = SectionPattern.search
+
+    if Keys is not None:
+        Keys = set(Keys)
 
     while 1:
         line = File.readline()
         if line == '': break
-        if line.find(30*'=') !=-1: break
-        if line.find('BASED RESULTS') !=-1:
-            ReadTotalProperty(File,line,OrdLabel['TotPropLabel'],Properties['Total'])
 
-    # Read interaction induced properties
-    Properties['Interaction'] = {}
+        # most lines fail this cheap test for words found in all markers
+        if 'ENERG' in line or 'PROPERT' in line or 'APPLIED' in line or 'E(2)' in line:
+            Match = Search(line)
+            if Match:
+                Key = SectionMarkers[Match.group()]
+                if Keys is None or Key in Keys:
+                    yield Key, line
 
-    line = FindLine(File,'  INTERACTION INDUCED PROPERTIES')
-    line = SkipLines(File,1)
+def IndexSections(File,Index,Keys):
+    """Yield the key and header line of the wanted indexed sections."""
 
-    while 1:
+    End = File.tell()
+
+    for Offset, Key in Index:
+        # skip sections already read as a part of another one
+        if Key not in Keys or Offset < End: continue
+
+        File.seek(Offset)
         line = File.readline()
-        if line == '': break
-        if line.find(30*'=') !=-1: break
-        if line.find('BASED RESULTS') !=-1:
-            ReadInteractionProperty(File,line,OrdLabel['IntPropLabel'],Properties['Interaction'])
+        yield Key, line
+        End = File.tell()
 
-    # Read sum of interaction induced properties
-    Properties['SumInteraction'] = {}
+def IndexFile(LogFile):
+    """Return byte offsets of the section markers of a log.
 
-    line = FindLine(File,'SUM OF INTERACTION INDUCED PROPERTIES')
-    line = SkipLines(File,1)
+    The offsets are kept in a sidecar index file next to the log and
+    the log is scanned only if the index is missing or out of date.
+    """
+
+    IndexName = LogFile + '.idx'
+    Stat      = os.stat(LogFile)
+    Stamp     = '# geds section index %d %d\n' % (Stat.st_size, Stat.st_mtime_ns)
+
+    try:
+        IdxFile = open(IndexName,'r')
+        if IdxFile.readline() == Stamp:
+            Index = []
+            for line in IdxFile:
+                line = line.split()
+                Index.append((int(line[0]), line[1]))
+            IdxFile.close()
+            return Index
+        IdxFile.close()
+    except (IOError, ValueError, IndexError):
+        pass
+
+    Index = ScanIndex(LogFile)
+
+    try:
+        IdxFile = open(IndexName,'w')
+        IdxFile.write(Stamp)
+        for Offset, Key in Index:
+            IdxFile.write('%d %s\n' % (Offset, Key))
+        IdxFile.close()
+    except IOError:
+        pass
+
+    return Index
+
+def ScanIndex(LogFile):
+    """Find byte offsets of all section marker lines in a memory mapped log."""
+
+    File = open(LogFile,'rb')
+
+    if os.fstat(File.fileno()).st_size == 0:
+        File.close()
+        return []
+
+    Map   = mmap.mmap(File.fileno(),0,access=mmap.ACCESS_READ)
+    Lines = {}
+
+    # each marker is searched for over the whole map at C speed, which
+    # is an order of magnitude faster than a regex alternation
+    for Marker in SectionMarkers:
+        Marker = Marker.encode()
+        Offset = Map.find(Marker)
+        while Offset != -1:
+            Start = Map.rfind(b'\n',0,Offset)+1
+            Lines[Start] = 1
+            Offset = Map.find(Marker,Offset+len(Marker))
+
+    # classify the lines the same way ScanSections does
+    Index = []
+    for Start in sorted(Lines):
+        End  = Map.find(b'\n',Start)
+        line = Map[Start:End if End != -1 else len(Map)].decode('ascii','replace')
+        Index.append((Start, SectionMarkers[SectionPattern.search(line).group()]))
+
+    Map.close()
+    File.close()
+
+    return Index
+
+def ReadSection(File,Skip,EndSection,Find=None):
+    """Read the body of a section into memory."""
+
+    Lines = []
+
+    if Find:
+        while 1:
+            line = File.readline()
+            if line == '': break
+            Lines.append(line)
+            if line.find(Find) !=-1: break
+
+    for i in range(Skip):
+        line = File.readline()
+        if line == '': break
+        Lines.append(line)
+
+    Complete = False
 
     while 1:
         line = File.readline()
         if line == '': break
-        if line.find(30*'=') !=-1: break
-        if line.find('BASED RESULTS') !=-1:
-            ReadInteractionProperty(File,line,OrdLabel['SumPropLabel'],Properties['SumInteraction'])
+        Lines.append(line)
+        if EndSection(line):
+            Complete = True
+            break
 
-    # Read excess properties
-    Properties['Excess'] = {}
+    return io.StringIO(''.join(Lines)), Complete
 
-    line = FindLine(File,'EXCESS PROPERTIES')
-    line = SkipLines(File,1)
+def EndEnergies(line):
+    return line.find(20*'-') !=-1
 
-    #for i in range(5*(Systems-Monomers-1)):
-    #    line = FindLine(File,'BASED RESULTS')
-    #for i in range(5):
-    #    ReadTotalProperty(File,OrdLabel['ExcPropLabel'],Properties['Excess'])
+def EndProperties(line):
+    return line.find(30*'=') !=-1
+
+def EndTotEnergies(line):
+    return line.strip() == '' or line.find(10*'-') !=-1
+
+class LOG_PARSER:
+    """
+    Single pass state machine dispatching sections to their readers
+
+        Only the sections kept by --sections are read, the others being
+        skipped unread, and the parser is done once the last of them is.
+        The lines of the skipped sections still go through the marker
+        test of ScanSections, unless the log is indexed (-i).
+    """
+
+    def __init__(self,OrdLabel,Energies,Properties,TotEnergies,Follow=False):
+        self.Follow      = Follow
+        self.OrdLabel    = OrdLabel
+        self.Energies    = Energies
+        self.Properties  = Properties
+        self.TotEnergies = TotEnergies
+
+        # run type of the log, which the saved preamble narrows to the
+        # sections kept
+        self.ManyBody    = State.ManyBody
+        self.FiniteField = State.FiniteField
+
+        Sections    = State.Projection['Sections']
+        self.Fields = self.FiniteField and 'fields' in Sections
+
+        self.Corr   = State.MpLevel == 2 or (State.CcLevel and State.CcLevel.upper() != 'NONE')
+        self.CcTQ   = State.CcLevel and State.CcLevel.upper().count('CCSD(TQ') >= 1
+
+        # field free energies of subsystems come first, the HF and
+        # correlated blocks being interleaved
+        self.SubBlocks = 0
+        if 'sub' in Sections:
+            self.SubBlocks = State.Systems-State.Monomers
+        if self.Corr:
+            self.SubBlocks *= 2
+
+        # field free many-body terms are taken from the final summary
+        self.MnbBlock = 0
+        self.MnbSeek  = 0
+        if 'mnb' in Sections:
+            self.MnbSeek = 3 if self.Corr else 2
+        self.MnbFree  = {}
+
+        # field waiting for its energy terms, the fields ending where
+        # the properties begin
+        self.Field     = None
+        self.FieldsEnd = False
+
+        # property sections are read in this order
+        self.PropSteps = []
+        if self.Properties is not None:
+            self.PropSteps = ['Total', 'Interaction', 'SumInteraction', 'Excess']
+            for PropType in self.PropSteps:
+                self.Properties[PropType] = {}
+
+        # total energies of the field free run go first
+        self.TotSteps = []
+        if self.TotEnergies is not None:
+            self.TotSteps = self.TotEnSteps((0,0,0))
+
+        self.Readers = {
+            'Sub'           : self.ReadSub,
+            'Mnb'           : self.ReadMnb,
+            'Field'         : self.ReadField,
+            'Total'         : self.ReadProp,
+            'Interaction'   : self.ReadProp,
+            'SumInteraction': self.ReadProp,
+            'Excess'        : self.ReadProp,
+            'SCF'           : self.ReadTot,
+            'MP2'           : self.ReadTot,
+            'CCSDTQ'        : self.ReadTot }
+
+    def Wanted(self):
+        """Keys of sections read for this log."""
+        Keys = []
+        # field energies are read from the subsystem or many-body blocks
+        if self.SubBlocks or (self.Fields and not self.ManyBody):
+            Keys.append('Sub')
+        if self.ManyBody and (self.MnbSeek or self.Fields):
+            Keys.append('Mnb')
+        if self.WaitFields():
+            Keys.append('Field')
+        if self.WaitFields() or self.PropSteps:
+            Keys.extend(['Total', 'Interaction', 'SumInteraction', 'Excess'])
+        if self.TotEnergies is not None:
+            Keys.extend(['SCF', 'MP2', 'CCSDTQ'])
+        return Keys
+
+    def WaitFields(self):
+        """Check if the energies or total energies of the fields are read."""
+        return self.FiniteField and (self.Fields or self.TotEnergies is not None)
+
+    def Read(self,File,Key,line):
+        """Read the section starting at line."""
+        Stage = SectionStages[Key]
+        if self.Field is not None and Key in ('Sub', 'Mnb'):
+            Stage = 'field energies'
+        with ProfileStage(Stage,File):
+            self.Readers[Key](File,Key,line)
+
+    def Section(self,File,line,Skip,EndSection,Find=None):
+        """Read a section, making sure the log holds all of it."""
+        Section, Complete = ReadSection(File,Skip,EndSection,Find)
+        if not Complete:
+            # the rest of the section is yet to be written
+            if self.Follow:
+                raise EOFError
+            print('Warning! Log ends inside the section: '+line.strip())
+        return Section
+
+    def Done(self):
+        """Check if the rest of the log can be skipped."""
+        if self.SubBlocks > 0 or self.Field is not None or self.TotSteps:
+            return False
+        if self.ManyBody and self.MnbBlock < self.MnbSeek:
+            return False
+        # properties are printed after all the fields
+        if self.WaitFields() and not self.FieldsEnd:
+            return False
+        if self.PropSteps:
+            return False
+        return True
+
+    def Close(self):
+        """Merge the field free many-body terms."""
+        for EnLabel in self.MnbFree:
+            if EnLabel not in self.Energies[(0,0,0)]:
+                self.Energies[(0,0,0)][EnLabel] = self.MnbFree[EnLabel]
+
+    def TotEnSteps(self,Field):
+        Steps = [('SCF',Field)]
+        if self.Corr:
+            Steps.append(('MP2',Field))
+        if self.CcTQ:
+            Steps.append(('CCSDTQ',Field))
+        self.TotEnergies.setdefault(Field,{})
+        return Steps
+
+    def ReadSub(self,File,Key,line):
+        Sub   = self.SubBlocks > 0
+        Field = self.Field if self.Fields and not self.ManyBody else None
+
+        Kept = False
+        if Sub:
+            if self.Corr and self.SubBlocks % 2 == 1:
+                CorrLabel = '(CORR)'
+            else:
+                CorrLabel = ''
+            # blocks of the subsystems left out are skipped unread
+            Kept = KeptSystem(re.split(r'\D+',line)[2])
+
+        # the block is counted only once it is read whole, since under -w
+        # it is read again when the log ends inside it
+        if Kept or Field:
+            Section = self.Section(File,line,4,EndEnergies)
+
+        if Sub:
+            self.SubBlocks -= 1
+
+        if Kept:
+            ReadSubEnergies(Section,line,CorrLabel,self.OrdLabel['SubLabel'],self.Energies[(0,0,0)])
+
+        if Field:
+            Section.seek(0)
+            self.Field = None
+            ReadFldEnergies(Section,line,self.OrdLabel['MnbLabel'],self.Energies[Field])
+
+    def ReadMnb(self,File,Key,line):
+        if not self.ManyBody: return
+
+        Free  = self.MnbBlock+1 == self.MnbSeek
+        Field = self.Field if self.Fields else None
+
+        if Free or Field:
+            Section = self.Section(File,line,4,EndEnergies)
+
+        self.MnbBlock += 1
+
+        if not (Free or Field): return
+
+        if Free:
+            ReadMnbEnergies(Section,line,self.OrdLabel['MnbLabel'],self.MnbFree)
+
+        if Field:
+            Section.seek(0)
+            self.Field = None
+            ReadMnbEnergies(Section,line,self.OrdLabel['MnbLabel'],self.Energies[Field])
+
+    def ReadField(self,File,Key,line):
+        if not self.FiniteField: return
+
+        # ... set field label ...
+        line  = line.split()
+        Field = (float(line[-3]), float(line[-2]), float(line[-1]))
+
+        # fields left out are skipped with their energies
+        if not KeptField(Field): return
+
+        if self.Fields and self.Field is None:
+            self.Field = Field
+            if Field not in self.Energies:
+                self.Energies[Field] = {}
+            self.OrdLabel['FieldLabel'].Add(Field)
+
+        if self.TotEnergies is not None and not self.TotSteps:
+            self.TotSteps = self.TotEnSteps(Field)
+
+    def ReadProp(self,File,Key,line):
+        self.FieldsEnd = True
+
+        if not self.PropSteps or self.PropSteps[0] != Key: return
+
+        Section = self.Section(File,line,1,EndProperties)
+        self.PropSteps.pop(0)
+
+        if Key == 'Total':
+            ReadProperties(Section,ReadTotalProperty,self.OrdLabel['TotPropLabel'],self.Properties[Key])
+        elif Key == 'Interaction':
+            ReadProperties(Section,ReadInteractionProperty,self.OrdLabel['IntPropLabel'],self.Properties[Key])
+        elif Key == 'SumInteraction':
+            ReadProperties(Section,ReadInteractionProperty,self.OrdLabel['SumPropLabel'],self.Properties[Key])
+        else:
+            ReadProperties(Section,ReadTotalProperty,self.OrdLabel['ExcPropLabel'],self.Properties[Key])
+
+    def ReadTot(self,File,Key,line):
+        if not self.TotSteps or self.TotSteps[0][0] != Key: return
+
+        Field = self.TotSteps[0][1]
+
+        if Key == 'SCF' and Field != (0,0,0):
+            Section = self.Section(File,line,1,EndTotEnergies,'FREE ENERGIES')
+            FindLine(Section,'FREE ENERGIES')
+            SkipLines(Section,1)
+        else:
+            Section = self.Section(File,line,2,EndTotEnergies)
+            SkipLines(Section,2)
+
+        self.TotSteps.pop(0)
+
+        ReadTotEn(Section,self.TotEnergies[Field],Key)
+
+#----------------------------------------------------------------------------
+# Projection of the sections and terms
+#----------------------------------------------------------------------------
+
+# Sections of --sections
+ProjectedSections = ['sub', 'mnb', 'fields', 'properties', 'totals']
+
+def SetProjection(Options=None):
+    """
+    Sections and terms kept, from the lists of --sections, --terms,
+    --systems, --fields and --labels.
+
+        Empty lists keep everything. The subsystems are kept by their
+        numbers, the whole complex as 'complex', and the fields by the
+        indices of their axes and their strengths.
+    """
+
+    Options = Options or {}
+
+    Sections = []
+    for Section in Options.get('sections',[]):
+        if Section.lower() not in ProjectedSections:
+            raise ValueError('Unknown section: '+Section)
+        Sections.append(Section.lower())
+
+    Systems = []
+    for System in Options.get('systems',[]):
+        System = str(System)
+        if System.lower() == 'complex':
+            Systems.append('complex')
+        elif System.isdigit():
+            Systems.append(int(System))
+        else:
+            raise ValueError('Unknown subsystem: '+System)
+
+    Axes      = []
+    Strengths = []
+    for Field in Options.get('fields',[]):
+        if str(Field).lower() in ('x', 'y', 'z'):
+            Axes.append('xyz'.index(Field.lower()))
+            continue
+        try:
+            Strengths.append(abs(float(Field)))
+        except ValueError:
+            raise ValueError('Unknown field: '+Field)
+
+    return { 'Sections' : tuple([Section for Section in ProjectedSections if Section in Sections or not Sections]),
+             'Terms'    : tuple(Options.get('terms',[])),
+             'Systems'  : tuple(Systems),
+             'Axes'     : tuple(sorted(set(Axes))),
+             'Strengths': tuple(sorted(set(Strengths))),
+             'Labels'   : tuple(Options.get('labels',[])) }
+
+# Labels matched against the globs of --terms and --labels
+KeptLabels = {}
+
+def Kept(Kind,Label):
+    """Check if an energy term (Kind='Terms') or a property label (Kind='Labels') is kept."""
+
+    Patterns = State.Projection[Kind]
+    if not Patterns:
+        return True
+
+    Key = (Patterns, Label)
+    if Key not in KeptLabels:
+        import fnmatch
+        KeptLabels[Key] = any([fnmatch.fnmatchcase(Label,Pattern) for Pattern in Patterns])
+
+    return KeptLabels[Key]
+
+def TermName(EnLabel):
+    """Name of an energy term without the n-body order of a many-body term, e.g. DE(HF) of 'DE(HF) 2-BODY'."""
+
+    Name = EnLabel.split()
+    if len(Name) == 2 and Name[1].endswith('-BODY'):
+        return Name[0]
+    return EnLabel
+
+def KeptSystem(ConfNo):
+    """Check if the subsystem numbered ConfNo is kept."""
+
+    Systems = State.Projection['Systems']
+    if not Systems:
+        return True
+
+    return int(ConfNo) in Systems or ('complex' in Systems and int(ConfNo) == State.Systems)
+
+def KeptField(Field):
+    """Check if a field is kept, the zero field always being."""
+
+    if tuple(Field) == (0,0,0):
+        return True
+
+    Axes      = State.Projection['Axes']
+    Strengths = State.Projection['Strengths']
+
+    if Axes and not [Axis for Axis in Axes if Field[Axis] != 0]:
+        return False
+
+    # the fields are printed with six decimals
+    Strength = max([abs(F) for F in Field])
+    if Strengths and not [Kept for Kept in Strengths if abs(Kept-Strength) < 5e-7]:
+        return False
+
+    return True
+
+#----------------------------------------------------------------------------
+# Set Label
+#----------------------------------------------------------------------------
+def SetLabels():
+    """Reset labels"""
+
+    OrdLabel = { 'SubLabel': LABEL_REGISTRY(),
+                 'MnbLabel': LABEL_REGISTRY(),
+                 'FieldLabel': LABEL_REGISTRY(Text=False),
+                 'TotPropLabel': LABEL_REGISTRY(),
+                 'IntPropLabel': LABEL_REGISTRY(),
+                 'SumPropLabel': LABEL_REGISTRY(),
+                 'ExcPropLabel': LABEL_REGISTRY() }
+
+    return OrdLabel
+
+def SaveLabels(OrdLabel,OldLabel):
+    """Merge the labels of a log into those of all logs"""
+
+    for LabelType in list(OrdLabel.keys()):
+        OldLabel[LabelType].Merge(OrdLabel[LabelType])
+
+    return OldLabel
+
+def LabelWidths(OrdLabel):
+    """
+    Widths of the energy and property columns.
+
+        The widths are those of the longest labels, as printed in tex when
+        selected, or the least widths of the units if these are wider.
+    """
+
+    EnLabLen = State.EnUnits['LabLen']
+    PrLabLen = State.PrUnits['LabLen']
+    TexLen   = 0
+
+    for LabelType in OrdLabel:
+        Labels = OrdLabel[LabelType]
+        if LabelType in ('SubLabel', 'MnbLabel'):
+            EnLabLen = Labels.Width if Labels.Width > EnLabLen else EnLabLen
+        elif LabelType != 'FieldLabel':
+            PrLabLen = Labels.Width if Labels.Width > PrLabLen else PrLabLen
+        TexLen = Labels.TexWidth if Labels.TexWidth > TexLen else TexLen
+
+    # tex labels set the widths of both the energy and property tables
+    if State.OutFormat == 'tex':
+        EnLabLen = TexLen if TexLen > EnLabLen else EnLabLen
+        PrLabLen = TexLen if TexLen > PrLabLen else PrLabLen
+
+    return EnLabLen, PrLabLen
+
+class LABEL_REGISTRY(list):
+    """
+    Labels of one kind in the order they were first seen
+
+        Each label is kept once, with an integer id found by hashing, and
+        the width of the longest label (and of its tex form) is kept up to
+        date as labels are added, so that adding a label costs the same
+        however many there are. Text=False keeps labels which are not
+        printed as such, e.g. fields.
+    """
+
+    def __init__(self,Labels=(),Text=True):
+        list.__init__(self)
+        self.Ids      = {}
+        self.Text     = Text
+        self.Width    = 0
+        self.TexWidth = 0
+        for Label in Labels:
+            self.Add(Label)
+
+    def __contains__(self,Label):
+        return Label in self.Ids
+
+    def Add(self,Label):
+        """Id of a label, adding the label if new."""
+
+        if Label in self.Ids:
+            return self.Ids[Label]
+
+        self.Ids[Label] = len(self.Ids)
+        self.append(Label)
+
+        if self.Text:
+            if len(Label) > self.Width:
+                self.Width = len(Label)
+            if State.OutFormat == 'tex' and len(TexLabel(Label)) > self.TexWidth:
+                self.TexWidth = len(TexLabel(Label))
+
+        return self.Ids[Label]
+
+    def Merge(self,Other):
+        """
+        Add the labels of another registry.
+
+            A new label goes right after the label preceding it in the
+            other registry, and those preceding all known labels right
+            before the first of them, so the order of the labels of both
+            is kept where they agree; labels of a registry with no known
+            ones go last.
+        """
+
+        # new labels following each known label, or preceding the first
+        After  = {None: []}
+        Anchor = None
+        First  = None
+        for Label in Other:
+            if Label in self.Ids:
+                Anchor = Label
+                First  = First or (Label,)
+                After.setdefault(Anchor,[])
+            else:
+                After[Anchor].append(Label)
+
+        if not [Label for Labels in After.values() for Label in Labels]: return
+
+        Labels = []
+        for Label in self:
+            if First and Label == First[0]:
+                Labels.extend(After[None])
+            Labels.append(Label)
+            Labels.extend(After.get(Label,[]))
+        if not First:
+            Labels.extend(After[None])
+
+        for Label in Labels:
+            if Label not in self.Ids:
+                self.Ids[Label] = len(self.Ids)
+        self[:] = Labels
+
+        if Other.Width > self.Width:
+            self.Width = Other.Width
+        if Other.TexWidth > self.TexWidth:
+            self.TexWidth = Other.TexWidth
+
+#----------------------------------------------------------------------------
+# Read Properties
+#----------------------------------------------------------------------------
+def ReadProperties(File,Reader,OrdLabel,Properties):
+    """Read selected properties from a section of the log."""
+
+    line = SkipLines(File,1)
 
     while 1:
         line = File.readline()
         if line == '': break
         if line.find(30*'=') !=-1: break
         if line.find('BASED RESULTS') !=-1:
-            ReadTotalProperty(File,line,OrdLabel['ExcPropLabel'],Properties['Excess'])
+            Reader(File,line,OrdLabel,Properties)
 
 #----------------------------------------------------------------------------
 # Read Interaction Induced Properties
@@ -333,10 +2183,9 @@ def ReadInteractionProperty(File,line,OrdLabel,Properties):
     else:
         Label = ','.join([Label[0], Label[-2].split('-')[0]])
 
-    OrdLabel.append(Label)
-    PrUnits['LabLen'].append(len(Label))
-    if OutFormat == 'tex':
-        TexLabel(Label)
+    if not Kept('Labels',Label): return
+
+    OrdLabel.Add(Label)
 
     ReadProperty(File,Label,Properties)
 
@@ -355,10 +2204,9 @@ def ReadTotalProperty(File,line,OrdLabel,Properties):
     else:
         Label = ''.join([Label[0], ',', Label[-2], Label[-1]])
 
-    OrdLabel.append(Label)
-    PrUnits['LabLen'].append(len(Label))
-    if OutFormat == 'tex':
-        TexLabel(Label)
+    if not Kept('Labels',Label): return
+
+    OrdLabel.Add(Label)
 
     ReadProperty(File,Label,Properties)
 
@@ -366,7 +2214,13 @@ def ReadTotalProperty(File,line,OrdLabel,Properties):
 # Read property common routine
 #----------------------------------------------------------------------------
 def ReadProperty(File,Label,Properties):
-    """Read selected property."""
+    """
+    Read selected property.
+
+        The tensors are kept in au together with the invariants printed
+        in the log, which are checked against the tensors once all logs
+        are stacked in a PROPERTY_STORE.
+    """
 
     Properties[Label] = {}
 
@@ -375,10 +2229,6 @@ def ReadProperty(File,Label,Properties):
     Mu = array(line.split(),dtype=float64)
     line = SkipLines(File,2)
     Dipole = float(line.split()[1])
-    if abs(sqrt(dot(Mu,Mu))-Dipole) > 1e-5:
-        print('Warning! Large difference in dipole moment'+Label)
-    else:
-        Dipole = sqrt(dot(Mu,Mu))
 
     # Read polarizability tensor
     line = SkipLines(File,2)
@@ -390,18 +2240,10 @@ def ReadProperty(File,Label,Properties):
     # Read average polarizability
     line = SkipLines(File,2)
     AvgPolar = float(line.split()[1])
-    if abs(trace(Alpha)/3.0-AvgPolar) > 1e-4:
-        print('Warning! Large difference in <alpha>'+Label)
-    else:
-        AvgPolar = trace(Alpha)/3.0
 
     # Read polarizability anisotropy (Z is the rotation axis)
     line = SkipLines(File,1)
     AnzPolar = float(line.split()[3])
-    if abs((Alpha[2,2]-Alpha[0,0])-AnzPolar) > 1e-4:
-        print('Warning! Large difference in <alpha,ani>'+Label)
-    else:
-        AnzPolar = Alpha[2,2]-Alpha[0,0]
 
     # Read first hyperpolarizability tensor
     line = SkipLines(File,2)
@@ -414,10 +2256,6 @@ def ReadProperty(File,Label,Properties):
     # (Z is the permament dipole moment direction)
     line = SkipLines(File,2)
     VecFirstHyper = float(line.split()[3])
-    if abs(VecFirstHyper-(3.0/5.0)*Beta.sum(axis=0)[2]) > 1e-4:
-        print('Warning! Large difference in <beta,vec>'+Label)
-    else:
-        VecFirstHyper=(3.0/5.0)*Beta.sum(axis=0)[2]
 
     # Read second hyperpolarizability tensor
     line = SkipLines(File,2)
@@ -430,21 +2268,152 @@ def ReadProperty(File,Label,Properties):
     # given by the isotropic average
     line = SkipLines(File,2)
     AvgSecHyper = float(line.split()[1])
-    if abs(AvgSecHyper-(Gamma.trace()+2.0*(Gamma[0,1]+Gamma[1,2]+Gamma[0,2]))/5.0) > 1e-2:
-        print('Warning! Large difference in <Gamma>'+Label)
-        print((AvgSecHyper-(Gamma.trace()+2.0*(Gamma[0,1]+Gamma[1,2]+Gamma[0,2]))/5.0))
-    else:
-        AvgSecHyper = (Gamma.trace()+2.0*(Gamma[0,1]+Gamma[1,2]+Gamma[0,2]))/5.0
 
-    Properties[Label]['Mu']    = around(Mu            * PropertyConFac['Mu'],    decimals=PrUnits['Round']['m'])
-    Properties[Label]['|D|']   =  round(Dipole        * PropertyConFac['|D|'],            PrUnits['Round']['m'])
-    Properties[Label]['Alpha'] = around(Alpha         * PropertyConFac['Alpha'], decimals=PrUnits['Round']['a'])
-    Properties[Label]['<A>']   =  round(AvgPolar      * PropertyConFac['<A>'],            PrUnits['Round']['a'])
-    Properties[Label]['<B>']   =  round(AnzPolar      * PropertyConFac['<B>'],            PrUnits['Round']['a'])
-    Properties[Label]['Beta']  = around(Beta          * PropertyConFac['Beta'],  decimals=PrUnits['Round']['b'])
-    Properties[Label]['B(Z)']  =  round(VecFirstHyper * PropertyConFac['B(Z)'],           PrUnits['Round']['b'])
-    Properties[Label]['Gamma'] = around(Gamma         * PropertyConFac['Gamma'], decimals=PrUnits['Round']['g'])
-    Properties[Label]['<G>']   =  round(AvgSecHyper   * PropertyConFac['<G>'],            PrUnits['Round']['g'])
+    Properties[Label]['Mu']      = Mu
+    Properties[Label]['Alpha']   = Alpha
+    Properties[Label]['Beta']    = Beta
+    Properties[Label]['Gamma']   = Gamma
+    Properties[Label]['Printed'] = array([Dipole, AvgPolar, AnzPolar, VecFirstHyper, AvgSecHyper])
+
+#----------------------------------------------------------------------------
+# Store properties
+#----------------------------------------------------------------------------
+class PROPERTY_STORE:
+    """
+    Response tensors of all logs
+
+        The tensors of all files, property types and terms are stacked in
+        arrays of shape (N,3) for Mu and (N,3,3) for Alpha, Beta and Gamma,
+        the invariants printed in the logs in an array of shape (N,5). Row
+        n holds the term Keys[n] = (File, Property type, Energy term); row
+        N is a spare one of NaN which missing terms point to.
+    """
+
+    Tensors    = ['Mu', 'Alpha', 'Beta', 'Gamma']
+    Invariants = ['|D|', '<A>', '<B>', 'B(Z)', '<G>']
+
+    # largest differences allowed between the printed invariants and
+    # those of the tensors
+    Tolerance  = [1e-5, 1e-4, 1e-4, 1e-4, 1e-2]
+
+    # precision of each property in PrUnits['Round']
+    Precision  = {'Mu': 'm', '|D|': 'm', 'Alpha': 'a', '<A>': 'a', '<B>': 'a',
+                  'Beta': 'b', 'B(Z)': 'b', 'Gamma': 'g', '<G>': 'g'}
+
+    def __init__(self):
+        ImportNumpy()
+        self.Logs  = {}
+        self.Stack = None
+
+    def __len__(self):
+        return len(self.Logs)
+
+    def Add(self,Title,Properties):
+        """Stack the properties of a single log, replacing those of an earlier log with the same title."""
+
+        Keys  = [(Title, PropType, Label) for PropType in Properties for Label in Properties[PropType]]
+        Terms = [Properties[PropType][Label] for Title, PropType, Label in Keys]
+
+        Block = {'Keys': Keys}
+        for Name, Shape in [('Mu',(3,)), ('Alpha',(3,3)), ('Beta',(3,3)), ('Gamma',(3,3)), ('Printed',(5,))]:
+            Block[Name] = array([Term[Name] for Term in Terms],dtype=float64).reshape((len(Terms),)+Shape)
+
+        self.Logs[Title] = Block
+        self.Stack = None
+
+    def Titles(self):
+        """Titles of the logs in sorted order."""
+        return sorted(self.Logs)
+
+    def Stacked(self):
+        """Arrays of all logs in the order of their titles, with the invariants of the tensors."""
+
+        if self.Stack is not None:
+            return self.Stack
+
+        Blocks = [self.Logs[Title] for Title in self.Titles()]
+        Stack  = {'Keys': [Key for Block in Blocks for Key in Block['Keys']]}
+        for Name, Shape in [('Mu',(3,)), ('Alpha',(3,3)), ('Beta',(3,3)), ('Gamma',(3,3)), ('Printed',(5,))]:
+            Stack[Name] = concatenate([Block[Name] for Block in Blocks]+[full((1,)+Shape,nan)])
+
+        Stack['Index'] = dict([(Key, Row) for Row, Key in enumerate(Stack['Keys'])])
+
+        Mu    = Stack['Mu']
+        Alpha = Stack['Alpha']
+        Beta  = Stack['Beta']
+        Gamma = Stack['Gamma']
+
+        # |D|, <A>, <B>, B(Z) and <G> of all the tensors at once
+        Computed = empty(Stack['Printed'].shape)
+        Computed[:,0] = sqrt((Mu*Mu).sum(axis=1))
+        Computed[:,1] = trace(Alpha,axis1=1,axis2=2)/3.0
+        Computed[:,2] = Alpha[:,2,2]-Alpha[:,0,0]
+        Computed[:,3] = (3.0/5.0)*Beta.sum(axis=1)[:,2]
+        Computed[:,4] = (trace(Gamma,axis1=1,axis2=2)+2.0*(Gamma[:,0,1]+Gamma[:,1,2]+Gamma[:,0,2]))/5.0
+
+        # invariants far from those of the tensors are taken as printed
+        Stack['Computed'] = Computed
+        Stack['Bad']      = abs(Computed-Stack['Printed']) > array(self.Tolerance)
+        Stack['Scalars']  = where(Stack['Bad'],Stack['Printed'],Computed)
+
+        self.Stack = Stack
+        return Stack
+
+    def Validate(self):
+        """
+        Discrepancy report of the printed invariants.
+
+            Returns a list of (File, Property type, Energy term, Invariant,
+            Printed, Computed) for each invariant which differs from the
+            one of the tensors by more than its tolerance.
+        """
+
+        Stack = self.Stacked()
+        Rows, Columns = nonzero(Stack['Bad'])
+
+        return [Stack['Keys'][Row] + (self.Invariants[Column],
+                                      float(Stack['Printed'][Row,Column]),
+                                      float(Stack['Computed'][Row,Column]))
+                for Row, Column in zip(Rows,Columns)]
+
+    def Values(self,Property):
+        """Property of all terms in the selected units, rounded as printed."""
+
+        Stack = self.Stacked()
+        if Property in self.Tensors:
+            Values = Stack[Property]
+        else:
+            Values = Stack['Scalars'][:,self.Invariants.index(Property)]
+
+        return around(Values * State.PropertyConFac[Property],
+                      decimals=State.PrUnits['Round'][self.Precision[Property]])
+
+    def Selected(self,Property):
+        """Selected element of a property for all terms."""
+
+        Stack = self.Stacked()
+        Index = State.PropertyIndex.get(Property,[0])[0]
+        if Property in self.Tensors:
+            Values = Stack[Property].reshape(len(Stack['Mu']),-1)[:,Index]
+        else:
+            Values = Stack['Scalars'][:,self.Invariants.index(Property)]
+
+        return around(Values * State.PropertyConFac[Property],
+                      decimals=State.PrUnits['Round'][self.Precision[Property]])
+
+    def Components(self,Property):
+        """Labels of the components of a tensor, shaped as the tensor."""
+        Labels = State.PropertyIndex[Property][1:]
+        return array(Labels,dtype=str).reshape((3,)*(len(Labels) > 3)+(3,))
+
+    def Find(self,Titles,Terms):
+        """Rows of the (Property type, Energy term) pairs of the files, missing ones at the spare row."""
+
+        Stack = self.Stacked()
+        Index = Stack['Index']
+        Spare = len(Stack['Keys'])
+        return array([[Index.get((Title,)+Term,Spare) for Term in Terms] for Title in Titles],
+                     dtype=int).reshape(len(Titles),len(Terms))
 
 #----------------------------------------------------------------------------
 # Format property tables
@@ -453,24 +2422,12 @@ def FormatProperties(PropTables,Properties,OrdLabel):
     """
     Form tables of interaction induced properties
     
-        Properties are stuck in a following dictionary:
-
-        Properties{'File': 
-                  {'Property type':
-                  {'Energy term':
-                  {'Property': Value }}}}
+        Properties are stuck in a PROPERTY_STORE, the table of a property
+        being its selected element at the rows of the files and terms
     """
 
     # List of files
-    RunFiles = list(Properties.keys())
-    if SortMode == 'float':
-        RunFiles.sort(cmp=SortFiles)
-    else:
-        RunFiles.sort()
-
-    # Property labels
-    for Property in PropertyLabels:
-        PropTables[Property] = {}
+    RunFiles = SortRuns(Properties.Titles())
 
     # Labels of Total, Sum and Excess energy terms
     TotalTerms  = OrdLabel['TotPropLabel']
@@ -478,356 +2435,198 @@ def FormatProperties(PropTables,Properties,OrdLabel):
     ExcessTerms = OrdLabel['ExcPropLabel']
     IntTerms    = OrdLabel['IntPropLabel']
 
-    if OutFormat == 'tex':
+    if State.OutFormat == 'tex':
         TableHeader = '%'
     else:
         TableHeader = '#'
 
-    # Comparison of Total, Sum and Excess properties
-    for Property in PropertyLabels:
-
-        # Set header
-        Table = [[TableHeader]]
-        Table[0].extend(TotalTerms)
-        Table[0].extend(ExcessTerms)
-        Table[0].extend(SumTerms)
-
-        # Put the proper terms for all files
-        for Column, RunFile in enumerate(RunFiles):
-
-            Table.append([RunFile])
-
-            for EnergyTerm in TotalTerms:
-                Table[Column+1].append(Properties[RunFile]['Total'][EnergyTerm][Property])
-
-            for EnergyTerm in ExcessTerms:
-                Table[Column+1].append(Properties[RunFile]['Excess'][EnergyTerm][Property])
-
-            for EnergyTerm in SumTerms:
-                Table[Column+1].append(Properties[RunFile]['SumInteraction'][EnergyTerm][Property])
-
-        # Form the property table for printout
-        #Table = array(Table)
-        PropTables[Property]['Excess'] = Table
-
-    # Comparison of interaction induced properties
-    for Property in PropertyLabels:
-
-        # Set header
-        Table = [[TableHeader]]
-        Table[0].extend(IntTerms)
-
-        # Put the proper terms for all files
-        for Column, RunFile in enumerate(RunFiles):
+    # Comparison of Total, Sum and Excess properties and of interaction
+    # induced properties
+    Terms = { 'Excess'     : [('Total',Term) for Term in TotalTerms] +
+                             [('Excess',Term) for Term in ExcessTerms] +
+                             [('SumInteraction',Term) for Term in SumTerms],
+              'Interaction': [('Interaction',Term) for Term in IntTerms] }
 
-            Table.append([RunFile])
+    Rows = dict([(Kind, Properties.Find(RunFiles,Terms[Kind])) for Kind in Terms])
 
-            for EnergyTerm in IntTerms:
-                Table[Column+1].append(Properties[RunFile]['Interaction'][EnergyTerm][Property])
+    for Property in State.PropertyLabels:
+        Values = Properties.Selected(Property)
+        PropTables[Property] = {}
+        for Kind in Terms:
+            PropTables[Property][Kind] = TABLE(TableHeader,[Term for PropType, Term in Terms[Kind]],
+                                               RunFiles,Values[Rows[Kind]])
+
+def WritePropertyCheck(Report):
+    """Write the report of the invariants differing from their tensors."""
+
+    if not Report: return
+
+    File = open('property-check.txt','w')
+    File.write('# Invariants printed in the logs which differ from those of the tensors\n#\n')
+    File.write('# %-23s %-15s %-12s %-5s %17s %17s\n' % ('File','Property type','Energy term',
+                                                          'Inv.','Log','Tensors'))
+    for Title, PropType, Term, Invariant, Printed, Computed in Report:
+        File.write('  %-23s %-15s %-12s %-5s %17.8f %17.8f\n' % (FileName(Title),PropType,Term,
+                                                              Invariant,Printed,Computed))
+    File.close()
 
-        # Form the property table for printout
-        #Table = array(Table)
-        PropTables[Property]['Interaction'] = Table
+    print('Warning! %d invariants differ from their tensors, see property-check.txt' % len(Report))
 
 #----------------------------------------------------------------------------
 # Write Property Tables
 #----------------------------------------------------------------------------
-def WriteProperties(TitleLen,PropTables,Properties):
+def WriteProperties(TitleLen,PropTables,Labels):
     """Save data to file."""
 
-    if OutFormat == 'csv':
-        Separator = ' ;'
-        C         = '#'
-        EndRow    = '\n'
+    if State.OutFormat == 'csv':
         DataFileN = 'properties.csv'
         DataFileT = 'troperties.csv'
-    elif OutFormat == 'tex':
-        Separator = ' &'
-        C         = '%'
-        EndRow    = '\\\\\n'
+    elif State.OutFormat == 'tex':
         DataFileN = 'properties.tex'
         DataFileT = 'troperties.tex'
     else:
-        Separator = '; '
-        C         = '#'
-        EndRow    = '\n'
         DataFileN = 'properties.txt'
         DataFileT = 'troperties.txt'
 
     DataFile=open(DataFileN,'w')
     TataFile=open(DataFileT,'w')
 
-    Files = list(Properties.keys())
-    Files.sort()
-
-    if Relative:
-        Format = '%14.1f' + Separator
-        RoundP = 1
+    # Number of Total, Excess, Sum and Interaction terms
+    Total       = len(Labels['TotPropLabel'])
+    Excess      = len(Labels['ExcPropLabel'])
+    Sum         = len(Labels['SumPropLabel'])
+    Interaction = len(Labels['IntPropLabel'])
 
-    LabLen = max(PrUnits['LabLen'])
+    LabLen = LabelWidths(Labels)[1]
 
-    if OutFormat == 'tex':
-        TitleFormat = '%-'+ str(TitleLen) + 's' + Separator
-        LabelFormat = ' %' + str(LabLen) + 's ' + Separator
-    else:
-        TitleFormat = '"%-'+ str(TitleLen) + 's"' + Separator
-        LabelFormat = '"%' + str(LabLen) + 's"' + Separator
+    Layout = TABLE_FORMAT(TitleLen,LabLen)
+    C      = Layout.C
+    EndRow = Layout.EndRow
 
-    for l in list(PropertyFormats.keys()):
-        PropertyFormats[l] = PropertyFormats[l].replace('%ln','%'+str(LabLen+2))+Separator
+    Formats = {}
+    for l in list(State.PropertyFormats.keys()):
+        Formats[l] = Layout.Value(State.PropertyFormats[l])
 
     # Write excess and total properties as well as sum of interaction
     # induced properties
     DataFile.write(C+' Total, Excess and Sum of Interaction Induced Properties\n'+C+'\n')
     TataFile.write(C+' Total, Excess and Sum of Interaction Induced Properties\n'+C+'\n')
 
-    if OutFormat == 'csv':
+    if State.OutFormat == 'csv':
         TableHeader = ''
-    elif OutFormat == 'tex':
+    elif State.OutFormat == 'tex':
         TableHeader = '\\begin{tabular}{@{\extracolsep{\\fill}}l' + \
-                      len(list(Properties[Files[0]]['Total'].keys()))  * ' r' + \
-                      len(list(Properties[Files[0]]['Excess'].keys())) * ' r' + \
-                      len(list(Properties[Files[0]]['SumInteraction'].keys())) * ' r' + '}\hline' + EndRow
+                      Total  * ' r' + \
+                      Excess * ' r' + \
+                      Sum    * ' r' + '}\\hline' + EndRow
         TableFooter = '\\end{tabular}' + EndRow
     else:
         TableHeader = '"' + C + 'Property'.center(TitleLen,'_') + '|' + \
-                      'Total Properties'.center(len(list(Properties[Files[0]]['Total'].keys()))*(LabLen+4)-1,'_') + '|' + \
-                      'Excess Properties'.center(len(list(Properties[Files[0]]['Excess'].keys()))*(LabLen+4)-1,'_') + '|' + \
-                      'Sum of Interaction Properties'.center(len(list(Properties[Files[0]]['SumInteraction'].keys()))*(LabLen+4)-1,'_') + '|' + '"' + EndRow
-
-    for Property in PropertyLabels:
-
-        Table = PropTables[Property]['Excess']
-
-        # Write table header
-        DataFile.write(PropertyDescription[Property] + '\n' + C +'\n')
-        DataFile.write(TableHeader)
-        DataFile.write(TitleFormat % Table[0][0])
-
-        for Column in range(len(Table[0])-1):
-            Label = Table[0][Column+1]
-            DataFile.write(LabelFormat % Label.rjust(LabLen))
-
-        DataFile.write(EndRow)
-
-        if OutFormat == 'tex':
-            DataFile.write(TitleFormat % Table[0][0])
-            for Column in range(len(Table[0])-1):
-                Label = Table[0][Column+1]
-                Label = TexLabel(Label)
-                DataFile.write(LabelFormat % Label.rjust(LabLen))
-
-            DataFile.write(EndRow)
-
-        for Row in range(len(Table)-1):
-            DataFile.write(TitleFormat % Table[Row+1][0].split()[1].replace('.log',''))
-
-            for Column in range(len(Table[Row])-1):
-                PrValue = Table[Row+1][Column+1]
-
-                if type(PrValue) == ndarray:
-                    PrValue = PrValue.flatten()[PropertyIndex[Property][0]]
-
-                if str(type(PrValue)).count('float') > 0:
-                    if Relative == 'first':
-                        PrValue = round(100.0*PrValue / Table[Row+1][1],RoundP)
-                        DataFile.write(Format % PrValue)
-                    elif Relative == 'last':
-                        PrValue = round(100.0*PrValue / Table[Row+1][-1],RoundP)
-                        DataFile.write(Format % PrValue)
-                    else:
-                        DataFile.write(PropertyFormats[Property] % PrValue)
-                else:
-                    DataFile.write('%s' % PrValue.rjust(LabLen))
-       
-            DataFile.write(EndRow)
-       
-        if OutFormat == 'tex':
-            DataFile.write(TableFooter)
-
-        DataFile.write('\n')
-
-        # Write Transposed properties
-        TataFile.write(PropertyDescription[Property] + '\n' + C +'\n')
-        TataFile.write(TableHeader)
-        TataFile.write(TitleFormat % Table[0][0])
-
-        for Row in range(len(Table)-1):
-            TataFile.write(TitleFormat % Table[Row+1][0].split()[1].replace('.log',''))
-
-        TataFile.write(EndRow)
+                      'Total Properties'.center(Total*(LabLen+4)-1,'_') + '|' + \
+                      'Excess Properties'.center(Excess*(LabLen+4)-1,'_') + '|' + \
+                      'Sum of Interaction Properties'.center(Sum*(LabLen+4)-1,'_') + '|' + '"' + EndRow
 
-        for Column in range(len(Table[0])-1):
-            if OutFormat == 'tex':
-                Label = Table[0][Column+1]
-                Label = TexLabel(Label)
-            else:
-                Label = Table[0][Column+1]
-
-            TataFile.write(LabelFormat % Label.rjust(LabLen))
-
-            for Row in range(len(Table)-1):
-
-                PrValue = Table[Row+1][Column+1]
-
-                if type(PrValue) == ndarray:
-                    PrValue = PrValue.flatten()[PropertyIndex[Property][0]]
-
-                if str(type(PrValue)).count('float') > 0:
-                    if Relative == 'first':
-                        PrValue = round(100.0*PrValue / Table[Row+1][1],RoundP)
-                        TataFile.write(Format % PrValue)
-                    elif Relative == 'last':
-                        PrValue = round(100.0*PrValue / Table[Row+1][-1],RoundP)
-                        TataFile.write(Format % PrValue)
-                    else:
-                        TataFile.write(PropertyFormats[Property] % PrValue)
-                else:
-                    TataFile.write('%s' % PrValue.rjust(LabLen))
-
-            if OutFormat == 'tex':
-                Label = Table[0][Column+1]
-                TataFile.write(' \\\\ ')
-                TataFile.write(LabelFormat % ('% '+Label).rjust(LabLen))
-                TataFile.write('\n')
-            else:
-                TataFile.write(EndRow)
-       
-        if OutFormat == 'tex':
-            TataFile.write(TableFooter)
-
-        TataFile.write('\n')
+    for Property in State.PropertyLabels:
+        WritePropertyTable(DataFile,TataFile,Layout,PropTables[Property]['Excess'],Property,
+                           Formats[Property],TableHeader,TableFooter if State.OutFormat == 'tex' else '')
 
     # Write excess and total properties as well as sum of interaction
     # induced properties
     DataFile.write(C+' Interaction Induced Properties\n'+C+'\n')
     TataFile.write(C+' Interaction Induced Properties\n'+C+'\n')
 
-    if OutFormat == 'csv':
+    if State.OutFormat == 'csv':
         TableHeader = ''
-    elif OutFormat == 'tex':
+    elif State.OutFormat == 'tex':
         TableHeader = '\\begin{tabular}{@{\extracolsep{\\fill}}l' + \
-                      len(list(Properties[Files[0]]['Interaction'].keys())) * ' r' + EndRow
+                      Interaction * ' r' + EndRow
     else:
         TableHeader = '"' + C + 'Property'.center(TitleLen,'_') + '|' + \
-                      'Finite Field Estimates of Interaction Induced Properties'.center(len(list(Properties[Files[0]]['Interaction'].keys()))*(LabLen+4)-1,'_') + '|' +'"' + EndRow
+                      'Finite Field Estimates of Interaction Induced Properties'.center(Interaction*(LabLen+4)-1,'_') + '|' +'"' + EndRow
 
-    for Property in PropertyLabels:
+    for Property in State.PropertyLabels:
+        WritePropertyTable(DataFile,TataFile,Layout,PropTables[Property]['Interaction'],Property,
+                           Formats[Property],TableHeader,TableFooter if State.OutFormat == 'tex' else '')
 
-        Table = PropTables[Property]['Interaction']
+    # Close data file
+    DataFile.close()
+    TataFile.close()
 
-        # Write table header
-        DataFile.write(PropertyDescription[Property] + '\n'+C+'\n')
-        DataFile.write(TableHeader)
-        DataFile.write(TitleFormat % Table[0][0])
-
-        for Column in range(len(Table[0])-1):
-            Label = Table[0][Column+1]
-            DataFile.write(LabelFormat % Label.rjust(LabLen))
-       
-        DataFile.write(EndRow)
-       
-        if OutFormat == 'tex':
-            DataFile.write(TitleFormat % Table[0][0])
-            for Column in range(len(Table[0])-1):
-                Label = Table[0][Column+1]
-                Label = TexLabel(Label)
-                DataFile.write(LabelFormat % Label.rjust(LabLen))
-
-            DataFile.write(EndRow)
-
-        for Row in range(len(Table)-1):
-            DataFile.write(TitleFormat % Table[Row+1][0].split()[1].replace('.log',''))
-
-            for Column in range(len(Table[Row])-1):
-                PrValue = Table[Row+1][Column+1]
-
-                if type(PrValue) == ndarray:
-                    PrValue = PrValue.flatten()[PropertyIndex[Property][0]]
-
-                if str(type(PrValue)).count('float') > 0:
-                    if Relative == 'first':
-                        PrValue = round(100.0*PrValue / Table[Row+1][1],RoundP)
-                        DataFile.write(Format % PrValue)
-                    elif Relative == 'last':
-                        PrValue = round(100.0*PrValue / Table[Row+1][-1],RoundP)
-                        DataFile.write(Format % PrValue)
-                    else:
-                        DataFile.write(PropertyFormats[Property] % PrValue)
-                else:
-                    DataFile.write('%s' % PrValue.rjust(LabLen))
+def WritePropertyTable(DataFile,TataFile,Layout,Table,Property,Format,TableHeader,TableFooter):
+    """Write a property table and its transpose a block of rows at a time."""
 
-            DataFile.write(EndRow)
+    C      = Layout.C
+    EndRow = Layout.EndRow
+    LabLen = Layout.LabLen
 
-        if OutFormat == 'tex':
-            DataFile.write(TableFooter)
+    if State.Relative in ('first','last'):
+        Format = '%14.1f' + Layout.Separator
 
-        DataFile.write('\n')
+    Labels = Table.Columns
 
-        # Write Transposed properties
-        TataFile.write(PropertyDescription[Property] + '\n' + C +'\n')
-        TataFile.write(TableHeader)
-        TataFile.write(TitleFormat % Table[0][0])
+    # tables left without columns by --labels are not written
+    if not len(Labels): return
 
-        for Row in range(len(Table)-1):
-            TataFile.write(TitleFormat % Table[Row+1][0].split()[1].replace('.log',''))
+    # Write table header
+    Out = [State.PropertyDescription[Property] + '\n' + C +'\n', TableHeader]
+    Out.append(Layout.Header(Table.Corner,Labels))
 
-        TataFile.write(EndRow)
+    if State.OutFormat == 'tex':
+        Out.append(Layout.Header(Table.Corner,[TexLabel(Label) for Label in Labels]))
 
-        for Column in range(len(Table[0])-1):
-            if OutFormat == 'tex':
-                Label = Table[0][Column+1]
-                Label = TexLabel(Label)
-            else:
-                Label = Table[0][Column+1]
+    for Rows, Values in Table.Blocks():
+        Files = [Layout.Title(FileName(Row)) for Row in Rows]
+        Out.append(Layout.Rows(Files,RelativeValues(Values,Values),Format))
+        DataFile.write(''.join(Out))
+        Out = []
 
-            TataFile.write(LabelFormat % Label.rjust(LabLen))
+    Out.append(TableFooter)
+    Out.append('\n')
 
-            for Row in range(len(Table)-1):
+    DataFile.write(''.join(Out))
 
-                PrValue = Table[Row+1][Column+1]
+    # Write Transposed properties, files in columns
+    Out = [State.PropertyDescription[Property] + '\n' + C +'\n', TableHeader]
+    Out.append(Layout.Title(Table.Corner) + ''.join([Layout.Title(FileName(Row)) for Row in Table.Rows]) + EndRow)
 
-                if type(PrValue) == ndarray:
-                    PrValue = PrValue.flatten()[PropertyIndex[Property][0]]
+    if State.OutFormat == 'tex':
+        Titles = [Layout.LabelFormat % TexLabel(Label).rjust(LabLen) for Label in Labels]
+        Ends   = [' \\\\ ' + Layout.LabelFormat % ('% '+Label).rjust(LabLen) + '\n' for Label in Labels]
+    else:
+        Titles = [Layout.LabelFormat % Label.rjust(LabLen) for Label in Labels]
+        Ends   = None
 
-                if str(type(PrValue)).count('float') > 0:
-                    if Relative == 'first':
-                        PrValue = round(100.0*PrValue / Table[Row+1][1],RoundP)
-                        TataFile.write(Format % PrValue)
-                    elif Relative == 'last':
-                        PrValue = round(100.0*PrValue / Table[Row+1][-1],RoundP)
-                        TataFile.write(Format % PrValue)
-                    else:
-                        TataFile.write(PropertyFormats[Property] % PrValue)
-                else:
-                    TataFile.write('%s' % PrValue.rjust(LabLen))
+    Size = TableBlock//(len(Table.Rows) or 1) or 1
+    for Start in range(0,len(Labels),Size):
+        Values = RelativeValues(Table.Values[:,Start:Start+Size],Table.Values)
+        Out.append(Layout.Rows(Titles[Start:Start+Size],Values.T,Format,
+                               Ends[Start:Start+Size] if Ends else None))
+        TataFile.write(''.join(Out))
+        Out = []
 
-            if OutFormat == 'tex':
-                Label = Table[0][Column+1]
-                TataFile.write(' \\\\ ')
-                TataFile.write(LabelFormat % ('% '+Label).rjust(LabLen))
-                TataFile.write('\n')
-            else:
-                TataFile.write(EndRow)
-       
-        if OutFormat == 'tex':
-            TataFile.write(TableFooter)
+    Out.append(TableFooter)
+    Out.append('\n')
 
-        TataFile.write('\n')
+    TataFile.write(''.join(Out))
 
-    # Close data file
-    DataFile.close()
-    TataFile.close()
+def RelativeValues(Values,Reference):
+    """Values relative to the first or last term of a file, in per cent."""
+
+    if State.Relative == 'first':
+        return around(100.0*Values / Reference[:,:1],1)
+    elif State.Relative == 'last':
+        return around(100.0*Values / Reference[:,-1:],1)
+
+    return Values
 
 #----------------------------------------------------------------------------
 # Read Energies
 #----------------------------------------------------------------------------
-def ReadSubEnergies(File,CorrLabel,OrdLabel,Energies):
+def ReadSubEnergies(File,line,CorrLabel,OrdLabel,Energies):
     """Read energies for this system."""
 
-    line   = FindLine(File,'  INTERACTION ENERGY TERMS')
-    Mer    = re.split('\D+',line)[1]
-    ConfNo = re.split('\D+',line)[2]
+    Mer    = re.split(r'\D+',line)[1]
+    ConfNo = re.split(r'\D+',line)[2]
     line   = SkipLines(File,4)
 
     while 1:
@@ -837,103 +2636,45 @@ def ReadSubEnergies(File,CorrLabel,OrdLabel,Energies):
         if line.find('(') !=-1:
             line=line.split()
 
-            if len(line) == 3: 
-                EnLabel = line[0]
-                EnValue = line[1]
-            if len(line) == 4:
-                EnLabel = ' '.join(line[:2])
-                EnValue = line[2]
-            if MpLevel == 2 or (CcLevel and CcLevel.upper() != 'NONE'):
-                EnLabel += CorrLabel
-            if (EnLabel not in Energies) and OrdLabel.count(EnLabel) == 0 :
-                OrdLabel.append(EnLabel)
-                EnUnits['LabLen'].append(len(EnLabel))
-                if OutFormat == 'tex':
-                    TexLabel(EnLabel)
-                Energies[EnLabel] = {}
-
-            Energies[EnLabel][ConfNo] = EnValue
-
-#----------------------------------------------------------------------------
-# Read Total Energies
-#----------------------------------------------------------------------------
-def ReadTotEn(File,Energies,Field):
-    """Read energies for this system."""
-
-    line = FindLine(File,'TOTAL SCF ENERGIES')
-    Energies[Field]['SCF'] = {}
-    if Field==(0,0,0):
-        line = SkipLines(File,2)
-    else:
-        line = FindLine(File,'FREE ENERGIES')
-        line = SkipLines(File,1)
-
-    while 1:
-        line = File.readline()
-        if line == '': break
-        if line == '\n': break
-        if line.find(10*'-') !=-1: break
-        if line.find('(') !=-1:
-            line   = re.split('\(|\)',line)
-            Mer    = line[0].split('-')[0]
-            ConfNo = int(line[1])
-            Energies[Field]['SCF'][ConfNo] = float(line[2])
-
-    if MpLevel == 2 or (CcLevel and CcLevel.upper() != 'NONE'):
-
-        line = FindLine(File,'MP2 E(2) CORRECTIONS')
-        Energies[Field]['MP2'] = {}
-        line = SkipLines(File,2)
-
-        while 1:
-            line = File.readline()
-            if line == '': break
-            if line == '\n': break
-            if line.find(10*'-') !=-1: break
-            if line.find('(') !=-1:
-                line   = re.split('\(|\)',line)
-                Mer    = line[0].split('-')[0]
-                ConfNo = int(line[1])
-                Energies[Field]['MP2'][ConfNo] = Energies[Field]['SCF'][ConfNo] + float(line[2])
-
-    if CcLevel and CcLevel.upper().count('CCSD(TQ') >= 1:
-
-        line = FindLine(File,'CC CORRELATION ENERGY E(  CCSD(TQ))')
-        Energies[Field]['CCSDTQ'] = {}
-        line = SkipLines(File,2)
-
-        while 1:
-            line = File.readline()
-            if line == '': break
-            if line == '\n': break
-            if line.find(10*'-') !=-1: break
-            if line.find('(') !=-1:
-                line   = re.split('\(|\)',line)
-                Mer    = line[0].split('-')[0]
-                ConfNo = int(line[1])
-                Energies[Field]['CCSDTQ'][ConfNo] = Energies[Field]['SCF'][ConfNo] + float(line[2])
-
-def ReadTotEnergies(File,out,Energies):
-    """Read energies for this system."""
-
-    File.seek(0)
+            if len(line) == 3: 
+                EnLabel = line[0]
+                EnValue = float(line[1])
+            if len(line) == 4:
+                EnLabel = ' '.join(line[:2])
+                EnValue = float(line[2])
+            if not Kept('Terms',EnLabel): continue
+            if State.MpLevel == 2 or (State.CcLevel and State.CcLevel.upper() != 'NONE'):
+                EnLabel += CorrLabel
+            if EnLabel not in Energies:
+                OrdLabel.Add(EnLabel)
+                Energies[EnLabel] = {}
 
-    Field=(0,0,0)
-    Energies[Field] = {}
+            Energies[EnLabel][ConfNo] = EnValue
 
-    ReadTotEn(File,Energies,Field)
+#----------------------------------------------------------------------------
+# Read Total Energies
+#----------------------------------------------------------------------------
+def ReadTotEn(File,Energies,Label):
+    """Read total energies of subsystems."""
+
+    Energies[Label] = {}
 
-    while FiniteField:
+    while 1:
         line = File.readline()
         if line == '': break
-        if line.find('APPLIED FIELD') !=-1:
-            line = line.split()
-            # ... set field label ...
-            Field = (float(line[-3]), float(line[-2]), float(line[-1]))
-            if (Field not in Energies):
-                Energies[Field]={}
+        if line.strip() == '': break
+        if line.find(10*'-') !=-1: break
+        if line.find('(') !=-1:
+            line   = re.split('\(|\)',line)
+            Mer    = line[0].split('-')[0]
+            ConfNo = int(line[1])
+            if Label == 'SCF':
+                Energies[Label][ConfNo] = float(line[2])
+            else:
+                Energies[Label][ConfNo] = Energies['SCF'][ConfNo] + float(line[2])
 
-            ReadTotEn(File,Energies,Field)
+def WriteTotEnergies(out,Energies):
+    """Save total energies of subsystems."""
 
     for S in list(Energies[(0,0,0)]['SCF'].keys()):
         out.write( '# Subsystem %d \n' % S )
@@ -952,12 +2693,9 @@ def ReadTotEnergies(File,out,Energies):
 #----------------------------------------------------------------------------
 # Read Many Body Energy Terms
 #----------------------------------------------------------------------------
-def ReadMnbEnergies(File,OrdLabel,Energies,SeekIter):
+def ReadMnbEnergies(File,line,OrdLabel,Energies):
     """Read energies for this system."""
 
-    for i in range(SeekIter): 
-        line = FindLine(File,'MANY BODY INTERACTION ENERGY TERMS')
-
     MnbLabel = line.split()[6]
     line     = SkipLines(File,4)
 
@@ -970,29 +2708,23 @@ def ReadMnbEnergies(File,OrdLabel,Energies,SeekIter):
 
             if len(line) == 3: 
                 EnLabel = line[0]
-                EnValue = line[1]
+                EnValue = float(line[1])
             if len(line) == 4:
                 EnLabel = ' '.join(line[:2])
-                EnValue = line[2]
+                EnValue = float(line[2])
+
+            if not Kept('Terms',TermName(EnLabel)): continue
 
             EnLabel += '(MNB)'
 
-            if (EnLabel not in Energies) and OrdLabel.count(EnLabel) == 0 :
-                OrdLabel.append(EnLabel)
-                EnUnits['LabLen'].append(len(EnLabel))
-                if OutFormat == 'tex':
-                    TexLabel(EnLabel)
-  
+            OrdLabel.Add(EnLabel)
             Energies[EnLabel] = EnValue
 
-def ReadFldEnergies(File,OrdLabel,Energies,SeekIter):
+def ReadFldEnergies(File,line,OrdLabel,Energies):
     """Read energies for this system."""
 
-    for i in range(SeekIter): 
-        line   = FindLine(File,'  INTERACTION ENERGY TERMS')
-
-    Mer    = re.split('\D+',line)[1]
-    ConfNo = re.split('\D+',line)[2]
+    Mer    = re.split(r'\D+',line)[1]
+    ConfNo = re.split(r'\D+',line)[2]
     line   = SkipLines(File,4)
 
     while 1:
@@ -1004,19 +2736,16 @@ def ReadFldEnergies(File,OrdLabel,Energies,SeekIter):
 
             if len(line) == 3: 
                 EnLabel = line[0]
-                EnValue = line[1]
+                EnValue = float(line[1])
             if len(line) == 4:
                 EnLabel = ' '.join(line[:2])
-                EnValue = line[2]
+                EnValue = float(line[2])
+
+            if not Kept('Terms',TermName(EnLabel)): continue
 
             EnLabel += '(MNB)'
 
-            if (EnLabel not in Energies) and OrdLabel.count(EnLabel) == 0 :
-                OrdLabel.append(EnLabel)
-                EnUnits['LabLen'].append(len(EnLabel))
-                if OutFormat == 'tex':
-                    TexLabel(EnLabel)
-  
+            OrdLabel.Add(EnLabel)
             Energies[EnLabel] = EnValue
 
 #----------------------------------------------------------------------------
@@ -1025,8 +2754,6 @@ def ReadFldEnergies(File,OrdLabel,Energies,SeekIter):
 def ReadPreamble(File,LogFile):
     """Read run title, and basic informations concerning the system."""
 
-    global MpLevel, CcLevel, Monomers, Systems, ManyBody, FiniteField
-
     # Read filename and run title
     line  = FindLine(File,'RUN TITLE')
     line  = SkipLines(File,2)
@@ -1035,110 +2762,350 @@ def ReadPreamble(File,LogFile):
     # Read filename and run title
     line    = FindLine(File,'CONTRL OPTIONS')
     line    = FindLine(File,'MPLEVL= ')
-    MpLevel = int(line.split()[1])
-    CcLevel = line.split()[5][1:]
+    State.MpLevel = int(line.split()[1])
+    State.CcLevel = line.split()[5][1:]
 
     # Read number of monomers and subsystems
     line     = FindLine(File,'BODY COMPLEX')
-    line     = re.split('\D+',line)[1:3]
-    Monomers = int(line[1])
-    Systems  = int(line[0])
-    ManyBody = Systems > 3
+    line     = re.split(r'\D+',line)[1:3]
+    State.Monomers = int(line[1])
+    State.Systems  = int(line[0])
+    State.ManyBody = State.Systems > 3
+
+    # Read monomers of each subsystem
+    State.Composition = ReadComposition(File)
 
     # Check for interaction induced properties run
     line        = FindLine(File,'FFEDS =')
-    FiniteField = line.split()[11] == 'T'
+    State.FiniteField = line.split()[11] == 'T'
 
     return Title
 
+def ReadComposition(File):
+    """Read the table of subsystems, returning the monomers of each one."""
+
+    Rows = []
+
+    line = FindLine(File,'MONOMER:')
+    line = SkipLines(File,1)
+
+    # the row of a subsystem of a large complex may go on in the next lines
+    while 1:
+        line = File.readline()
+        if line.strip() == '': break
+        if line.find('C(') != -1:
+            line = line.split(')')
+            Rows.append((line[0].split('(')[1].strip(), []))
+            line = line[1]
+        Rows[-1][1].extend(line.split())
+
+    Composition = {}
+    for ConfNo, Flags in Rows:
+        Composition[ConfNo] = tuple([Monomer+1 for Monomer, Flag in enumerate(Flags) if Flag == '1'])
+
+    return Composition
+
+#----------------------------------------------------------------------------
+# Result store
+#----------------------------------------------------------------------------
+class DENSE_STORE:
+    """Float64 array of results with integer indexed label axes
+
+    The labels of each axis are kept in a LABEL_REGISTRY, the id of a
+    label being its position on the axis. Cells which were never set hold
+    NaN. Each axis keeps at least one spare slot so that a label missing
+    on an axis always points to NaN.
+    """
+
+    def __init__(self,Rank):
+        self.Axes   = [LABEL_REGISTRY(Text=False) for Axis in range(Rank)]
+        self.Values = full((2,)*Rank,nan)
+
+    def Slot(self,Axis,Label):
+        """Position of a label on an axis, adding the label if new."""
+        Labels = self.Axes[Axis]
+        if Label in Labels:
+            return Labels.Ids[Label]
+
+        Slot = Labels.Add(Label)
+
+        # grow the axis by doubling, keeping the spare slot
+        Size = self.Values.shape[Axis]
+        if len(Labels) >= Size:
+            Shape       = list(self.Values.shape)
+            Shape[Axis] = Size
+            self.Values = concatenate((self.Values,full(Shape,nan)),Axis)
+
+        return Slot
+
+    def Find(self,Axis,Labels):
+        """Positions of labels on an axis, missing ones at the spare slot."""
+        Ids   = self.Axes[Axis].Ids
+        Spare = len(self.Axes[Axis])
+        return array([Ids.get(Label,Spare) for Label in Labels],dtype=int)
+
+    def Used(self):
+        """View of the values without the spare slots."""
+        return self.Values[tuple([slice(0,len(Labels)) for Labels in self.Axes])]
+
+    def Mask(self):
+        """Cells holding a value."""
+        return ~isnan(self.Used())
+
+class SUBSYSTEM_STORE:
+    """
+    Interaction energies of subsystems by n-body order
+
+        The subsystems of each order are kept by their monomer tuples, so
+        that only the subsystems computed take space however large the
+        complex is. The order of a subsystem is the number of its monomers
+        and the monomers are numbered from 1 as in the logs.
+    """
+
+    def __init__(self):
+        self.Terms = LABEL_REGISTRY(Text=False)
+        self.Logs  = {}
+        self.Stack = {}
+
+    def Add(self,Title,Energies,Composition):
+        """Pack the field free subsystem energies of a single log, replacing those of an earlier log with the same title."""
+
+        Terms  = [EnLabel for EnLabel in Energies if isinstance(Energies[EnLabel],dict)]
+        Confs  = set([ConfNo for EnLabel in Terms for ConfNo in Energies[EnLabel] if ConfNo in Composition])
+        Confs  = sorted(Confs,key=lambda ConfNo: Composition[ConfNo])
+        Rows   = dict([(ConfNo, Row) for Row, ConfNo in enumerate(Confs)])
+        Orders = array([len(Composition[ConfNo]) for ConfNo in Confs],dtype=int)
+
+        Values = full((len(Confs),len(Terms)),nan)
+        for Column, EnLabel in enumerate(Terms):
+            Cells = [(Rows[ConfNo], EnValue) for ConfNo, EnValue in Energies[EnLabel].items() if ConfNo in Rows]
+            if Cells:
+                Cells = array(Cells)
+                Values[Cells[:,0].astype(int),Column] = Cells[:,1]
+
+        Ids = [self.Terms.Add(EnLabel) for EnLabel in Terms]
+
+        Block = {}
+        for Order in unique(Orders):
+            Rows = nonzero(Orders == Order)[0]
+            Block[int(Order)] = { 'Monomers': array([Composition[Confs[Row]] for Row in Rows],dtype=int).reshape(len(Rows),Order),
+                                  'Terms'   : array(Ids,dtype=int),
+                                  'Values'  : Values[Rows] }
+
+        self.Logs[Title] = Block
+        self.Stack = {}
+
+    def Titles(self):
+        """Titles of the logs in sorted order."""
+        return sorted(self.Logs)
+
+    def Orders(self):
+        """Orders of the subsystems of all logs."""
+        return sorted(set([Order for Title in self.Logs for Order in self.Logs[Title]]))
+
+    def Order(self,Order):
+        """
+        Subsystems of a single order of all logs.
+
+            Returns a dict of Titles, the logs in sorted order, and of
+            arrays with a row for each subsystem: Files, the position of
+            its log in Titles, Monomers, its monomer tuple, and Values, its
+            energy terms in au in the order of Terms with a spare column of
+            NaN which missing terms point to.
+        """
+
+        if Order in self.Stack:
+            return self.Stack[Order]
+
+        Titles = [Title for Title in self.Titles() if Order in self.Logs[Title]]
+        Blocks = [self.Logs[Title][Order] for Title in Titles]
+        Files  = concatenate([full(len(Block['Values']),n,dtype=int) for n, Block in enumerate(Blocks)]+[zeros(0,dtype=int)])
+        Stack  = { 'Titles'  : Titles,
+                   'Files'   : Files,
+                   'Monomers': concatenate([Block['Monomers'] for Block in Blocks]+[zeros((0,Order),dtype=int)]),
+                   'Values'  : full((len(Files),len(self.Terms)+1),nan) }
+
+        Start = 0
+        for Block in Blocks:
+            Stop = Start+len(Block['Values'])
+            Stack['Values'][Start:Stop,Block['Terms']] = Block['Values']
+            Start = Stop
+
+        self.Stack[Order] = Stack
+        return Stack
+
+    def Columns(self,Terms):
+        """Columns of energy terms in the values of an order, missing ones at the spare column."""
+        Spare = len(self.Terms)
+        return array([self.Terms.Ids.get(EnLabel,Spare) for EnLabel in Terms],dtype=int)
+
+class ENERGY_STORE:
+    """Interaction energies of all logs
+
+    Energy terms of subsystems are kept in an array of shape (files,
+    fields, terms, subsystems), many-body terms of the whole complex in
+    an array of shape (files, fields, terms). The subsystems are also
+    kept by n-body order in a SUBSYSTEM_STORE with -n, or if Orders is
+    set for the expansion (-m) or the export (-x); with -n the array
+    keeps only the whole complex.
+    """
+
+    def __init__(self,Orders=False):
+        ImportNumpy()
+        self.Sub     = DENSE_STORE(4)
+        self.Mnb     = DENSE_STORE(3)
+        self.Orders  = SUBSYSTEM_STORE()
+        self.Fields  = {}
+        self.ByOrder = Orders
+
+    def Add(self,Title,Energies,Composition={}):
+        """Pack the energies of a single log, the subsystems being given by their monomers."""
+
+        Sub  = self.Sub
+        Mnb  = self.Mnb
+        File = (Sub.Slot(0,Title), Mnb.Slot(0,Title))
+
+        # a log parsed again replaces the old results
+        Sub.Values[File[0]] = nan
+        Mnb.Values[File[1]] = nan
+
+        if self.ByOrder or State._NBody_:
+            self.Orders.Add(Title,Energies[(0,0,0)],Composition)
+
+        # with -n the array keeps the whole complex, the other
+        # subsystems being written by their order
+        Whole = None
+        if State._NBody_ and Composition:
+            Whole = set([ConfNo for ConfNo in Composition if len(Composition[ConfNo]) == State.Monomers])
+
+        for Field in Energies:
+            for EnLabel, EnValue in Energies[Field].items():
+                # slots are taken before indexing as the array may grow
+                if isinstance(EnValue,dict):
+                    Cell = (File[0], Sub.Slot(1,Field), Sub.Slot(2,EnLabel))
+                    for ConfNo in EnValue:
+                        if Whole is not None and ConfNo not in Whole: continue
+                        Slot = Cell+(Sub.Slot(3,ConfNo),)
+                        Sub.Values[Slot] = EnValue[ConfNo]
+                else:
+                    Slot = (File[1], Mnb.Slot(1,Field), Mnb.Slot(2,EnLabel))
+                    Mnb.Values[Slot] = EnValue
+
+        self.Fields[Title] = list(Energies.keys())
+
+    def Titles(self):
+        """Titles of the logs in sorted order."""
+        return sorted(self.Fields)
+
 #----------------------------------------------------------------------------
 # Format Energies
 #----------------------------------------------------------------------------
+# Cells of a table rendered at once
+TableBlock = 65536
+
+class TABLE:
+    """Values with labels of the columns and rows"""
+
+    def __init__(self,Corner,Columns,Rows,Values):
+        self.Corner  = Corner
+        self.Columns = Columns
+        self.Rows    = Rows
+        self.Values  = Values
+
+    def __len__(self):
+        return len(self.Rows)
+
+    def Blocks(self):
+        """Labels and values of successive blocks of rows."""
+        Size = TableBlock//(len(self.Columns) or 1) or 1
+        for Start in range(0,len(self.Rows),Size):
+            yield self.Rows[Start:Start+Size], self.Values[Start:Start+Size]
+
 def FormatSubEnergies(EnergyTables,ClusterTables,Energies,Labels):
     """
     Form tabularized energies.
     
-        Energies are stuck in a following dictionary:
-        Energies{'File':
-                {(Field):
-                {'Component':
-                {'Subsystem': Value }}}}
+        Energies are stuck in an ENERGY_STORE, subsystem terms being
+        Energies.Sub.Values[File,Field,Component,Subsystem]
     """
 
     # Labels of interaction energy components
     EnergyTerms = Labels['SubLabel']
     Field=(0,0,0)
 
-    if OutFormat == 'tex':
+    if State.OutFormat == 'tex':
         TableHeader = '%'
     else:
         TableHeader = '#'
 
     # List of files
-    RunFiles = list(Energies.keys())
-    RunFiles.sort()
+    RunFiles = Energies.Titles()
     if len(RunFiles) > 1:
         Compare = True
     else:
         Compare = False
 
-    # List of subsystems
-    ComplexList = list(Energies[RunFiles[0]][Field]['DE(HF)'].keys())
-    ComplexList.sort(key=lambda x: int(x))
+    Sub    = Energies.Sub
+    Files  = Sub.Find(0,RunFiles)
+    Terms  = Sub.Find(2,EnergyTerms)
+    Values = Sub.Values[:,Sub.Find(1,[Field])[0]]
 
-    # Stack energies for comparison among subsystems
-    for RunFile in RunFiles:
+    # List of subsystems, those with any of the terms, as --terms may
+    # leave out the total interaction energy
+    Clusters = Sub.Axes[3]
+    Present  = ~isnan(Values[ix_(Files,Terms,arange(len(Clusters)))]).any(axis=1)
 
-        # It's a bit difficult to sort therefore use OrdLabel
-        #EnergyTerms = Energies[RunFile].keys()
-        #EnergyTerms.sort()
+    ComplexList = sorted([Clusters[i] for i in nonzero(Present[0])[0]],key=lambda x: int(x))
 
-        EnergyTable = [[TableHeader]]
+    # Stack energies for comparison among subsystems
+    for Row, RunFile in enumerate(RunFiles):
 
-        TempList = list(Energies[RunFile][Field]['DE(HF)'].keys())
-        TempList.sort(key=lambda x: int(x))
+        TempList = sorted([Clusters[i] for i in nonzero(Present[Row])[0]],key=lambda x: int(x))
 
         if ComplexList != TempList:
             ComplexList = TempList
             Compare = False
 
-        EnergyTable[0].extend(ComplexList)
+        Table = Values[Files[Row]][ix_(Terms,Sub.Find(3,ComplexList))]
+        EnergyTables[RunFile] = TABLE(TableHeader,EnergyTerms,ComplexList,Table.T)
 
-        for Column, EnergyTerm in enumerate(EnergyTerms):
+    # Stack energies for comparison among files
+    if Compare:
 
-            EnergyTable.append([EnergyTerm])
+        for Cluster in ComplexList:
+            Table = Values[ix_(Files,Terms,Sub.Find(3,[Cluster]))][:,:,0]
+            ClusterTables[Cluster] = TABLE(TableHeader,EnergyTerms,RunFiles,Table)
 
-            for Cluster in ComplexList:
-                if Cluster in Energies[RunFile][Field][EnergyTerm]:
-                    EnergyTable[Column+1].append(Energies[RunFile][Field][EnergyTerm][Cluster])
-                else:
-                    EnergyTable[Column+1].append('-')
+def FormatOrders(OrderTables,Energies,Labels):
+    """
+    Form tabularized energies of subsystems by n-body order.
 
-        #EnergyTable = transpose(array(EnergyTable,PyObject))
-        EnergyTable = transpose(array(EnergyTable))
-        EnergyTables[RunFile] = EnergyTable
+        OrderTables[Order][File] is a table of all subsystems of the order
+        in the file, a row for each monomer tuple.
+    """
 
-    # Stack energies for comparison among files
-    if Compare:
+    EnergyTerms = Labels['SubLabel']
 
-        for Cluster in ComplexList:
-            
-            ClusterTable = [[TableHeader]]
-            ClusterTable[0].extend(RunFiles)
+    if State.OutFormat == 'tex':
+        TableHeader = '%'
+    else:
+        TableHeader = '#'
 
-            for Column, EnergyTerm in enumerate(EnergyTerms):
+    Orders  = Energies.Orders
+    Columns = Orders.Columns(EnergyTerms)
 
-                ClusterTable.append([EnergyTerm])
+    for Order in Orders.Orders():
+        Stack  = Orders.Order(Order)
+        Table  = Stack['Values'][:,Columns]
+        Tuples = ['-'.join(['%d' % Monomer for Monomer in Monomers]) for Monomers in Stack['Monomers'].tolist()]
 
-                for RunFile in RunFiles:
-                    if Cluster in Energies[RunFile][Field][EnergyTerm]:
-                        ClusterTable[Column+1].append(Energies[RunFile][Field][EnergyTerm][Cluster])
-                    else:
-                        ClusterTable[Column+1].append('-')
+        # rows of each file follow one another
+        Bounds = searchsorted(Stack['Files'],arange(len(Stack['Titles'])+1))
 
-            #ClusterTable = transpose(array(ClusterTable,PyObject))
-            ClusterTable = transpose(array(ClusterTable))
-            ClusterTables[Cluster] = ClusterTable
+        OrderTables[Order] = {}
+        for n, RunFile in enumerate(Stack['Titles']):
+            Rows = slice(Bounds[n],Bounds[n+1])
+            OrderTables[Order][RunFile] = TABLE(TableHeader,EnergyTerms,Tuples[Rows],Table[Rows])
 
 #----------------------------------------------------------------------------
 # Format Many Body Energies
@@ -1147,9 +3114,8 @@ def FormatMnbEnergies(MbodyTables,Energies,Labels):
     """
     Form tabularized many body energies.
     
-        Energies are stuck in a following dictionary:
-        Energies{'File':
-                {'Component': Value }}
+        Energies are stuck in an ENERGY_STORE, many body terms being
+        Energies.Mnb.Values[File,Field,Component]
     """
 
     # Labels of interaction energy components
@@ -1157,30 +3123,18 @@ def FormatMnbEnergies(MbodyTables,Energies,Labels):
     Field=(0,0,0)
 
     # List of files
-    RunFiles = list(Energies.keys())
-    RunFiles.sort()
+    RunFiles = Energies.Titles()
 
-    if OutFormat == 'tex':
+    if State.OutFormat == 'tex':
         TableHeader = '%'
     else:
         TableHeader = '#'
 
     # Stack energies for comparison among subsystems
-    MbodyTable = [[TableHeader]]
-    MbodyTable[0].extend(RunFiles)
-
-    for Column, EnergyTerm in enumerate(EnergyTerms):
-
-        MbodyTable.append([EnergyTerm])
+    Mnb   = Energies.Mnb
+    Table = Mnb.Values[ix_(Mnb.Find(0,RunFiles),Mnb.Find(1,[Field]),Mnb.Find(2,EnergyTerms))][:,0]
 
-        for RunFile in RunFiles:
-            if EnergyTerm in Energies[RunFile][Field]:
-                MbodyTable[Column+1].append(Energies[RunFile][Field][EnergyTerm])
-            else:
-                MbodyTable[Column+1].append('-')
-
-    MbodyTable = transpose(array(MbodyTable))
-    MbodyTables[Field] = MbodyTable
+    MbodyTables[Field] = TABLE(TableHeader,EnergyTerms,RunFiles,Table)
 
 #----------------------------------------------------------------------------
 # Format Field Energies
@@ -1188,318 +3142,970 @@ def FormatMnbEnergies(MbodyTables,Energies,Labels):
 def FormatFieldEnergies(FieldTables,Energies,Labels):
     """
     Form tabularized field energies.
-        Energies are stuck in a following dictionary:
-        Energies{'File':
-                {'Component': Value }}
+
+        Energies are stuck in an ENERGY_STORE, many body terms being
+        Energies.Mnb.Values[File,Field,Component]
     """
 
-    RunFiles = sorted(Energies.keys())
+    RunFiles = Energies.Titles()
 
-    FieldLabels = []
     RunFieldLabels = []
-    EnLabels = []
+    Files          = []
+    Fields         = []
+
+    Mnb = Energies.Mnb
+
+    # all fields of the campaign in the canonical order
+    Grid = set([Field for RunFile in RunFiles for Field in Energies.Fields[RunFile]])
+    Grid = dict([(Field, Column) for Column, Field in enumerate(sorted(Grid,key=FieldKey))])
 
     for RunFile in RunFiles:
-        Fields = list(Energies[RunFile].keys())
-        Fields = sorted(sorted(sorted(Fields,SortY),SortZ),SortX)
-        #Fields = sorted( sorted( sorted(Fields, lambda a,b: cmp(abs(a[0]), abs(b[0]))), lambda a,b: cmp(abs(a[1]), abs(b[1]))), lambda a,b: cmp(abs(a[2]), abs(b[2])))
-        for Field in Fields:
-            RunFieldLabel=RunFile+'FIELD='+str(Field)
-            if FieldLabels.count(Field) == 0:
-                FieldLabels.append(Field)
-            if RunFieldLabels.count(RunFieldLabel) == 0:
-                RunFieldLabels.append(RunFieldLabel)
-            
-            for EnLabel in list(Energies[RunFile][Field].keys()):
-                if EnLabels.count(EnLabel) == 0:
-                    EnLabels.append(EnLabel)
+        RunFields = sorted(Energies.Fields[RunFile],key=Grid.__getitem__)
+        for Field in RunFields:
+            RunFieldLabels.append((RunFile,Field))
+            Files.append(RunFile)
+            Fields.append(Field)
 
     EnergyTerms = Labels['MnbLabel']
 
-    if OutFormat == 'tex':
+    if State.OutFormat == 'tex':
         TableHeader = '%'
     else:
         TableHeader = '#'
     
     # Stack energies for comparison among subsystems
-    FieldTable = [[TableHeader]]
-    FieldTable[0].extend(RunFieldLabels)
-    
-    for Column, EnergyTerm in enumerate(EnergyTerms):
-    
-        FieldTable.append([EnergyTerm])
-    
-        for RunFile in RunFiles:
-            Fields = list(Energies[RunFile].keys())
-            Fields = sorted(sorted(sorted(Fields,SortY),SortZ),SortX)
-            for Field in Fields:
-                if EnergyTerm in Energies[RunFile][Field]:
-                    FieldTable[Column+1].append(Energies[RunFile][Field][EnergyTerm])
-                else:
-                    FieldTable[Column+1].append('-')
-    
-    FieldTable = transpose(array(FieldTable))
-    FieldTables['MnbEn'] = FieldTable
+    Table = Mnb.Values[Mnb.Find(0,Files),Mnb.Find(1,Fields)][:,Mnb.Find(2,EnergyTerms)]
+
+    FieldTables['MnbEn'] = TABLE(TableHeader,EnergyTerms,RunFieldLabels,Table)
 
 #----------------------------------------------------------------------------
 # Write Energies
 #----------------------------------------------------------------------------
-def WriteEnergies(TitleLen,EnergyTables,ClusterTables,MbodyTables,FieldTables):
+def WriteEnergies(TitleLen,EnergyTables,ClusterTables,MbodyTables,FieldTables,Labels):
     """Save data to file."""
 
-    if OutFormat == 'csv':
-        Separator = ' ;'
-        C         = '#'
-        EndRow    = '\n'
-        DataFileN = 'energies.csv'
-    elif OutFormat == 'tex':
-        Separator = ' &'
-        C         = '%'
-        EndRow    = '\\\\\n'
-        DataFileN = 'energies.tex'
-    else:
-        Separator = '; '
-        C         = '#'
-        EndRow    = '\n'
-        DataFileN = 'energies.txt'
+    DataFile=open(EnergyFileName(),'w')
 
-    DataFile=open(DataFileN,'w')
+    Layout = TABLE_FORMAT(TitleLen,LabelWidths(Labels)[0])
+
+    TableHeader = WriteFileTables(DataFile,Layout,EnergyTables)
+    WriteSummaryTables(DataFile,Layout,TableHeader,ClusterTables,MbodyTables,FieldTables)
+
+    # Close data file
+    DataFile.close()
+
+def EnergyFileName(Order=None):
+    Name = 'energies'
+    if Order is not None:
+        Name += '-%dbody' % Order
+
+    if State.OutFormat == 'csv':
+        return Name+'.csv'
+    elif State.OutFormat == 'tex':
+        return Name+'.tex'
+    return Name+'.txt'
+
+def WriteOrders(OrderFiles,Layout,OrderTables):
+    """Write energies of subsystems of each n-body order to its own file, opened on first use."""
+
+    for Order in sorted(OrderTables):
+        if Order not in OrderFiles:
+            OrderFiles[Order] = open(EnergyFileName(Order),'w')
+        WriteFileTables(OrderFiles[Order],Layout,OrderTables[Order])
+
+def WriteFileTables(DataFile,Layout,EnergyTables):
+    """Write interaction energies of subsystems for each file."""
 
     Files = list(EnergyTables.keys())
     Files.sort()
 
+    TableHeader = ''
+
+    for File in Files:
+        Table  = EnergyTables[File]
+        Labels = [Label.replace('(CORR)','') for Label in Table.Columns]
+        TableHeader = WriteEnergyTable(DataFile,Layout,Layout.C+' %s\n\n' % File,Table,Labels,Layout.Title)
+
+    return TableHeader
+
+def WriteSummaryTables(DataFile,Layout,TableHeader,ClusterTables,MbodyTables,FieldTables):
+    """Write the tables comparing the files."""
+
+    C = Layout.C
+
     Clusters = list(ClusterTables.keys())
     Clusters.sort(key=lambda x: int(x))
 
-    ConFac = EnUnits['ConFac']
-    Format = EnUnits['Format']
-    RoundE = EnUnits['Round']
-    LabLen = max(EnUnits['LabLen'])
+    FileTitle = lambda Title: Layout.Title(FileName(Title))
 
-    if OutFormat == 'tex':
-        TitleFormat = '%-' + str(TitleLen) + 's' + Separator
-        LabelFormat = ' %' + str(LabLen) + 's ' + Separator
-    else:
-        TitleFormat = '"%-' + str(TitleLen) + 's"' + Separator
-        LabelFormat = '"%' + str(LabLen) + 's"' + Separator
+    # This time compare respective components in files
+    for Cluster in Clusters:
+        Table  = ClusterTables[Cluster]
+        Labels = [Label.replace('(CORR)','') for Label in Table.Columns]
+        TableHeader = WriteEnergyTable(DataFile,Layout,C+' Subsystem No: %s\n\n' % Cluster,Table,Labels,FileTitle)
 
-    ValueFormat = Format.replace('%ln','%'+str(LabLen+2))+Separator
+    # Write many body energy components
+    if State.OutFormat == 'tex':
+        DataFile.write(TableHeader)
 
-    # Write interaction energies for all files
-    for File in Files:
+    if State.ManyBody:
+        Table  = MbodyTables[(0,0,0)]
+        Labels = [Label.replace('(MNB)','').replace(' ','') for Label in Table.Columns]
+        TableHeader = WriteEnergyTable(DataFile,Layout,C+' Many-body energy terms for selected systems\n\n',
+                                       Table,Labels,FileTitle)
 
-        Table = EnergyTables[File]
+    # Write many body field energy components
+    if State.OutFormat == 'tex':
+        DataFile.write(TableHeader)
 
-        # Write table header
-        DataFile.write(C+' %s\n\n' % File)
+    if State.FiniteField:
+        Table  = FieldTables['MnbEn']
+        Labels = [Label.replace('(MNB)','').replace(' ','') for Label in Table.Columns]
 
-        if OutFormat == 'tex':
-            TableHeader = '\\begin{tabular}{@{\extracolsep{\\fill}}l' + (len(Table)-1) * ' r' + '}\hline' + EndRow
-            TableFooter = '\\end{tabular}' + EndRow
-            DataFile.write(TableHeader)
+        # the field goes first and the file is added as a comment
+        FieldTitle = lambda Row: Layout.Title('%7.4f, %7.4f, %7.4f' % tuple(Row[1]))
+        FieldEnd   = lambda Row: Layout.Title(C)+' '+Row[0]+Layout.EndRow
 
-        DataFile.write(TitleFormat % Table[0][0])
-        for Column in range(len(Table[0])-1):
-            Label = Table[0][Column+1].replace('(CORR)','')
-            DataFile.write(LabelFormat % Label.rjust(LabLen))
+        WriteEnergyTable(DataFile,Layout,C+' Many-body energy terms for selected fields\n\n',
+                         Table,Labels,FieldTitle,FieldEnd)
 
-        DataFile.write(EndRow)
+def WriteEnergyTable(DataFile,Layout,Comment,Table,Labels,Title,End=None):
+    """
+    Write a table of energies.
 
-        if OutFormat == 'tex':
-            DataFile.write(TitleFormat % Table[0][0])
-            for Column in range(len(Table[0])-1):
-                Label = Table[0][Column+1].replace('(CORR)','')
-                Label = TexLabel(Label)
-                DataFile.write(LabelFormat % Label.rjust(LabLen))
+        The rows are rendered and written a block at a time, Title (and
+        End) giving the first (and last) cell of a row from its label.
+        Returns the tex header of the table.
+    """
 
-            DataFile.write(EndRow)
+    EndRow      = Layout.EndRow
+    ValueFormat = Layout.Value(State.EnUnits['Format'])
+    TableHeader = ''
 
-        for Row in range(len(Table)-1):
-            DataFile.write(TitleFormat % Table[Row+1][0])
+    # tables left without columns by --terms are not written
+    if not len(Labels):
+        return TableHeader
 
-            for Column in range(len(Table[Row])-1):
-                EnValue = Table[Row+1][Column+1]
+    # Write table header
+    Out = [Comment]
 
-                try:
-                    EnValue = round(float(EnValue)*ConFac,RoundE)
-                    DataFile.write(ValueFormat % EnValue)
-                except TypeError:
-                    EnValue = float(EnValue)*ConFac
-                    DataFile.write(ValueFormat % EnValue)
-                except ValueError:
-                    DataFile.write(LabelFormat % EnValue.rjust(LabLen))
+    if State.OutFormat == 'tex':
+        TableHeader = '\\begin{tabular}{@{\\extracolsep{\\fill}}l' + len(Table) * ' r' + '}\\hline' + EndRow
+        Out.append(TableHeader)
 
-            DataFile.write(EndRow)
+    Out.append(Layout.Header(Table.Corner,Labels))
 
-        if OutFormat == 'tex':
-            DataFile.write(TableFooter)
-        DataFile.write('\n')
+    if State.OutFormat == 'tex':
+        Out.append(Layout.Header(Table.Corner,[TexLabel(Label) for Label in Labels]))
 
-    # This time compare respective components in files
-    for Cluster in Clusters:
-        Table = ClusterTables[Cluster]
+    for Rows, Values in Table.Blocks():
+        Titles = [Title(Row) for Row in Rows]
+        Ends   = [End(Row) for Row in Rows] if End else None
+        Out.append(Layout.Rows(Titles,ConvertEnergies(Values),ValueFormat,Ends))
+        DataFile.write(''.join(Out))
+        Out = []
 
-        # Write table header
-        DataFile.write(C+' Subsystem No: %s\n\n' % Cluster)
+    if State.OutFormat == 'tex':
+        Out.append('\\end{tabular}' + EndRow)
+    Out.append('\n')
 
-        if OutFormat == 'tex':
-            TableHeader = '\\begin{tabular}{@{\extracolsep{\\fill}}l' + (len(Table)-1) * ' r' + '}\hline' + EndRow
-            TableFooter = '\\end{tabular}' + EndRow
-            DataFile.write(TableHeader)
+    DataFile.write(''.join(Out))
 
-        DataFile.write(TitleFormat % Table[0][0])
+    return TableHeader
 
-        for Column in range(len(Table[0])-1):
-            Label = Table[0][Column+1].replace('(CORR)','')
-            DataFile.write(LabelFormat % Label.rjust(LabLen))
+def ConvertEnergies(Values):
+    """Table of energies in au converted to the energy units and rounded."""
 
-        DataFile.write(EndRow)
+    Values = Values*State.EnUnits['ConFac']
+    if State.EnUnits['Round'] != '':
+        Values = around(Values,State.EnUnits['Round'])
 
-        if OutFormat == 'tex':
-            DataFile.write(TitleFormat % Table[0][0])
-            for Column in range(len(Table[0])-1):
-                Label = Table[0][Column+1].replace('(CORR)','')
-                Label = TexLabel(Label)
-                DataFile.write(LabelFormat % Label.rjust(LabLen))
+    return Values
 
-            DataFile.write(EndRow)
+#----------------------------------------------------------------------------
+# Table layout
+#----------------------------------------------------------------------------
+class TABLE_FORMAT:
+    """
+    Layout of txt, csv and tex tables.
 
-        for Row in range(len(Table)-1):
-            DataFile.write(TitleFormat % Table[Row+1][0].split()[1].replace('.log',''))
+        Tables are rendered a row of labels or a block of rows at a time,
+        each with a single format call, so that they can be written to a
+        file in one go.
+    """
 
-            for Column in range(len(Table[Row])-1):
-                EnValue = Table[Row+1][Column+1]
-                try:
-                    EnValue = round(float(EnValue)*ConFac,RoundE)
-                    DataFile.write(ValueFormat % EnValue)
-                except TypeError:
-                    EnValue = float(EnValue)*ConFac
-                    DataFile.write(ValueFormat % EnValue)
-                except ValueError:
-                    DataFile.write(LabelFormat % EnValue.rjust(LabLen))
+    def __init__(self,TitleLen,LabLen):
+        if State.OutFormat == 'csv':
+            self.Separator = ' ;'
+            self.C         = '#'
+            self.EndRow    = '\n'
+        elif State.OutFormat == 'tex':
+            self.Separator = ' &'
+            self.C         = '%'
+            self.EndRow    = '\\\\\n'
+        else:
+            self.Separator = '; '
+            self.C         = '#'
+            self.EndRow    = '\n'
 
-            DataFile.write(EndRow)
+        self.LabLen = LabLen
 
-        if OutFormat == 'tex':
-            DataFile.write(TableFooter)
-        DataFile.write('\n')
+        if State.OutFormat == 'tex':
+            self.TitleFormat = '%-' + str(TitleLen) + 's' + self.Separator
+            self.LabelFormat = ' %' + str(LabLen) + 's ' + self.Separator
+        else:
+            self.TitleFormat = '"%-' + str(TitleLen) + 's"' + self.Separator
+            self.LabelFormat = '"%' + str(LabLen) + 's"' + self.Separator
 
-    # Write many body energy components
-    if OutFormat == 'tex':
-        DataFile.write(TableHeader)
+        # missing values
+        self.Missing = self.LabelFormat % '-'.rjust(LabLen)
 
-    if ManyBody:
-
-        Table = MbodyTables[(0,0,0)]
-
-        # Write table header
-        DataFile.write(C+' Many-body energy terms for selected systems\n\n')
-
-        if OutFormat == 'tex':
-            TableHeader = '\\begin{tabular}{@{\extracolsep{\\fill}}l' + (len(Table)-1) * ' r' + '}\hline' + EndRow
-            TableFooter = '\\end{tabular}' + EndRow
-            DataFile.write(TableHeader)
-
-        DataFile.write(TitleFormat % Table[0][0])
-       
-        for Column in range(len(Table[0])-1):
-            Label = Table[0][Column+1].replace('(MNB)','')
-            Label = Label.replace(' ','')
-            DataFile.write(LabelFormat % Label.rjust(LabLen))
-        
-        DataFile.write(EndRow)
-       
-        if OutFormat == 'tex':
-            DataFile.write(TitleFormat % Table[0][0])
-            for Column in range(len(Table[0])-1):
-                Label = Table[0][Column+1].replace('(MNB)','')
-                Label = Label.replace(' ','')
-                Label = TexLabel(Label)
-                DataFile.write(LabelFormat % Label.rjust(LabLen))
-
-            DataFile.write(EndRow)
-
-        for Row in range(len(Table)-1):
-            DataFile.write(TitleFormat % Table[Row+1][0].split()[1].replace('.log',''))
-        
-            for Column in range(len(Table[Row])-1):
-                EnValue = Table[Row+1][Column+1]
-                try:
-                    EnValue = round(float(EnValue)*ConFac,RoundE)
-                    DataFile.write(ValueFormat % EnValue)
-                except TypeError:
-                    EnValue = float(EnValue)*ConFac
-                    DataFile.write(ValueFormat % EnValue)
-                except ValueError:
-                    DataFile.write(LabelFormat % EnValue.rjust(LabLen))
-        
-            DataFile.write(EndRow)
-        
-        if OutFormat == 'tex':
-            DataFile.write(TableFooter)
-        DataFile.write('\n')
+    def Title(self,Title):
+        """First cell of a row."""
+        return self.TitleFormat % Title
 
-    # Write many body field energy components
-    if OutFormat == 'tex':
-        DataFile.write(TableHeader)
+    def Value(self,Format):
+        """Format of a value cell given with the '%ln' width placeholder."""
+        return Format.replace('%ln','%'+str(self.LabLen+2))+self.Separator
 
-    if FiniteField:
-
-        Table = FieldTables['MnbEn']
-        #savetxt('test.out', Table, fmt='%'+str(TitleLen)+'s'+(len(Table[0])-1)*'%23s')
-
-        # Write table header
-        DataFile.write(C+' Many-body energy terms for selected fields\n\n')
-
-        if OutFormat == 'tex':
-            TableHeader = '\\begin{tabular}{@{\extracolsep{\\fill}}l' + (len(Table)-1) * ' r' + '}\hline' + EndRow
-            TableFooter = '\\end{tabular}' + EndRow
-            DataFile.write(TableHeader)
-
-        DataFile.write(TitleFormat % Table[0][0])
-       
-        for Column in range(len(Table[0])-1):
-            Label = Table[0][Column+1].replace('(MNB)','')
-            Label = Label.replace(' ','')
-            DataFile.write(LabelFormat % Label.rjust(LabLen))
-        
-        DataFile.write(EndRow)
-       
-        if OutFormat == 'tex':
-            DataFile.write(TitleFormat % Table[0][0])
-            for Column in range(len(Table[0])-1):
-                Label = Table[0][Column+1].replace('(MNB)','')
-                Label = Label.replace(' ','')
-                Label = TexLabel(Label)
-                DataFile.write(LabelFormat % Label.rjust(LabLen))
-        
-            DataFile.write(EndRow)
-
-        for Row in range(len(Table)-1):
-            FieldString='%7.4f, %7.4f, %7.4f' % tuple(asarray(mat( Table[Row+1][0].split('FIELD=')[1] )).tolist()[0])
-            DataFile.write(TitleFormat % FieldString)
-        
-            for Column in range(len(Table[Row])-1):
-                EnValue = Table[Row+1][Column+1]
-                try:
-                    EnValue = round(float(EnValue)*ConFac,RoundE)
-                    DataFile.write(ValueFormat % EnValue)
-                except TypeError:
-                    EnValue = float(EnValue)*ConFac
-                    DataFile.write(ValueFormat % EnValue)
-                except ValueError:
-                    DataFile.write(LabelFormat % EnValue.rjust(LabLen))
-        
-            DataFile.write(TitleFormat % C+' '+Table[Row+1][0].split('FIELD=')[0])
-            DataFile.write(EndRow)
-        
-        if OutFormat == 'tex':
-            DataFile.write(TableFooter)
-        DataFile.write('\n')
+    def Header(self,Corner,Labels):
+        """Row of column labels."""
+        return self.TitleFormat % Corner + \
+               (self.LabelFormat*len(Labels)) % tuple([Label.rjust(self.LabLen) for Label in Labels]) + \
+               self.EndRow
+
+    def Rows(self,Titles,Values,Format,Ends=None):
+        """
+        Rows of a table of values.
+
+            Titles (and Ends, EndRow by default) are the formatted first
+            (and last) cells of the rows. NaN values are written as '-'.
+        """
+
+        if Ends is None:
+            Ends = len(Titles)*[self.EndRow]
+
+        Mask = isnan(Values)
+
+        Full = Format*Values.shape[1]
+        Gap  = self.Missing.replace('%','%%')
+
+        Template = []
+        for Row in range(len(Titles)):
+            Template.append(Titles[Row].replace('%','%%'))
+            if Mask[Row].any():
+                Template.append(''.join([Gap if Skip else Format for Skip in Mask[Row]]))
+            else:
+                Template.append(Full)
+            Template.append(Ends[Row].replace('%','%%'))
+
+        return ''.join(Template) % tuple(Values[~Mask].tolist())
+
+#----------------------------------------------------------------------------
+# Finite field derivatives
+#----------------------------------------------------------------------------
+# Diagonal components differentiated along each axis, and the order of
+# the derivative giving each property
+DerivativeAxes   = ['x', 'y', 'z']
+DerivativeOrders = collections.OrderedDict([('Mu',1), ('Alpha',2), ('Beta',3), ('Gamma',4)])
+
+def FieldDerivatives(Energies,Labels):
+    """
+    Interaction induced properties of all energy terms from the field energies.
+
+        The many-body energy terms E(F) of the fields applied along an axis
+        are differentiated with central difference stencils,
+
+            Mu    = -(E(h)-E(-h))/2h
+            Alpha = -(E(h)-2E(0)+E(-h))/h^2
+            Beta  = -(E(2h)-2E(h)+2E(-h)-E(-2h))/2h^3
+            Gamma = -(E(2h)-4E(h)+6E(0)-4E(-h)+E(-2h))/h^4
+
+        for each field strength h for which the grid holds all the points,
+        and the estimates are extrapolated to h=0 (Richardson). All files
+        and terms are differentiated at once, giving arrays of shape
+        (files, terms) keyed by (Property, Component), in au. Missing
+        points give NaN. E(0) is taken from the subsystem energies of the
+        whole system when the many-body terms of the zero field are not
+        printed.
+    """
+
+    Mnb      = Energies.Mnb
+    Files    = Energies.Titles()
+    Terms    = Labels['MnbLabel']
+    Fields   = Mnb.Axes[1]
+
+    # energies of all files and terms at a field
+    def Energy(Field):
+        return Mnb.Values[ix_(Mnb.Find(0,Files),Mnb.Find(1,[Field]),Mnb.Find(2,Terms))][:,0]
+
+    Zero = Energy((0.0,0.0,0.0))
+    Free = FieldFreeEnergies(Energies,Files,Terms)
+    Zero = where(isnan(Zero),Free,Zero)
+
+    Estimates = {}
+
+    for Axis, Component in enumerate(DerivativeAxes):
+        # field strengths applied along the axis in both directions
+        Signs = {}
+        for Field in Fields:
+            if Field[Axis] != 0.0 and list(Field).count(0.0) == 2:
+                Signs.setdefault(FieldStep(abs(Field[Axis])),set()).add(Field[Axis] > 0.0)
+        Steps = sorted([Step for Step in Signs if len(Signs[Step]) == 2])
+
+        def Point(Step):
+            Field = [0.0, 0.0, 0.0]
+            Field[Axis] = FieldStep(Step)
+            return Energy(tuple(Field))
+
+        for Property in DerivativeOrders:
+            Estimates[(Property,Component*DerivativeOrders[Property])] = ([], [])
+
+        for h in Steps:
+            Plus, Minus = Point(h), Point(-h)
+            Estimates[('Mu',Component)][0].append(h)
+            Estimates[('Mu',Component)][1].append(-(Plus-Minus)/(2.0*h))
+            Estimates[('Alpha',2*Component)][0].append(h)
+            Estimates[('Alpha',2*Component)][1].append(-(Plus-2.0*Zero+Minus)/h**2)
+
+            # stencils reaching twice as far
+            if FieldStep(2.0*h) in Steps:
+                Plus2, Minus2 = Point(2.0*h), Point(-2.0*h)
+                Estimates[('Beta',3*Component)][0].append(h)
+                Estimates[('Beta',3*Component)][1].append(-(Plus2-2.0*Plus+2.0*Minus-Minus2)/(2.0*h**3))
+                Estimates[('Gamma',4*Component)][0].append(h)
+                Estimates[('Gamma',4*Component)][1].append(-(Plus2-4.0*Plus+6.0*Zero-4.0*Minus+Minus2)/h**4)
+
+    # Mu x, Mu y, Mu z, Alpha xx, ... in order
+    Derivatives = collections.OrderedDict()
+    for Property in DerivativeOrders:
+        for Component in DerivativeAxes:
+            Steps, Values = Estimates[(Property,Component*DerivativeOrders[Property])]
+            if Values:
+                Values = Richardson(Steps,Values)
+            else:
+                Values = full((len(Files),len(Terms)),nan)
+            Derivatives[(Property,Component*DerivativeOrders[Property])] = Values
+
+    return Files, Terms, Derivatives
+
+def FieldStep(Strength):
+    """Field strength as printed in the log, to match the steps of a grid."""
+    return float('%.6f' % Strength)
+
+def FieldFreeEnergies(Energies,Files,Terms):
+    """Many-body terms of the zero field taken from the whole system."""
+
+    Sub = Energies.Sub
+    if not Sub.Axes[3]:
+        return full((len(Files),len(Terms)),nan)
+
+    Whole = sorted(Sub.Axes[3],key=int)[-1]
+    Plain = [Term.replace('(MNB)','') for Term in Terms]
+
+    return Sub.Values[ix_(Sub.Find(0,Files),Sub.Find(1,[(0,0,0)]),Sub.Find(2,Plain),Sub.Find(3,[Whole]))][:,0,:,0]
+
+def Richardson(Steps,Estimates):
+    """
+    Extrapolate central difference estimates to zero step.
+
+        The errors of central differences go as h^2, h^4, ..., so the
+        estimates are extrapolated to h^2=0 with Neville's scheme; for
+        steps h and 2h this is (4D(h)-D(2h))/3.
+    """
+
+    X = [h*h for h in Steps]
+    P = list(Estimates)
+
+    for Level in range(1,len(P)):
+        P = [(X[i+Level]*P[i]-X[i]*P[i+1])/(X[i+Level]-X[i]) for i in range(len(P)-1)]
+
+    return P[0]
+
+def WriteDerivatives(TitleLen,Energies,Labels):
+    """Save the finite field properties of the energy terms to file."""
+
+    Files, Terms, Derivatives = FieldDerivatives(Energies,Labels)
+
+    if State.OutFormat == 'csv':
+        DataFile = open('derivatives.csv','w')
+    elif State.OutFormat == 'tex':
+        DataFile = open('derivatives.tex','w')
+    else:
+        DataFile = open('derivatives.txt','w')
+
+    Layout  = TABLE_FORMAT(TitleLen,LabelWidths(Labels)[0])
+    C       = Layout.C
+    EndRow  = Layout.EndRow
+    Labels  = [Term.replace('(MNB)','').replace(' ','') for Term in Terms]
+    Titles  = [Layout.Title(FileName(File)) for File in Files]
+    Corner  = '%' if State.OutFormat == 'tex' else '#'
+
+    DataFile.write(C+' Finite Field Estimates of Interaction Induced Properties from the Energy Terms\n'+C+'\n')
+
+    # tables left without columns by --terms are not written
+    if not Terms:
+        Derivatives = {}
+
+    for Property, Component in Derivatives:
+        Values = around(Derivatives[(Property,Component)] * State.PropertyConFac[Property],
+                        State.PrUnits['Round'][PROPERTY_STORE.Precision[Property]])
+
+        Out = [C+' %s %s\n' % (Property, Component) + C + '\n']
+        if State.OutFormat == 'tex':
+            Out.append('\\begin{tabular}{@{\\extracolsep{\\fill}}l' + len(Terms) * ' r' + '}\\hline' + EndRow)
+        Out.append(Layout.Header(Corner,Labels))
+        if State.OutFormat == 'tex':
+            Out.append(Layout.Header(Corner,[TexLabel(Label) for Label in Labels]))
+        Out.append(Layout.Rows(Titles,Values,Layout.Value(State.PropertyFormats[Property])))
+        if State.OutFormat == 'tex':
+            Out.append('\\end{tabular}' + EndRow)
+        Out.append('\n')
+
+        DataFile.write(''.join(Out))
+
+    DataFile.close()
+
+#----------------------------------------------------------------------------
+# Many-body expansion
+#----------------------------------------------------------------------------
+def ManyBodyExpansion(Energies,Labels):
+    """
+    n-body terms of all energy components rebuilt from the subsystems.
+
+        The interaction energy of a subsystem S is the sum of the
+        non-additive terms of all its subsets of two or more monomers,
+
+            DE(S) = sum of d(T) for T in S, |T| >= 2
+
+        so going up from the dimers d(S) is DE(S) less the d(T) of its
+        proper subsets. Each order is done for all files, subsystems and
+        terms at once, the subsets being found by integer keys of their
+        monomer tuples, and the d(S) are summed over the subsystems of each
+        file. Returns the files, the terms, an OrderedDict of arrays of
+        shape (files, terms) with the n-body terms of each order n, in au,
+        and one of the files having subsystems of each order; a subset
+        missing from a log makes its terms NaN.
+    """
+
+    Orders = Energies.Orders
+    Files  = Energies.Titles()
+    Terms  = Labels['SubLabel']
+    Index  = dict([(File, Row) for Row, File in enumerate(Files)])
+
+    Columns = Orders.Columns(Terms)
+    Stacks  = collections.OrderedDict([(Order, Orders.Order(Order)) for Order in Orders.Orders() if Order >= 2])
+
+    # monomers are the digits of the keys, the file going first
+    Base = 1
+    for Stack in Stacks.values():
+        Base = maximum(Base,Stack['Monomers'].max()+1)
+
+    def Keys(Rows,Monomers):
+        Keys = Rows.astype(int64)
+        for Column in range(Monomers.shape[1]):
+            Keys = Keys*Base + Monomers[:,Column]
+        return Keys
+
+    # non-additive terms of each order with the sorted keys of their
+    # subsystems and a spare row of NaN which missing subsets point to
+    Known     = {}
+    Expansion = collections.OrderedDict()
+    Present   = collections.OrderedDict()
+
+    for Order, Stack in Stacks.items():
+        if len(Files)*float(Base)**Order >= 2.0**62:
+            raise ValueError('Too many monomers to expand to %d bodies' % Order)
+
+        Rows  = array([Index[Title] for Title in Stack['Titles']],dtype=int)[Stack['Files']]
+        Delta = Stack['Values'][:,Columns]
+
+        for Subset in range(2,Order):
+            for Positions in itertools.combinations(range(Order),Subset):
+                if Subset not in Known:
+                    Delta = Delta + nan
+                    continue
+                Sorted, Sort, Values = Known[Subset]
+                Wanted = Keys(Rows,Stack['Monomers'][:,list(Positions)])
+                Found  = minimum(searchsorted(Sorted,Wanted),len(Sorted)-1)
+                Delta  = Delta - Values[where(Sorted[Found] == Wanted,Sort[Found],len(Sort))]
+
+        Own  = Keys(Rows,Stack['Monomers'])
+        Sort = argsort(Own)
+        Known[Order] = (Own[Sort], Sort, concatenate((Delta,full((1,len(Terms)),nan))))
+
+        # files without subsystems of the order have no such terms
+        Sums = zeros((len(Files),len(Terms)))
+        add.at(Sums,Rows,Delta)
+        Present[Order] = bincount(Rows,minlength=len(Files)) > 0
+        Sums[~Present[Order]] = nan
+        Expansion[Order] = Sums
+
+    return Files, Terms, Expansion, Present
+
+def Cooperativity(Expansion):
+    """Ratios of the n-body terms of each order above two to the two-body terms."""
+
+    Ratios = collections.OrderedDict()
+    if 2 not in Expansion:
+        return Ratios
+
+    with errstate(divide='ignore',invalid='ignore'):
+        for Order in Expansion:
+            if Order > 2:
+                Ratios[Order] = Expansion[Order]/Expansion[2]
+
+    return Ratios
+
+def WriteExpansion(TitleLen,Energies,Labels):
+    """Save the many-body expansion of the energy terms and its cooperativity to file."""
+
+    Files, Terms, Expansion, Present = ManyBodyExpansion(Energies,Labels)
+
+    if State.OutFormat == 'csv':
+        DataFile = open('expansion.csv','w')
+    elif State.OutFormat == 'tex':
+        DataFile = open('expansion.tex','w')
+    else:
+        DataFile = open('expansion.txt','w')
+
+    Layout  = TABLE_FORMAT(TitleLen,LabelWidths(Labels)[0])
+    C       = Layout.C
+    EndRow  = Layout.EndRow
+    Labels  = [Term.replace('(CORR)','') for Term in Terms]
+    Corner  = '%' if State.OutFormat == 'tex' else '#'
+
+    FileTitle = lambda Title: Layout.Title(FileName(Title))
+
+    DataFile.write(C+' Many-body Expansion of the Energy Terms Rebuilt from the Subsystems\n'+C+'\n')
+
+    for Order in Expansion:
+        WriteEnergyTable(DataFile,Layout,C+' %d-body terms\n\n' % Order,
+                         TABLE(Corner,Terms,Files,Expansion[Order]),Labels,FileTitle)
+
+    # the expansion of each file goes up to its largest subsystems
+    if len(Expansion) > 1:
+        Total = sum(array([where(Present[Order][:,newaxis],Expansion[Order],0.0) for Order in Expansion]),axis=0)
+        WriteEnergyTable(DataFile,Layout,C+' Sum of the n-body terms\n\n',
+                         TABLE(Corner,Terms,Files,Total),Labels,FileTitle)
+
+    # ratios are written as they are
+    Titles = [FileTitle(File) for File in Files]
+    Ratios = Cooperativity(Expansion)
+
+    for Order in Ratios:
+        if not Terms: break
+        Out = [C+' Cooperativity, %d-body over 2-body terms\n\n' % Order]
+        if State.OutFormat == 'tex':
+            Out.append('\\begin{tabular}{@{\\extracolsep{\\fill}}l' + len(Terms) * ' r' + '}\\hline' + EndRow)
+        Out.append(Layout.Header(Corner,Labels))
+        if State.OutFormat == 'tex':
+            Out.append(Layout.Header(Corner,[TexLabel(Label) for Label in Labels]))
+        Out.append(Layout.Rows(Titles,around(Ratios[Order],4),Layout.Value('%ln.4f')))
+        if State.OutFormat == 'tex':
+            Out.append('\\end{tabular}' + EndRow)
+        Out.append('\n')
+
+        DataFile.write(''.join(Out))
 
-    # Close data file
     DataFile.close()
 
+#----------------------------------------------------------------------------
+# Streaming output
+#----------------------------------------------------------------------------
+
+# Logs parsed in a row by each job before the results are written
+StreamBatch = 64
+
+def StreamSession(LogFiles,Jobs,Cache):
+    """
+    Write the table of each log as soon as it is parsed.
+
+        A log is dropped once its table is written, except for a compact
+        copy of the rows the tables comparing the logs need, which goes
+        to a spill file. These tables are written at the end from arrays
+        mapped from disk, so memory does not grow with the number of logs.
+        The table of a log has the labels and widths known when it is
+        written, which are the final ones when the logs are alike.
+    """
+
+    Spill       = SPILL_FILE()
+    Report      = []
+    TitleLen    = [25]
+    TableHeader = ''
+
+    # Dictionary of sorted labels
+    OldLabel = SetLabels()
+
+    DataFile   = None
+    OrderFiles = {}
+
+    if State._TotEn_:
+        TotOutFile=open('toten.txt','w')
+
+    # the pool is restarted for each batch so that parsed logs do not
+    # pile up while the tables are written
+    Batch = StreamBatch*Jobs
+
+    # the logs are read in the order given, as when they are merged, so
+    # that the last one sets the run type of the tables comparing them
+    Labels = None
+    for Start in range(0,len(LogFiles),Batch):
+        for Log in ParseLogs(LogFiles[Start:Start+Batch],Jobs,Cache):
+            Energies   = ENERGY_STORE()
+            Properties = PROPERTY_STORE()
+            Labels = MergeLog(Log,OldLabel,TitleLen,Energies,Properties,{})
+
+            # only the widest titles are needed
+            TitleLen[:] = [max(TitleLen)]
+
+            if State._TotEn_:
+                with ProfileStage('writing'):
+                    for Title in Log['TotEnergies']:
+                        WriteTotEnergies(TotOutFile,Log['TotEnergies'][Title])
+
+            with ProfileStage('formatting'):
+                Tables = FormatLogTables(Energies,Properties,Labels)
+
+            with ProfileStage('writing'):
+                if DataFile is None:
+                    DataFile = open(EnergyFileName(),'w')
+                Layout = TABLE_FORMAT(max(TitleLen),LabelWidths(Labels)[0])
+                if Tables['Sub'] is not None:
+                    TableHeader = WriteFileTables(DataFile,Layout,{Tables['Title']: Tables['Sub']})
+                WriteOrders(OrderFiles,Layout,Tables.pop('Orders'))
+                Spill.Add(Tables)
+
+            if State.FieldProperties:
+                Report.extend(Properties.Validate())
+
+    if State._TotEn_:
+        TotOutFile.close()
+
+    if Labels is None:
+        Spill.Close()
+        raise IOError('No logs found in '+' '.join(LogFiles))
+
+    with ProfileStage('formatting'):
+        ClusterTables, MbodyTables, FieldTables, PropTables = Spill.Tables(Labels)
+
+    with ProfileStage('writing'):
+        Layout = TABLE_FORMAT(max(TitleLen),LabelWidths(Labels)[0])
+        WriteSummaryTables(DataFile,Layout,TableHeader,ClusterTables,MbodyTables,FieldTables)
+        DataFile.close()
+        for OrderFile in OrderFiles.values():
+            OrderFile.close()
+
+        if State.FieldProperties:
+            WriteProperties(max(TitleLen),PropTables,Labels)
+            WritePropertyCheck(Report)
+
+    Spill.Close()
+
+def FormatLogTables(Energies,Properties,Labels):
+    """Tables of a single log."""
+
+    EnergyTables = {}
+    MbodyTables  = {}
+    FieldTables  = {}
+    PropTables   = {}
+    OrderTables  = {}
+
+    if 'sub' in State.Projection['Sections']:
+        FormatSubEnergies(EnergyTables,{},Energies,Labels)
+
+        if State._NBody_:
+            FormatOrders(OrderTables,Energies,Labels)
+
+    # the run type of the last log sets which tables comparing the logs
+    # are written, so the many-body terms of every log are kept for them
+    if len(Energies.Mnb.Axes[2]):
+        FormatMnbEnergies(MbodyTables,Energies,Labels)
+        FormatFieldEnergies(FieldTables,Energies,Labels)
+
+    if State.FieldProperties:
+        FormatProperties(PropTables,Properties,Labels)
+
+    Title = Energies.Titles()[0]
+
+    return { 'Title' : Title,
+             'Sub'   : EnergyTables.get(Title),
+             'Orders': OrderTables,
+             'Mnb'   : MbodyTables.get((0,0,0)),
+             'Field' : FieldTables.get('MnbEn'),
+             'Prop'  : PropTables }
+
+class SPILL_FILE:
+    """Tables of the streamed logs kept in a temporary file"""
+
+    def __init__(self):
+        self.File    = tempfile.TemporaryFile(prefix='geds-spill-')
+        self.Offsets = {}
+
+        # logs with properties, the rows of the property tables
+        self.Properties = set()
+
+    def Add(self,Tables):
+        """Append the tables of a log, replacing those of an earlier log with the same title."""
+        self.File.seek(0,2)
+        self.Offsets[Tables['Title']] = self.File.tell()
+        if Tables['Prop']:
+            self.Properties.add(Tables['Title'])
+        else:
+            self.Properties.discard(Tables['Title'])
+        pickle.dump(Tables,self.File,pickle.HIGHEST_PROTOCOL)
+
+    def Load(self,Title):
+        self.File.seek(self.Offsets[Title])
+        return pickle.load(self.File)
+
+    def Close(self):
+        self.File.close()
+
+    def Tables(self,Labels):
+        """
+        Tables comparing the logs.
+
+            The rows of the logs are read back once, in the order of their
+            titles, into arrays mapped from temporary files; the field
+            energies are read back again as they are written.
+        """
+
+        Titles = sorted(self.Offsets)
+        Runs   = SortRuns([Title for Title in Titles if Title in self.Properties])
+
+        if State.OutFormat == 'tex':
+            TableHeader = '%'
+        else:
+            TableHeader = '#'
+
+        SubTerms = Labels['SubLabel']
+        MnbTerms = Labels['MnbLabel']
+        PropTerms = { 'Excess'     : Labels['TotPropLabel'] + Labels['ExcPropLabel'] + Labels['SumPropLabel'],
+                      'Interaction': list(Labels['IntPropLabel']) }
+
+        Compare  = len(Titles) > 1
+        Clusters = []
+        Sub      = None
+        Mnb      = None
+        Props    = {}
+        Fields   = 0
+
+        if State.ManyBody:
+            Mnb = SpillArray((len(Titles),len(MnbTerms)))
+
+        if State.FieldProperties:
+            for Property in State.PropertyLabels:
+                for Kind in PropTerms:
+                    Props[(Property,Kind)] = SpillArray((len(Runs),len(PropTerms[Kind])))
+
+        # rows of the property tables
+        RunRows = dict([(Run, Row) for Row, Run in enumerate(Runs)])
+
+        for Row, Title in enumerate(Titles):
+            Tables = self.Load(Title)
+
+            # subsystems are compared when all logs have the same ones
+            Table = Tables['Sub']
+            if Table is None:
+                Compare = False
+            elif Row == 0:
+                Clusters = Table.Rows
+                if Compare:
+                    Sub = SpillArray((len(Titles),len(Clusters),len(SubTerms)))
+            elif Table.Rows != Clusters:
+                Compare = False
+            if Compare:
+                Sub[Row] = Remap(Table.Values,Table.Columns,SubTerms)
+
+            if Mnb is not None and Tables['Mnb'] is not None:
+                Table = Tables['Mnb']
+                Mnb[Row] = Remap(Table.Values[0],Table.Columns,MnbTerms)
+
+            if Tables['Field'] is not None:
+                Fields += len(Tables['Field'])
+
+            for (Property, Kind), Values in Props.items():
+                if Title not in RunRows or Property not in Tables['Prop']: continue
+                Table = Tables['Prop'][Property][Kind]
+                Values[RunRows[Title]] = Remap(Table.Values[0],Table.Columns,PropTerms[Kind])
+
+        ClusterTables = {}
+        MbodyTables   = {}
+        FieldTables   = {}
+        PropTables    = {}
+
+        if Compare:
+            for i, Cluster in enumerate(Clusters):
+                ClusterTables[Cluster] = TABLE(TableHeader,SubTerms,Titles,Sub[:,i])
+
+        if State.ManyBody:
+            MbodyTables[(0,0,0)] = TABLE(TableHeader,MnbTerms,Titles,Mnb)
+
+        if State.FiniteField:
+            FieldTables['MnbEn'] = SPILLED_TABLE(TableHeader,MnbTerms,self,Titles,Fields)
+
+        for (Property, Kind), Values in Props.items():
+            PropTables.setdefault(Property,{})
+            PropTables[Property][Kind] = TABLE(TableHeader,PropTerms[Kind],Runs,Values)
+
+        return ClusterTables, MbodyTables, FieldTables, PropTables
+
+class SPILLED_TABLE(TABLE):
+    """Table of field energies read back from the spill file a log at a time"""
+
+    def __init__(self,Corner,Columns,Spill,Titles,Count):
+        TABLE.__init__(self,Corner,Columns,None,None)
+        self.Spill  = Spill
+        self.Titles = Titles
+        self.Count  = Count
+
+    def __len__(self):
+        return self.Count
+
+    def Blocks(self):
+        for Title in self.Titles:
+            Table = self.Spill.Load(Title)['Field']
+            if Table is not None:
+                yield Table.Rows, Remap(Table.Values,Table.Columns,self.Columns)
+
+def SpillArray(Shape):
+    """NaN filled array mapped from a temporary file."""
+
+    if 0 in Shape:
+        return full(Shape,nan)
+
+    Values = memmap(tempfile.TemporaryFile(prefix='geds-spill-'),dtype=float64,mode='w+',shape=Shape)
+    Values[:] = nan
+
+    return Values
+
+def Remap(Values,Columns,Labels):
+    """
+    Columns of values in the order of the labels, NaN for missing ones.
+
+        A label found more than once, as in the Total, Excess and Sum
+        groups of the property tables, is matched by its occurrence.
+    """
+
+    Index  = dict([(Key, i) for i, Key in enumerate(Occurrences(Columns))])
+    Take   = array([Index.get(Key,len(Columns)) for Key in Occurrences(Labels)],dtype=int)
+    Padded = concatenate((Values,full(Values.shape[:-1]+(1,),nan)),-1)
+
+    return Padded[...,Take]
+
+def Occurrences(Labels):
+    """Labels paired with the number of times they were seen before."""
+
+    Seen = {}
+    Keys = []
+    for Label in Labels:
+        Keys.append((Label, Seen.get(Label,0)))
+        Seen[Label] = Seen.get(Label,0) + 1
+
+    return Keys
+
+#----------------------------------------------------------------------------
+# Export binary arrays
+#----------------------------------------------------------------------------
+def ExportArrays(Dir,Energies,Properties):
+    """Save full precision results as .npy arrays.
+
+        Each array goes to its own .npy file so that it can be memory
+        mapped; files.npy is the first axis of all the value arrays.
+    """
+
+    if not os.path.isdir(Dir):
+        os.makedirs(Dir)
+
+    def Save(Name,Array):
+        save(os.path.join(Dir,Name+'.npy'),Array)
+
+    Sub = Energies.Sub
+    Mnb = Energies.Mnb
+
+    Save('files',          array(Sub.Axes[0],dtype=str))
+    Save('energies',       ascontiguousarray(Sub.Used()))
+    Save('energy_fields',  array(Sub.Axes[1],dtype=float64).reshape(-1,3))
+    Save('energy_terms',   array(Sub.Axes[2],dtype=str))
+    Save('subsystems',     array(Sub.Axes[3],dtype=int))
+    Save('mnb_energies',   ascontiguousarray(Mnb.Used()))
+    Save('mnb_fields',     array(Mnb.Axes[1],dtype=float64).reshape(-1,3))
+    Save('mnb_terms',      array(Mnb.Axes[2],dtype=str))
+
+    # subsystems of each n-body order by their monomers, the rows of
+    # files.npy they belong to and their energy terms
+    Orders = Energies.Orders
+    Save('nbody_terms', array(Orders.Terms,dtype=str))
+    for Order in Orders.Orders():
+        Stack = Orders.Order(Order)
+        Name  = 'nbody%d_' % Order
+        Save(Name+'files',    Sub.Find(0,Stack['Titles'])[Stack['Files']])
+        Save(Name+'monomers', Stack['Monomers'])
+        Save(Name+'energies', ascontiguousarray(Stack['Values'][:,:-1]))
+
+    if not len(Properties): return
+
+    Files = [Title for Title in Sub.Axes[0] if Title in Properties.Logs]
+    Stack = Properties.Stacked()
+
+    # tensors of each property type stacked as (files, terms, ...)
+    for PropType in ['Total', 'Interaction', 'SumInteraction', 'Excess']:
+        Terms = []
+        Seen  = set()
+        for Title in Files:
+            for Key in Properties.Logs[Title]['Keys']:
+                if Key[1] == PropType and Key[2] not in Seen:
+                    Seen.add(Key[2])
+                    Terms.append(Key[2])
+
+        Rows = Properties.Find(Files,[(PropType,Term) for Term in Terms])
+
+        Name = PropType.lower()
+        Save(Name+'_files', array(Files,dtype=str))
+        Save(Name+'_terms', array(Terms,dtype=str))
+        for Property in Properties.Tensors:
+            Save(Name+'_'+Property.lower(), Stack[Property][Rows])
+        Save(Name+'_invariants', Stack['Scalars'][Rows])
+
+    # labels of the tensor components and of the invariants, the last
+    # axes of the arrays above
+    for Property in Properties.Tensors:
+        Save(Property.lower()+'_components', Properties.Components(Property))
+    Save('invariants', array(Properties.Invariants,dtype=str))
+
+    ExportTensors(os.path.join(Dir,'tensors.csv'),Properties)
+
+def ExportTensors(Name,Properties):
+    """
+    Save all components and invariants of each term as columns of a table.
+
+        Each row holds the file, property type and energy term followed
+        by the components of Mu, Alpha, Beta and Gamma and by the
+        invariants, all in au and in full precision.
+    """
+
+    Stack   = Properties.Stacked()
+    Rows    = len(Stack['Keys'])
+    Columns = ['File', 'Property type', 'Energy term']
+    Values  = []
+
+    for Property in Properties.Tensors:
+        Columns.extend([Property+' '+Label for Label in Properties.Components(Property).flatten()])
+        Values.append(Stack[Property][:Rows].reshape(Rows,-1))
+
+    Columns.extend(Properties.Invariants)
+    Values.append(Stack['Scalars'][:Rows])
+
+    Values = concatenate(Values,axis=1)
+    Format = ';'.join(['"%s"']*3 + ['%r']*Values.shape[1]) + '\n'
+
+    File = open(Name,'w')
+    File.write(';'.join(['"%s"' % Column for Column in Columns]) + '\n')
+    for Key, Row in zip(Stack['Keys'],Values):
+        File.write(Format % (Key + tuple(Row.tolist())))
+    File.close()
+
 #----------------------------------------------------------------------------
 # Utilities
 #----------------------------------------------------------------------------
@@ -1522,112 +4128,44 @@ def FindLine(File,pattern):
 
     return line
 
-def SortFiles(x, y):
-
-    a=re.compile('\d+\.\d+').findall(x)
-    b=re.compile('\d+\.\d+').findall(y)
+def SortRuns(RunFiles):
+    """Runs in the order of the property tables, set by -s."""
 
-    if a and b:
-        for i in range(len(a)):
-            a[i]=float(a[i])
-        for i in range(len(b)):
-            b[i]=float(b[i])
-        #a=float(a.group())
-        #b=float(b.group())
+    if State.SortMode == 'float':
+        RunFiles.sort(key=FileKey)
     else:
-        a=x
-        b=y
-
-    if a>b:
-        return 1
-    elif a==b:
-        return 0
-    else: # a<b
-        return -1
+        RunFiles.sort()
 
-def SortX(x, y):
+    return RunFiles
 
-    a=x[0]
-    b=y[0]
+def FileName(Title):
+    """Name of the log in the title of a run."""
+    return Title.split()[1].replace('.log','')
 
-    if x[0] == 0 and x[1] == 0 and x[2] == 0:
-        return -1
-    else:
-        if a == 0:
-            return -1
-        elif b == 0:
-            return 1
-        else:
-            if a<0 and b<0:
-                if a>b:
-                    return 1
-                elif a==b:
-                    return 0
-                else: # a<b
-                    return -1
-            else:
-                if a>b:
-                    return -1
-                elif a==b:
-                    return 0
-                else: # a<b
-                    return 1
+def FileKey(x):
+    r"""
+    Order of the runs sorted by -s float.
 
-def SortY(x, y):
+        Runs are compared by the values of the '\d+\.\d+' substrings of
+        their names, and by the names when either has none; runs with
+        the values go first so that the keys always compare.
+    """
 
-    a=x[1]
-    b=y[1]
+    a=re.compile(r'\d+\.\d+').findall(x)
 
-    if x[0] == 0 and x[1] == 0 and x[2] == 0:
-        return 0
-    else:
-        if a == 0:
-            return -1
-        elif b == 0:
-            return 1
-        else:
-            if a<0 and b<0:
-                if a>b:
-                    return 1
-                elif a==b:
-                    return 0
-                else: # a<b
-                    return -1
-            else:
-                if a>b:
-                    return -1
-                elif a==b:
-                    return 0
-                else: # a<b
-                    return 1
+    if a:
+        return (0, [float(Value) for Value in a], x)
+    return (1, [], x)
 
-def SortZ(x, y):
+def FieldKey(Field):
+    """
+    Canonical order of the fields.
 
-    a=x[2]
-    b=y[2]
+        The zero field goes first, then the fields along z, y and x, on
+        each axis positive before negative ones and the strongest first.
+    """
 
-    if x[0] == 0 and x[1] == 0 and x[2] == 0:
-        return 0
-    else:
-        if a == 0:
-            return -1
-        elif b == 0:
-            return 1
-        else:
-            if a<0 and b<0:
-                if a>b:
-                    return -1
-                elif a==b:
-                    return 0
-                else: # a<b
-                    return 1
-            else:
-                if a>b:
-                    return 1
-                elif a==b:
-                    return 0
-                else: # a<b
-                    return -1
+    return (tuple(Field) != (0,0,0), tuple([(F == 0, F < 0, -abs(F)) for F in Field[::-1]]))
 
 #----------------------------------------------------------------------------
 # Units, conversion factors and formats
@@ -1668,9 +4206,6 @@ def TexLabel(label):
     else:
         print("Warning! Unknown label")
 
-    EnUnits['LabLen'].append(len(label)+2)
-    PrUnits['LabLen'].append(len(label)+2)
-
     return '$'+label+'$'
 
 def SetOutFormat(arg):
@@ -1682,8 +4217,10 @@ def SetOutFormat(arg):
 
 def SetEnUnits(Units):
     """Set energy units and appropriate formats."""
+    State.EnUnits = EnergyUnits(Units)
 
-    global EnUnits
+def EnergyUnits(Units):
+    """Conversion factor and formats of energy units."""
 
     EnUnits = {}
 
@@ -1691,36 +4228,39 @@ def SetEnUnits(Units):
         EnUnits['ConFac'] = 627.509541
         EnUnits['Format'] = '%ln.3f'
         EnUnits['Round']  = 3
-        EnUnits['LabLen'] = [14]
+        EnUnits['LabLen'] = 14
     elif Units.lower() == 'kj':
         EnUnits['ConFac'] = 627.509541 * 4.1840
         EnUnits['Format'] = '%ln.3f'
         EnUnits['Round']  = 3
-        EnUnits['LabLen'] = [14]
+        EnUnits['LabLen'] = 14
     elif Units.lower() == 'au':
         EnUnits['ConFac'] = 1.0
         EnUnits['Format'] = '%ln.12e'
         EnUnits['Round']  = ''
-        EnUnits['LabLen'] = [23]
+        EnUnits['LabLen'] = 23
     elif Units.lower() == 'mh':
         EnUnits['ConFac'] = 1.0e3
         EnUnits['Format'] = '%ln.3f'
         EnUnits['Round']  = 3
-        EnUnits['LabLen'] = [14]
+        EnUnits['LabLen'] = 14
     elif Units.lower() == 'mev':
         EnUnits['ConFac'] = 27211.3845
         EnUnits['Format'] = '%ln.3f'
         EnUnits['Round']  = 3
-        EnUnits['LabLen'] = [14]
+        EnUnits['LabLen'] = 14
     else:
         Usage()
         sys.exit(2)
 
+    return EnUnits
 
 def SetPrUnits(Units):
     """Set units of electric properties and the respective formats."""
+    State.Update(PropertyUnits(Units))
 
-    global PrUnits, PropertyLabels, PropertyConFac, PropertyFormats, PropertyIndex, PropertyDescription
+def PropertyUnits(Units):
+    """Conversion factors, formats and descriptions of the properties in the units."""
 
     PrUnits = {}
 
@@ -1731,7 +4271,7 @@ def SetPrUnits(Units):
         PrUnits['Gamma'] = 1.0
         PrUnits['Format'] = {'m':'%ln.4f', 'a':'%ln.3f', 'b':'%ln.2f', 'g':'%ln.1f'}
         PrUnits['Round']  = {'m':4,        'a':3,        'b':2,        'g':1}
-        PrUnits['LabLen'] = [10]
+        PrUnits['LabLen'] = 10
     elif Units.lower() == 'mau':
         PrUnits['Mu']    = 1.0e3
         PrUnits['Alpha'] = 1.0e3
@@ -1739,7 +4279,7 @@ def SetPrUnits(Units):
         PrUnits['Gamma'] = 1.0e3
         PrUnits['Format'] = {'m':'%ln.1f', 'a':'%ln.1f', 'b':'%ln.1f', 'g':'%ln.1f'}
         PrUnits['Round']  = {'m':1,        'a':1,        'b':1,        'g':1}
-        PrUnits['LabLen'] = [10]
+        PrUnits['LabLen'] = 10
     elif Units.lower() == 'si':
         PrUnits['Mu']    = 8.478358e-30 # C m
         PrUnits['Alpha'] = 1.648778e-41 # C^2 m^2 J^-1
@@ -1747,7 +4287,7 @@ def SetPrUnits(Units):
         PrUnits['Gamma'] = 6.235377e-65 # C^4 m^4 J^-3
         PrUnits['Format'] = {'m':'%ln.5e', 'a':'%ln.5e', 'b':'%ln.5e', 'g':'%ln.5e'}
         PrUnits['Round']  = {'m':3,        'a':3,        'b':3,        'g':3}
-        PrUnits['LabLen'] = [10]
+        PrUnits['LabLen'] = 10
     elif Units.lower() == 'asi':
         PrUnits['Mu']    = 8.4784e-30 # C m
         PrUnits['Alpha'] = 1.8621e-30 # m^3
@@ -1755,7 +4295,7 @@ def SetPrUnits(Units):
         PrUnits['Gamma'] = 7.0423e-54 # m^5 V^-2
         PrUnits['Format'] = {'m':'%ln.4e', 'a':'%ln.4e', 'b':'%ln.4e', 'g':'%ln.4e'}
         PrUnits['Round']  = {'m':3,        'a':3,        'b':3,        'g':3}
-        PrUnits['LabLen'] = [10]
+        PrUnits['LabLen'] = 10
     elif Units.lower() == 'esu':
         PrUnits['Mu']    = 2.5418e-18 # statvolt cm^2
         PrUnits['Alpha'] = 1.4817e-25 # cm^3
@@ -1763,7 +4303,7 @@ def SetPrUnits(Units):
         PrUnits['Gamma'] = 5.0367e-40 # statvolt^-2 cm^5
         PrUnits['Format'] = {'m':'%ln.4e', 'a':'%ln.4e', 'b':'%ln.4e', 'g':'%ln.4e'}
         PrUnits['Round']  = {'m':40,        'a':40,        'b':40,        'g':40}
-        PrUnits['LabLen'] = [10]
+        PrUnits['LabLen'] = 10
     else:
         Usage()
         sys.exit(2)
@@ -1824,6 +4364,16 @@ def SetPrUnits(Units):
                      PropertyIndex['Gamma'][PropertyIndex['Gamma'][0]+1],
         '<G>'   : '# Scalar component of second hyperpolarizability tensor given by the isotropic average' }
 
+    return { 'PrUnits'            : PrUnits,
+             'PropertyLabels'     : PropertyLabels,
+             'PropertyConFac'     : PropertyConFac,
+             'PropertyFormats'    : PropertyFormats,
+             'PropertyIndex'      : PropertyIndex,
+             'PropertyDescription': PropertyDescription }
+
+# Parse state of the current thread, made once the units can be set
+State = PARSE_STATE()
+
 #----------------------------------------------------------------------------
 # Main routine
 #----------------------------------------------------------------------------
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+"""
+Tests of geds.py run in process
+
+The finite field derivatives are checked against the field energies of
+known polynomials, labels are checked to merge in their first seen order
+with the widths of the longest, the parse cache is checked to be reused for the same
+logs and dropped for edited ones, and the daemon is started in a thread
+and asked for the results of the example logs.
+
+Usage: python -m unittest discover tests
+"""
+
+import os, sys, json, shutil, tempfile, threading, unittest
+
+Tests    = os.path.dirname(os.path.abspath(__file__))
+Root     = os.path.dirname(Tests)
+Examples = os.path.join(Root, 'examples')
+
+sys.path.insert(0, Root)
+import geds
+
+class DERIVATIVES_TEST(unittest.TestCase):
+    """Finite field derivatives of polynomial field energies"""
+
+    # Mu, Alpha, Beta and Gamma of each axis, and the fifth and sixth
+    # derivatives which the Richardson extrapolation has to remove
+    Axes = { 'x': [0.5, 10.0, 100.0, 1000.0, 1e4, 1e5],
+             'y': [-0.3, 4.0, -250.0, 3000.0, -2e4, 5e4],
+             'z': [1.2, 25.0, 40.0, -800.0, 3e4, -1e5] }
+
+    def Energy(self,Field,Scale):
+        """E(F) = -sum of D_n F^n/n! along the axis of the field."""
+        E = 0.0
+        for Axis, F in enumerate(Field):
+            Factorial = 1.0
+            for n, D in enumerate(self.Axes['xyz'[Axis]]):
+                Factorial *= n+1
+                E -= Scale*D*F**(n+1)/Factorial
+        return E
+
+    def test_polynomial(self):
+        """Mu, Alpha, Beta and Gamma of a grid of four steps are those of the polynomial."""
+        Fields = [(0.0, 0.0, 0.0)]
+        for Axis in range(3):
+            for k in (1, 2, 3, 4):
+                for Sign in (1, -1):
+                    Field = [0.0, 0.0, 0.0]
+                    Field[Axis] = Sign*k*0.001
+                    Fields.append(tuple(Field))
+
+        # two terms, the second scaled, for two files
+        with geds.GEDS_SESSION():
+            Energies = geds.ENERGY_STORE()
+            for Title, Scale in [('File: a.log Run Title: A', 1.0), ('File: b.log Run Title: B', 2.0)]:
+                Energies.Add(Title, dict([(Field, { 'DE(HF) 2-BODY(MNB)': self.Energy(Field,1.0*Scale),
+                                                    'DE(HF) 3-BODY(MNB)': self.Energy(Field,-0.5*Scale) })
+                                          for Field in Fields]))
+
+            Files, Terms, Derivatives = geds.FieldDerivatives(Energies,
+                                        {'MnbLabel': ['DE(HF) 2-BODY(MNB)', 'DE(HF) 3-BODY(MNB)']})
+
+        self.assertEqual(len(Derivatives), 12)
+        for Order, Property in enumerate(['Mu', 'Alpha', 'Beta', 'Gamma']):
+            for Axis in 'xyz':
+                Values   = Derivatives[(Property, Axis*(Order+1))]
+                Expected = self.Axes[Axis][Order]
+                for Row, Scale in enumerate([1.0, 2.0]):
+                    for Column, Term in enumerate([1.0, -0.5]):
+                        self.assertAlmostEqual(Values[Row,Column]/(Scale*Term*Expected), 1.0, delta=1e-5,
+                                               msg='%s %s' % (Property, Axis*(Order+1)))
+
+    def test_richardson(self):
+        """Estimates with errors in h^2 and h^4 are extrapolated to their limit."""
+        Steps     = [0.001, 0.002, 0.003]
+        Estimates = [7.0 + 3.0*h**2 - 5.0*h**4 for h in Steps]
+        self.assertAlmostEqual(geds.Richardson(Steps,Estimates), 7.0, places=9)
+
+        # for h and 2h the extrapolation is (4D(h)-D(2h))/3
+        self.assertAlmostEqual(geds.Richardson([0.1, 0.2], [2.0, 5.0]), (4*2.0-5.0)/3.0, places=12)
+
+class LABEL_TEST(unittest.TestCase):
+    """Labels of the logs merged into those of all logs"""
+
+    def test_merge(self):
+        """Merge keeps the first seen order, placing new labels by their neighbours, and the widest labels."""
+        with geds.GEDS_SESSION():
+            Labels = geds.LABEL_REGISTRY(['DE(HL)', 'E(EL,10)', 'DE(HF)'])
+            Labels.Merge(geds.LABEL_REGISTRY(['E(EX,HL)', 'DE(HL)', 'E(EL,M,1)(CORR)', 'DE(HF)', 'DE(MP2)']))
+
+            self.assertEqual(list(Labels), ['E(EX,HL)', 'DE(HL)', 'E(EL,M,1)(CORR)', 'E(EL,10)', 'DE(HF)', 'DE(MP2)'])
+            self.assertEqual(Labels.Width, len('E(EL,M,1)(CORR)'))
+
+            # ids stay those of the first seen labels
+            self.assertEqual(Labels.Ids['DE(HL)'], 0)
+            self.assertEqual(Labels.Add('DE(MP2)'), 5)
+
+            # known labels in another order are not moved, unknown ones go last
+            Labels.Merge(geds.LABEL_REGISTRY(['DE(HF)', 'DE(HL)']))
+            Labels.Merge(geds.LABEL_REGISTRY(['E(DS,20)']))
+            self.assertEqual(list(Labels), ['E(EX,HL)', 'DE(HL)', 'E(EL,M,1)(CORR)', 'E(EL,10)', 'DE(HF)', 'DE(MP2)',
+                                            'E(DS,20)'])
+            self.assertEqual(Labels.Width, len('E(EL,M,1)(CORR)'))
+
+            # the columns are as wide as the longest label, or the units if wider
+            self.assertEqual(geds.LabelWidths({'SubLabel': Labels}), (23, 10))
+            self.assertEqual(geds.LabelWidths({'SubLabel': Labels, 'TotPropLabel': Labels}), (23, 15))
+
+        with geds.GEDS_SESSION('tex'):
+            Labels = geds.LABEL_REGISTRY(['DE(HF)'])
+            Labels.Merge(geds.LABEL_REGISTRY(['E(EL,10)(CORR)']))
+            Widest = max([len(geds.TexLabel(Label)) for Label in ['DE(HF)', 'E(EL,10)(CORR)']])
+            self.assertEqual(Labels.TexWidth, Widest)
+
+            # tex labels set the widths of the energy and property columns
+            self.assertEqual(geds.LabelWidths({'SubLabel': Labels}), (Widest, Widest))
+
+class CACHE_TEST(unittest.TestCase):
+    """Parse results reused from the cache while the logs are unchanged"""
+
+    def setUp(self):
+        self.Dir = tempfile.mkdtemp(prefix='geds-cache-')
+        self.Log = os.path.join(self.Dir,'h4o2.log')
+
+        # blank lines ahead of the log move its middle well away from both ends
+        with open(os.path.join(Examples,'h4o2.log')) as File:
+            Text = File.read()
+        with open(self.Log,'w') as File:
+            File.write((' '*79+'\n')*2500 + Text)
+
+    def tearDown(self):
+        shutil.rmtree(self.Dir)
+
+    def test_hit_and_invalidation(self):
+        """A log edited in the middle, with its size and times kept, is parsed again."""
+        with geds.GEDS_SESSION():
+            Cache  = geds.PARSE_CACHE(os.path.join(self.Dir,'cache'),64)
+            Parsed = geds.JsonResult(list(geds.ParseLogs([self.Log],1,Cache)))
+
+            self.assertEqual(geds.JsonResult([Cache.Load(self.Log)]), Parsed)
+            self.assertEqual(geds.JsonResult(list(geds.ParseLogs([self.Log],1,Cache))), Parsed)
+
+            # one digit halfway through the log
+            Stat = os.stat(self.Log)
+            with open(self.Log,'rb') as File:
+                Text = bytearray(File.read())
+            Middle = len(Text)//2
+            while not Text[Middle:Middle+1].isdigit():
+                Middle += 1
+            Text[Middle] = ord('0') + (Text[Middle]-ord('0')+1) % 10
+            with open(self.Log,'wb') as File:
+                File.write(Text)
+            os.utime(self.Log,ns=(Stat.st_atime_ns,Stat.st_mtime_ns))
+
+            self.assertIsNone(Cache.Load(self.Log))
+            self.assertEqual(os.listdir(os.path.join(self.Dir,'cache')), [])
+
+class DAEMON_TEST(unittest.TestCase):
+    """Requests answered by a daemon on a UNIX socket"""
+
+    def setUp(self):
+        self.Dir    = tempfile.mkdtemp(prefix='geds-daemon-')
+        self.Socket = os.path.join(self.Dir,'geds.sock')
+        for Name in ['h2o-hoh.log', 'h4o2.log']:
+            shutil.copy(os.path.join(Examples,Name), self.Dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.Dir)
+
+    def Serve(self):
+        """Start the daemon in a thread and wait until it answers."""
+        Server = threading.Thread(target=geds.ServeRequests, args=(self.Socket,))
+        Server.start()
+        for Attempt in range(500):
+            if os.path.exists(self.Socket): break
+            threading.Event().wait(0.01)
+        return Server
+
+    def test_requests(self):
+        """Parse results and tables of the daemon are those of a direct run."""
+        Server = self.Serve()
+        try:
+            self.assertEqual(geds.SendRequest(self.Socket, {'action': 'ping'}), {'ok': True})
+
+            Logs  = ['h2o-hoh.log', 'h4o2.log']
+            Reply = geds.SendRequest(self.Socket, {'action': 'parse', 'logs': Logs, 'dir': self.Dir})
+
+            Cwd = os.getcwd()
+            os.chdir(self.Dir)
+            try:
+                with geds.GEDS_SESSION():
+                    Direct = geds.JsonResult(list(geds.ParseLogs(Logs,1)))
+            finally:
+                os.chdir(Cwd)
+            self.assertEqual(Reply, {'ok': True, 'logs': json.loads(json.dumps(Direct))})
+
+            Reply = geds.SendRequest(self.Socket, {'action': 'write', 'logs': Logs, 'dir': self.Dir,
+                                                   'energy_units': 'kJ'})
+            self.assertEqual(Reply, {'ok': True})
+            with open(os.path.join(self.Dir,'energies.txt')) as File:
+                with open(os.path.join(Examples,'energies.txt')) as Expected:
+                    self.assertEqual(File.read(), Expected.read())
+        finally:
+            geds.SendRequest(self.Socket, {'action': 'shutdown'})
+            Server.join()
+
+        self.assertFalse(os.path.exists(self.Socket))
+
+    def test_not_a_socket(self):
+        """A file at the path of the socket is left alone."""
+        with open(self.Socket,'w') as File:
+            File.write('keep me')
+        self.assertRaises(IOError, geds.ServeRequests, self.Socket)
+        with open(self.Socket) as File:
+            self.assertEqual(File.read(), 'keep me')
+
+if __name__ == "__main__": unittest.main()
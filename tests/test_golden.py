@@ -0,0 +1,447 @@
+#!/usr/bin/env python
+"""
+Golden tests of the tables written by geds.py
+
+geds.py is run on the example logs and on a small FFEDS log (generated
+with benchmarks/genlog.py -m 2 -l hf -f 2 -b 1 --seed=5) in each output
+format, and the files it writes are compared byte for byte with the
+golden ones: examples/energies.txt and those in tests/golden, which were
+written before the tables were rendered in bulk. The many-body expansion
+of -m is checked against the subsystems of a 3-body log (genlog.py -m 3
+-l mp2 -b 1 --seed=5). Missing properties are checked on the FFEDS log
+together with an MP2 one (genlog.py -m 2 -l mp2 -f 2 -b 1 --seed=7).
+The derivatives of -f are compared with those first written for the
+FFEDS log, and an invariant edited in a copy of it has to show up in
+property-check.txt. The tables written log by log
+with --stream, those read through the sidecar index of -i, those of
+logs parsed in a pool with -j and those of logs followed with -w while
+they grow are the golden ones too, as are those of logs read from a tar
+archive, and the arrays saved with -x hold the values of the tables.
+With logs of several run types --stream has to write the tables
+comparing them of the normal path. The summary of --profile is checked
+to add up over the stages of the logs, and the tensors.csv of -x to
+hold the values of the property tables.
+
+Usage: python -m unittest discover tests
+"""
+
+import os, sys, gzip, json, pstats, time, shutil, tarfile, subprocess, tempfile, unittest
+
+Tests    = os.path.dirname(os.path.abspath(__file__))
+Root     = os.path.dirname(Tests)
+Examples = os.path.join(Root, 'examples')
+Golden   = os.path.join(Tests, 'golden')
+
+class GOLDEN_TEST(unittest.TestCase):
+    """Tables of geds.py compared with the golden files"""
+
+    def setUp(self):
+        self.Dir = tempfile.mkdtemp(prefix='geds-golden-')
+
+    def tearDown(self):
+        shutil.rmtree(self.Dir)
+
+    def Run(self,Options,Logs):
+        """Run geds.py in the scratch directory on copies of the logs."""
+        for Log in Logs:
+            shutil.copy(Log, self.Dir)
+        self.Geds(Options,[os.path.basename(Log) for Log in Logs])
+
+    def Geds(self,Options,Names):
+        """Run geds.py in the scratch directory on the logs there."""
+        subprocess.check_call([sys.executable, os.path.join(Root,'geds.py')] + Options + Names,
+                              cwd=self.Dir, stdout=subprocess.DEVNULL)
+
+    def Compare(self,Name,Expected):
+        """Check that a written file is the same as the golden one."""
+        with open(os.path.join(self.Dir,Name),'rb') as File:
+            Written = File.read()
+        with open(Expected,'rb') as File:
+            self.assertEqual(Written, File.read(), Name+' differs from '+Expected)
+
+    def Examples(self,Format):
+        self.Run(['-e', 'kJ', '-o', Format], [os.path.join(Examples,'h2o-hoh.log'),
+                                              os.path.join(Examples,'h4o2.log')])
+
+    def FiniteField(self,Format):
+        self.Run(['-o', Format], [os.path.join(Tests,'data','ff2.log.gz')])
+        for Name in ['energies', 'properties', 'troperties']:
+            self.Compare(Name+'.'+Format, os.path.join(Golden,'ff-'+Format,Name+'.'+Format))
+
+    def test_examples_txt(self):
+        self.Examples('txt')
+        self.Compare('energies.txt', os.path.join(Examples,'energies.txt'))
+
+    def test_examples_csv(self):
+        self.Examples('csv')
+        self.Compare('energies.csv', os.path.join(Golden,'examples-csv','energies.csv'))
+
+    def test_examples_tex(self):
+        self.Examples('tex')
+        self.Compare('energies.tex', os.path.join(Golden,'examples-tex','energies.tex'))
+
+    def test_examples_nbody(self):
+        """With -n the dimers, the whole complexes here, go to their own file."""
+        self.Run(['-n', '-e', 'kJ'], [os.path.join(Examples,'h2o-hoh.log'),
+                                      os.path.join(Examples,'h4o2.log')])
+        self.Compare('energies.txt', os.path.join(Examples,'energies.txt'))
+
+        # the tables of the files, which come before those comparing them,
+        # the dimer being subsystem 3
+        with open(os.path.join(Examples,'energies.txt')) as File:
+            Expected = File.read().split('# Subsystem No:')[0].replace('\n"3  ','\n"1-2')
+
+        with open(os.path.join(self.Dir,'energies-2body.txt')) as File:
+            self.assertEqual(File.read(), Expected)
+
+    def test_jobs(self):
+        """-j parses the logs in a pool and writes the same tables."""
+        self.Run(['-j', '2', '-e', 'kJ'], [os.path.join(Examples,'h2o-hoh.log'),
+                                           os.path.join(Examples,'h4o2.log')])
+        self.Compare('energies.txt', os.path.join(Examples,'energies.txt'))
+
+    def test_watch(self):
+        """-w follows logs written piece by piece, cut mid-line and inside blocks."""
+        Names = ['h2o-hoh.log', 'h4o2.log']
+        Texts = {}
+        Cuts  = {}
+        for Name in Names:
+            with open(os.path.join(Examples,Name),'rb') as File:
+                Texts[Name] = File.read()
+
+            # fifths of the log and the middle of each block of interaction energies
+            Cuts[Name] = [len(Texts[Name])*Piece//5 for Piece in range(1,6)]
+            Start = Texts[Name].find(b'INTERACTION ENERGY TERMS')
+            while Start >= 0:
+                Middle = Start
+                for Line in range(10):
+                    Middle = Texts[Name].index(b'\n',Middle)+1
+                Cuts[Name].append(Middle)
+                Start = Texts[Name].find(b'INTERACTION ENERGY TERMS',Middle)
+            Cuts[Name] = sorted(Cuts[Name])
+
+        Watch = subprocess.Popen([sys.executable, os.path.join(Root,'geds.py'),
+                                  '-w', '0.05', '-e', 'kJ'] + Names, cwd=self.Dir, stdout=subprocess.DEVNULL)
+        try:
+            Written = dict([(Name, 0) for Name in Names])
+            for Piece in range(max([len(Cuts[Name]) for Name in Names])):
+                for Name in Names:
+                    Cut = Cuts[Name][min(Piece,len(Cuts[Name])-1)]
+                    with open(os.path.join(self.Dir,Name),'ab') as File:
+                        File.write(Texts[Name][Written[Name]:Cut])
+                    Written[Name] = Cut
+                time.sleep(0.2)
+            self.assertEqual(Watch.wait(timeout=60), 0)
+        finally:
+            if Watch.poll() is None:
+                Watch.kill()
+
+        self.Compare('energies.txt', os.path.join(Examples,'energies.txt'))
+
+    def test_export(self):
+        """-x saves arrays of the shapes of their label axes, with the values of the tables."""
+        import numpy
+
+        self.Run(['-x', 'npy'], [os.path.join(Examples,'h2o-hoh.log'), os.path.join(Examples,'h4o2.log')])
+        Table = self.Rows('energies.txt')
+
+        def Load(Name):
+            return numpy.load(os.path.join(self.Dir,'npy',Name+'.npy'))
+
+        Files    = Load('files')
+        Energies = Load('energies')
+        self.assertEqual(Energies.dtype, numpy.float64)
+        self.assertEqual(Energies.shape, (len(Files), len(Load('energy_fields')),
+                                          len(Load('energy_terms')), len(Load('subsystems'))))
+        self.assertEqual(Load('subsystems').dtype.kind, 'i')
+        self.assertEqual(Load('energy_fields').shape, (1,3))
+
+        # the dimer is the whole complex, subsystem 3
+        for Row, Title in enumerate(['h2o-hoh', 'h4o2']):
+            self.assertTrue(Files[Row].startswith('File: '+Title+'.log'))
+            for Value, Printed in zip(Energies[Row,0,:,0], Table[Title]):
+                self.assertAlmostEqual(Value, Printed, delta=1e-12*abs(Printed)+1e-15)
+        self.assertEqual(Load('nbody2_monomers').tolist(), [[1,2], [1,2]])
+        self.assertTrue((Load('nbody2_energies') == Energies[Load('nbody2_files'),0,:,0]).all())
+
+        # tensors of the FFEDS log stacked as (files, terms, components)
+        self.Run(['-x', 'npy'], [os.path.join(Tests,'data','ff2.log.gz')])
+        Terms = Load('total_terms')
+        for Property, Shape in [('mu',(3,)), ('alpha',(3,3)), ('beta',(3,3)), ('gamma',(3,3)),
+                                ('invariants',(5,))]:
+            Values = Load('total_'+Property)
+            self.assertEqual(Values.dtype, numpy.float64)
+            self.assertEqual(Values.shape, (1, len(Terms))+Shape)
+        self.assertEqual(list(Terms).index('HF,C(1)'), 0)
+        self.assertEqual(Load('total_alpha')[0,0].tolist(), [[-0.609258, 3.789300, -1.939876],
+                                                            [-1.347899, 1.032954, 0.904594],
+                                                            [-3.246406, -0.540884, 2.339308]])
+        self.assertEqual(Load('alpha_components').shape, (3,3))
+
+    def test_archive(self):
+        """Logs read from a tar archive give the tables of the extracted logs."""
+        with tarfile.open(os.path.join(self.Dir,'logs.tar.gz'),'w:gz') as Tar:
+            for Name in ['h2o-hoh.inp', 'h2o-hoh.log', 'h4o2.log']:
+                Tar.add(os.path.join(Examples,Name), Name)
+        with tarfile.open(os.path.join(self.Dir,'runs.tar'),'w') as Tar:
+            for Name in ['h2o-hoh.log', 'h4o2.log']:
+                Tar.add(os.path.join(Examples,Name), Name)
+            Tar.add(os.path.join(Examples,'h4o2.log'), 'old/h4o2.log')
+
+        # the input is not a log and * does not match old/
+        for Archive in ['logs.tar.gz', 'runs.tar:*.log']:
+            self.Geds(['-e', 'kJ'], [Archive])
+            self.Compare('energies.txt', os.path.join(Examples,'energies.txt'))
+
+    def test_profile(self):
+        """--profile sums up the time, bytes and traced peak memory of the stages of each log."""
+        Logs = [os.path.join(Examples,'h2o-hoh.log'), os.path.join(Examples,'h4o2.log')]
+        for Options in [[], ['-j', '2']]:
+            self.Run(['--profile=profile.json', '--cprofile=cprofile.out', '-e', 'kJ'] + Options, Logs)
+            self.Compare('energies.txt', os.path.join(Examples,'energies.txt'))
+
+            with open(os.path.join(self.Dir,'profile.json')) as File:
+                Profile = json.load(File)
+
+            self.assertEqual(sorted(Profile), ['files', 'stages', 'total'])
+            self.assertEqual(sorted(Profile['files']), ['h2o-hoh.log', 'h4o2.log'])
+            self.assertEqual(sorted(Profile['stages']), ['formatting', 'preamble', 'scan', 'sub-energies', 'writing'])
+
+            for Name, Stages in Profile['files'].items():
+                self.assertEqual(sorted(Stages), ['preamble', 'scan', 'sub-energies'])
+                for Stage in Stages.values():
+                    self.assertEqual(sorted(Stage), ['bytes', 'calls', 'peak', 'time'])
+                    self.assertGreaterEqual(Stage['time'], 0.0)
+                self.assertGreater(Stages['preamble']['peak'], 0)
+                self.assertEqual(Stages['sub-energies']['calls'], 2)
+                self.assertLessEqual(sum([Stage['bytes'] for Stage in Stages.values()]),
+                                     os.path.getsize(os.path.join(self.Dir,Name)))
+
+            # the stages of all logs add up
+            for Key in ['preamble', 'scan', 'sub-energies']:
+                Stages = [Profile['files'][Name][Key] for Name in Profile['files']]
+                self.assertEqual(Profile['stages'][Key]['calls'], sum([Stage['calls'] for Stage in Stages]))
+                self.assertEqual(Profile['stages'][Key]['bytes'], sum([Stage['bytes'] for Stage in Stages]))
+                self.assertEqual(Profile['stages'][Key]['peak'], max([Stage['peak'] for Stage in Stages]))
+                self.assertAlmostEqual(Profile['stages'][Key]['time'], sum([Stage['time'] for Stage in Stages]))
+
+            Total = Profile['total']
+            self.assertGreater(Total['time'], 0.0)
+            self.assertGreaterEqual(Total['peak'], max([Stage['peak'] for Stage in Profile['stages'].values()]))
+            self.assertEqual(Total['bytes'], sum([Stage['bytes'] for Stage in Profile['stages'].values()]))
+
+            # the cProfile dump of the main process
+            self.assertGreater(pstats.Stats(os.path.join(self.Dir,'cprofile.out')).total_calls, 0)
+
+    def test_tensors(self):
+        """tensors.csv of -x holds a row for each term with the values of the property tables."""
+        self.Run(['-x', 'npy'], [os.path.join(Tests,'data','ff2.log.gz')])
+
+        with open(os.path.join(self.Dir,'npy','tensors.csv')) as File:
+            Header = [Cell.strip('"') for Cell in File.readline().strip().split(';')]
+            Rows   = [line.strip().split(';') for line in File]
+
+        Components = [('Mu',3), ('Alpha',9), ('Beta',9), ('Gamma',9)]
+        Invariants = ['|D|', '<A>', '<B>', 'B(Z)', '<G>']
+        self.assertEqual(len(Header), 3+sum([Size for Property, Size in Components])+len(Invariants))
+        self.assertEqual(Header[:4], ['File', 'Property type', 'Energy term', 'Mu x'])
+        self.assertEqual(Header[-5:], Invariants)
+
+        # the total, excess, sum and interaction properties of the monomers, the dimer and the terms
+        Tensors = {}
+        for Row in Rows:
+            self.assertEqual(len(Row), len(Header))
+            self.assertTrue(Row[0].startswith('"File: ff2.log'))
+            Tensors.setdefault(Row[1].strip('"'),[]).append((Row[2].strip('"'), [float(Cell) for Cell in Row[3:]]))
+        self.assertEqual(dict([(Type, [Term for Term, Values in Terms]) for Type, Terms in Tensors.items()]),
+                         { 'Total': ['HF,C(1)', 'HF,C(2)', 'HF,C(3)'], 'Excess': ['HF,C(3)'],
+                           'SumInteraction': ['HF,2', 'DE(HF)'], 'Interaction': ['HF,2', 'DE(HF)'] })
+
+        # the tables of properties.txt in order, their columns and decimals in au
+        Tables = [('Mu z',4), ('|D|',4), ('Alpha zz',3), ('<A>',3), ('<B>',3), ('Beta zzz',2), ('B(Z)',2),
+                  ('Gamma zzzz',1), ('<G>',1)]
+        Types  = ['Total', 'Excess', 'SumInteraction']
+        Table  = -1
+        with open(os.path.join(self.Dir,'properties.txt')) as File:
+            for line in File:
+                if line.startswith('# Interaction Induced Properties'):
+                    Types = ['Interaction']
+                    Table = -1
+                elif line.startswith('"#_'):
+                    Table += 1
+                elif line.startswith('"ff2'):
+                    Column, Decimals = Tables[Table]
+                    Expected = [Values[Header.index(Column)-3] for Type in Types for Term, Values in Tensors[Type]]
+                    Printed  = [float(Cell) for Cell in line.split(';')[1:-1]]
+                    self.assertEqual(len(Printed), len(Expected), Column)
+                    for Value, Tensor in zip(Printed, Expected):
+                        self.assertAlmostEqual(Value, Tensor, delta=0.5*10**-Decimals+1e-9, msg=Column)
+        self.assertEqual(Table, len(Tables)-1)
+
+    def test_index(self):
+        """-i writes the same tables with the sidecar index built and then reused."""
+        self.Run(['-i', '-e', 'kJ'], [os.path.join(Examples,'h2o-hoh.log'),
+                                      os.path.join(Examples,'h4o2.log')])
+        self.Compare('energies.txt', os.path.join(Examples,'energies.txt'))
+
+        # the index of an unchanged log is not written again
+        Index = os.path.join(self.Dir,'h4o2.log.idx')
+        os.utime(Index,(0,0))
+        os.remove(os.path.join(self.Dir,'energies.txt'))
+
+        self.Geds(['-i', '-e', 'kJ'], ['h2o-hoh.log', 'h4o2.log'])
+        self.Compare('energies.txt', os.path.join(Examples,'energies.txt'))
+        self.assertEqual(os.stat(Index).st_mtime, 0)
+
+    def test_stream(self):
+        """--stream, alone and with a pool, writes the tables of the normal path."""
+        for Options in [['--stream'], ['--stream', '-j', '2']]:
+            self.Run(['-e', 'kJ']+Options, [os.path.join(Examples,'h2o-hoh.log'),
+                                            os.path.join(Examples,'h4o2.log')])
+            self.Compare('energies.txt', os.path.join(Examples,'energies.txt'))
+
+            self.Run(Options, [os.path.join(Tests,'data','ff2.log.gz')])
+            for Name in ['energies', 'properties', 'troperties']:
+                self.Compare(Name+'.txt', os.path.join(Golden,'ff-txt',Name+'.txt'))
+
+    def test_stream_mixed(self):
+        """With logs of several run types --stream writes the tables comparing them of the normal path."""
+        Data = os.path.join(Tests,'data')
+        for Names in [['mb3.log.gz', 'ff2.log.gz', 'ff2mp2.log.gz'],
+                      ['ff2mp2.log.gz', 'ff2.log.gz', 'mb3.log.gz']]:
+            Logs    = [os.path.join(Data,Name) for Name in Names]
+            Written = {}
+            for Options in [[], ['--stream'], ['--stream', '-j', '2']]:
+                for Name in ['properties.txt', 'troperties.txt']:
+                    if os.path.exists(os.path.join(self.Dir,Name)):
+                        os.remove(os.path.join(self.Dir,Name))
+                self.Run(Options, Logs)
+                Written[tuple(Options)] = [self.Summary('energies.txt')] + \
+                                          [self.Summary(Name) for Name in ['properties.txt', 'troperties.txt']
+                                           if os.path.exists(os.path.join(self.Dir,Name))]
+
+            # the last log sets the run type: the fields or the systems
+            self.assertIn('selected fields' if Names[-1] == 'ff2mp2.log.gz' else 'selected systems',
+                          Written[()][0])
+            for Options in Written:
+                self.assertEqual(Written[Options], Written[()], Options)
+
+    def Summary(self,Name):
+        """Tables of a file comparing the logs, leaving out those of single logs in energies.txt."""
+        with open(os.path.join(self.Dir,Name)) as File:
+            Text = File.read()
+        if Name.startswith('energies'):
+            Starts = [Text.find(Comment) for Comment in ['# Subsystem No', '# Many-body']]
+            Text   = Text[min([Start for Start in Starts if Start >= 0] or [len(Text)]):]
+        return Text
+
+    def test_expansion(self):
+        """The n-body terms rebuilt with -m add up to the terms of the whole trimer."""
+        self.Run(['-m', '-e', 'kcal'], [os.path.join(Tests,'data','mb3.log.gz')])
+
+        Energies  = self.Rows('energies.txt')
+        Expansion = self.Rows('expansion.txt')
+
+        # subsystems 4-6 are the dimers and 7 the trimer
+        Dimers = [sum(Values) for Values in zip(*[Energies['4'], Energies['5'], Energies['6']])]
+        for Rebuilt, Expected in zip(Expansion['2-body terms'], Dimers):
+            self.assertAlmostEqual(Rebuilt, Expected, delta=2e-3)
+        for Rebuilt, Expected in zip(Expansion['Sum of the n-body terms'], Energies['7']):
+            self.assertAlmostEqual(Rebuilt, Expected, delta=1e-3)
+        for Ratio, Three, Two in zip(Expansion['Cooperativity, 3-body over 2-body terms'],
+                                     Expansion['3-body terms'], Expansion['2-body terms']):
+            self.assertAlmostEqual(Ratio, Three/Two, delta=1e-3*abs(Three/Two)+1e-3)
+
+    def test_projection(self):
+        """Only the sections, terms and subsystems kept by the projection are written."""
+        Logs = [os.path.join(Examples,'h2o-hoh.log'), os.path.join(Examples,'h4o2.log')]
+        self.Run(['-e', 'kJ'], Logs)
+        Full = self.Rows('energies.txt')
+
+        self.Run(['-e', 'kJ', '--terms=DE(HF)', '--terms=DE(MP2)', '--systems=complex'], Logs)
+        Kept = self.Rows('energies.txt')
+
+        # DE(HF) and DE(MP2) are the 14th and the last of the terms
+        for Title in ['h2o-hoh', 'h4o2']:
+            self.assertEqual(Kept[Title], [Full[Title][13], Full[Title][-1]])
+
+        # the fields and properties of a finite field log are not read
+        self.Run(['--sections=sub'], [os.path.join(Tests,'data','ff2.log.gz')])
+        with open(os.path.join(self.Dir,'energies.txt')) as File:
+            self.assertNotIn('selected fields', File.read())
+        self.assertFalse(os.path.exists(os.path.join(self.Dir,'properties.txt')))
+
+    def test_projection_many_body(self):
+        """--terms keeps the many-body terms of each order of the term."""
+        Log = os.path.join(Tests,'data','mb3.log.gz')
+        self.Run([], [Log])
+        Full = self.Rows('energies.txt')['Many-body energy terms for selected systems']
+
+        self.Run(['--terms=DE(HF)'], [Log])
+        self.Compare('energies.txt', os.path.join(Golden,'mb-terms','energies.txt'))
+
+        # DE(HF) 2-BODY and 3-BODY go first
+        Kept = self.Rows('energies.txt')['Many-body energy terms for selected systems']
+        self.assertEqual(Kept, Full[:2])
+
+    def Rows(self,Name):
+        """Values of the rows of a txt table keyed by their first cell, or by the comment for a single row."""
+        Rows    = {}
+        Comment = None
+        with open(os.path.join(self.Dir,Name)) as File:
+            for line in File:
+                if line.startswith('# '):
+                    Comment = line[2:].strip()
+                elif line.startswith('"') and not line.startswith('"#'):
+                    Cells = line.split(';')
+                    Key   = Cells[0].strip('" ')
+                    if Key == 'mb3':
+                        Key = Comment
+                    Rows[Key] = [float(Cell) for Cell in Cells[1:-1]]
+        return Rows
+
+    def test_finite_field_txt(self):
+        self.FiniteField('txt')
+
+    def test_mixed_levels(self):
+        """Terms of the MP2 log which the HF log lacks are written as '-' in the property tables."""
+        self.Run([], [os.path.join(Tests,'data','ff2.log.gz'), os.path.join(Tests,'data','ff2mp2.log.gz')])
+        for Name in ['energies', 'properties', 'troperties']:
+            self.Compare(Name+'.txt', os.path.join(Golden,'ff-mixed',Name+'.txt'))
+
+        for Name in ['properties', 'troperties']:
+            with open(os.path.join(self.Dir,Name+'.txt')) as File:
+                Text = File.read()
+            self.assertNotIn('nan', Text)
+            self.assertIn('"         -"', Text)
+
+    def test_derivatives(self):
+        """Finite field derivatives of the FFEDS log with -f."""
+        self.Run(['-f'], [os.path.join(Tests,'data','ff2.log.gz')])
+        self.Compare('derivatives.txt', os.path.join(Golden,'ff-txt','derivatives.txt'))
+
+    def test_property_check(self):
+        """An invariant printed in the log which its tensor does not give is reported."""
+        Log = os.path.join(Tests,'data','ff2.log.gz')
+        self.Run([], [Log])
+        self.assertFalse(os.path.exists(os.path.join(self.Dir,'property-check.txt')))
+
+        # <A> of the HF polarizability of the first monomer, 0.921001 in the log
+        with gzip.open(Log,'rt') as File:
+            Text = File.read().replace(' <A>     0.921001\n', ' <A>     1.921001\n', 1)
+        with open(os.path.join(self.Dir,'ff2.log'),'w') as File:
+            File.write(Text)
+        self.Geds([],['ff2.log'])
+
+        with open(os.path.join(self.Dir,'property-check.txt')) as File:
+            Flagged = [line.split() for line in File if not line.startswith('#')]
+        self.assertEqual(len(Flagged), 1)
+        self.assertEqual(Flagged[0][-3:], ['<A>', '1.92100100', '0.92100133'])
+
+    def test_finite_field_csv(self):
+        self.FiniteField('csv')
+
+    def test_finite_field_tex(self):
+        self.FiniteField('tex')
+
+if __name__ == "__main__": unittest.main()
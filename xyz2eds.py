@@ -38,7 +38,6 @@ __version__ = list(filter(str.isdigit, "$Revision$"))
 import os, sys, getopt, re
 
 from string import Template
-from numpy import *
 
 # Regular expressions
 reflags = re.DOTALL
@@ -49,7 +48,8 @@ reflags = re.DOTALL
 def Usage():
     """Print usage information and exit."""
     print(__doc__)
-    print("Machine epsilon is: ",finfo(float64).eps,"for float64 type\n")
+    # the same as numpy.finfo(numpy.float64).eps, numpy is not needed here
+    print("Machine epsilon is: ",sys.float_info.epsilon,"for float64 type\n")
 
     sys.exit()
 